@@ -1,3 +1,4 @@
+import math
 import numpy as np
 import pandas as pd
 from scipy.stats import linregress
@@ -154,9 +155,10 @@ class Analysis:
             return 0.0
         return np.mean(cvar_returns)
 
-    def print_report(self):
+    def print_report(self, bootstrap_paths=0):
         """
-        Prints a summary of the performance metrics.
+        Prints a summary of the performance metrics. With `bootstrap_paths`, also prints
+        95% bootstrap confidence intervals from that many resampled paths.
         """
         print("\n--- Performance Analysis ---")
         print(f"Total Return: {self.get_total_return():.2%}")
@@ -172,3 +174,311 @@ class Analysis:
             alpha, beta = self.get_alpha_beta()
             print(f"Alpha: {alpha:.2f}")
             print(f"Beta: {beta:.2f}")
+
+        if bootstrap_paths and len(self.returns):
+            intervals = self.get_confidence_intervals(num_paths=bootstrap_paths)
+            print(f"\n--- 95% Bootstrap Confidence Intervals ({bootstrap_paths} paths) ---")
+            print(f"CAGR: {intervals['cagr'][0]:.2%} to {intervals['cagr'][1]:.2%}")
+            print(f"Sharpe Ratio: {intervals['sharpe_ratio'][0]:.2f} to {intervals['sharpe_ratio'][1]:.2f}")
+            print(f"Sortino Ratio: {intervals['sortino_ratio'][0]:.2f} to {intervals['sortino_ratio'][1]:.2f}")
+            print(f"Maximum Drawdown: {intervals['max_drawdown'][0]:.2%} to {intervals['max_drawdown'][1]:.2%}")
+            print(f"Conditional VaR (95%): {intervals['cvar_95'][0]:.2%} to {intervals['cvar_95'][1]:.2%}")
+
+    def get_metrics(self, periods_per_year=252):
+        """
+        Returns the performance metrics as a dictionary, e.g. for one row of a results table.
+        """
+        metrics = {
+            'total_return': self.get_total_return(),
+            'cagr': self.get_cagr(periods_per_year),
+            'sharpe_ratio': self.get_sharpe_ratio(periods_per_year),
+            'sortino_ratio': self.get_sortino_ratio(periods_per_year),
+            'max_drawdown': self.get_max_drawdown(),
+            'calmar_ratio': self.get_calmar_ratio(periods_per_year),
+            'var_95': self.get_var(0.95),
+            'cvar_95': self.get_cvar(0.95),
+        }
+        if self.benchmark_history is not None:
+            metrics['alpha'], metrics['beta'] = self.get_alpha_beta(periods_per_year)
+        return metrics
+
+    def bootstrap_returns(self, num_paths=10_000, mean_block_length=None, seed=None):
+        """
+        Resamples the returns with the stationary block bootstrap (Politis & Romano) into a
+        (num_paths x len(returns)) array, one resampled path per row. Each path is made of
+        blocks of consecutive returns that start at uniformly random positions, wrap around
+        the end of the series, and have geometric lengths with mean `mean_block_length`
+        (default: the cube root of the series length), so short-range dependence such as
+        volatility clustering survives the resampling.
+        """
+        n = len(self.returns)
+        if n == 0:
+            return np.empty((num_paths, 0))
+        if mean_block_length is None:
+            mean_block_length = max(1.0, n ** (1 / 3))
+        rng = np.random.default_rng(seed)
+        total = num_paths * n
+        p = 1 / mean_block_length
+
+        # Block boundaries for all paths laid end to end: geometric lengths, plus a new block
+        # at the start of every path
+        ends = np.cumsum(rng.geometric(p, size=int(total * p * 1.1) + 64))
+        while ends[-1] < total:
+            ends = np.concatenate([ends, ends[-1] + np.cumsum(rng.geometric(p, size=int(total * p * 0.1) + 64))])
+        new_block = np.zeros(total, dtype=bool)
+        new_block[ends[ends < total]] = True
+        new_block[::n] = True
+        block_starts = np.flatnonzero(new_block)
+        block_lengths = np.diff(block_starts, append=total)
+
+        # The index advances by one inside a block and jumps to the next block's random start
+        # at a boundary, so one cumulative sum gives every index (unwrapped: start + offset)
+        starts = rng.integers(0, n, size=len(block_starts))
+        steps = np.ones(total, dtype=np.int64)
+        steps[0] = starts[0]
+        steps[block_starts[1:]] = starts[1:] - starts[:-1] - block_lengths[:-1] + 1
+        indices = np.cumsum(steps, out=steps).reshape(num_paths, n)
+        # Blocks wrap around: index into the returns repeated past the end instead of taking a modulo
+        wrapped = np.resize(self.returns, n + int(block_lengths.max()))
+        return wrapped[indices]
+
+    def bootstrap_metrics(self, num_paths=10_000, mean_block_length=None, seed=None, periods_per_year=252,
+                          confidence_level=0.95, chunk_size=1000):
+        """
+        Distributions of Sharpe, Sortino, CAGR, maximum drawdown and CVaR over bootstrap
+        paths (see `bootstrap_returns`), as {metric: array with one value per path}. Each
+        metric is defined as in the point-estimate methods and is computed with array
+        operations along the time axis for `chunk_size` paths at a time, which bounds the
+        temporaries without a Python loop per path.
+        """
+        paths = self.bootstrap_returns(num_paths, mean_block_length, seed)
+        n = paths.shape[1]
+        cvar_name = f'cvar_{round(confidence_level * 100)}'
+        metrics = {name: np.zeros(num_paths) for name in ('sharpe_ratio', 'sortino_ratio', 'cagr', 'max_drawdown', cvar_name)}
+        if n == 0:
+            return metrics
+        target = self.risk_free_rate / periods_per_year
+        var_index = int(np.floor((1 - confidence_level) * n))
+        # Equity relative to the starting value, which counts as the first peak
+        equity = np.empty((min(chunk_size, num_paths), n + 1))
+        equity[:, 0] = 1.0
+        scratch = np.empty_like(equity)
+
+        for first in range(0, num_paths, chunk_size):
+            returns = paths[first:first + chunk_size]
+            rows = slice(first, first + len(returns))
+            chunk_equity, chunk_scratch = equity[:len(returns)], scratch[:len(returns)]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                mean_excess = returns.mean(axis=1) - target
+                excess = np.subtract(returns, target, out=chunk_scratch[:, 1:])
+                std = np.sqrt(np.maximum(np.einsum('ij,ij->i', excess, excess) / n - mean_excess ** 2, 0.0))
+                metrics['sharpe_ratio'][rows] = mean_excess / std * np.sqrt(periods_per_year)
+                downside = np.minimum(excess, 0.0, out=excess)
+                downside_deviation = np.sqrt(np.einsum('ij,ij->i', downside, downside) / n)
+                metrics['sortino_ratio'][rows] = np.where(downside_deviation == 0, np.inf,
+                                                          mean_excess / downside_deviation * np.sqrt(periods_per_year))
+
+            np.add(returns, 1.0, out=chunk_equity[:, 1:])
+            np.cumprod(chunk_equity, axis=1, out=chunk_equity)
+            metrics['cagr'][rows] = chunk_equity[:, -1] ** (periods_per_year / n) - 1
+            peaks = np.maximum.accumulate(chunk_equity, axis=1, out=chunk_scratch)
+            metrics['max_drawdown'][rows] = np.divide(chunk_equity, peaks, out=peaks).min(axis=1) - 1
+            chunk_equity[:, 0] = 1.0
+
+            # Mean of the var_index + 1 worst returns, as in get_cvar
+            metrics[cvar_name][rows] = np.partition(returns, var_index, axis=1)[:, :var_index + 1].mean(axis=1)
+        return metrics
+
+    def get_confidence_intervals(self, level=0.95, **bootstrap_params):
+        """
+        Two-sided percentile bootstrap intervals, {metric: (low, high)}, for the metrics of
+        `bootstrap_metrics` (which `bootstrap_params` are passed to). Paths where a ratio
+        is undefined (a zero deviation) are left out of that ratio's interval.
+        """
+        tail = (1 - level) / 2 * 100
+        intervals = {}
+        for name, values in self.bootstrap_metrics(**bootstrap_params).items():
+            values = values[np.isfinite(values)]
+            intervals[name] = tuple(np.percentile(values, [tail, 100 - tail])) if len(values) else (np.nan, np.nan)
+        return intervals
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch with relative accuracy: values are counted in logarithmic
+    buckets, so memory and query cost depend on the range of values, not on how many were
+    added. Also keeps each bucket's sum, so tail means (for CVaR) come out of the same pass.
+    """
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.count = 0
+        self._negative = {} # {bucket: [count, sum]} for values <= -min_value
+        self._positive = {} # {bucket: [count, sum]} for values >= min_value
+        self._zero = [0, 0.0]
+
+    def add(self, value):
+        self.count += 1
+        if value >= self.min_value:
+            bucket = self._positive.setdefault(math.ceil(math.log(value) / self._log_gamma), [0, 0.0])
+        elif value <= -self.min_value:
+            bucket = self._negative.setdefault(math.ceil(math.log(-value) / self._log_gamma), [0, 0.0])
+        else:
+            bucket = self._zero
+        bucket[0] += 1
+        bucket[1] += value
+
+    def _ascending(self):
+        # Most negative values first: large negative-side keys are the largest magnitudes
+        for key in sorted(self._negative, reverse=True):
+            yield self._negative[key]
+        if self._zero[0]:
+            yield self._zero
+        for key in sorted(self._positive):
+            yield self._positive[key]
+
+    def value_at_rank(self, rank):
+        """Approximate value of the `rank`-th smallest element (0-based)."""
+        seen = 0
+        for count, total in self._ascending():
+            seen += count
+            if seen > rank:
+                return total / count
+        return float('nan')
+
+    def mean_below_rank(self, rank):
+        """Approximate mean of the `rank` + 1 smallest elements."""
+        needed = rank + 1
+        seen, tail_sum = 0, 0.0
+        for count, total in self._ascending():
+            take = min(count, needed - seen)
+            tail_sum += total * take / count
+            seen += take
+            if seen >= needed:
+                return tail_sum / seen
+        return tail_sum / seen if seen else float('nan')
+
+class OnlineAnalysis:
+    """
+    Companion to Analysis that is updated one equity value at a time in constant time:
+    Welford mean/variance, running downside deviation, running peak and drawdown, an online
+    regression against the benchmark, and a quantile sketch for VaR/CVaR. Suited to live
+    displays where rebuilding Analysis from the whole history every frame would be O(n^2).
+    """
+    def __init__(self, risk_free_rate=0.0, periods_per_year=252, relative_accuracy=0.01):
+        self.risk_free_rate = risk_free_rate
+        self.periods_per_year = periods_per_year
+        self._target = risk_free_rate / periods_per_year
+        self.first_value = None
+        self.last_value = None
+        self.num_values = 0
+        # Returns: count, Welford mean and sum of squared deviations, downside sum of squares
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._downside_squares = 0.0
+        self._returns = QuantileSketch(relative_accuracy)
+        # Drawdown
+        self._peak = None
+        self._max_drawdown = 0.0
+        # Regression of portfolio returns on benchmark returns
+        self._last_benchmark = None
+        self._pairs = 0
+        self._benchmark_mean = 0.0
+        self._paired_mean = 0.0
+        self._benchmark_m2 = 0.0
+        self._co_moment = 0.0
+
+    def update(self, value, benchmark_value=None):
+        """Adds the next portfolio value and, optionally, the benchmark value for the same tick."""
+        previous = self.last_value
+        self.num_values += 1
+        if self.first_value is None:
+            self.first_value = value
+        self.last_value = value
+
+        if self._peak is None or value > self._peak:
+            self._peak = value
+        drawdown = (value - self._peak) / self._peak
+        if drawdown < self._max_drawdown:
+            self._max_drawdown = drawdown
+
+        portfolio_return = None
+        if previous is not None:
+            portfolio_return = (value - previous) / previous
+            self._count += 1
+            delta = portfolio_return - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (portfolio_return - self._mean)
+            if portfolio_return < self._target:
+                self._downside_squares += (portfolio_return - self._target) ** 2
+            self._returns.add(portfolio_return)
+
+        if benchmark_value is not None:
+            if portfolio_return is not None and self._last_benchmark is not None:
+                self._add_pair((benchmark_value - self._last_benchmark) / self._last_benchmark, portfolio_return)
+            self._last_benchmark = benchmark_value
+        return self
+
+    def _add_pair(self, benchmark_return, portfolio_return):
+        self._pairs += 1
+        delta_benchmark = benchmark_return - self._benchmark_mean
+        self._benchmark_mean += delta_benchmark / self._pairs
+        self._paired_mean += (portfolio_return - self._paired_mean) / self._pairs
+        self._benchmark_m2 += delta_benchmark * (benchmark_return - self._benchmark_mean)
+        self._co_moment += delta_benchmark * (portfolio_return - self._paired_mean)
+
+    def get_total_return(self):
+        if self.num_values < 2:
+            return 0.0
+        return (self.last_value / self.first_value) - 1
+
+    def get_cagr(self):
+        if self.num_values < 2:
+            return 0.0
+        return (1 + self.get_total_return())**(self.periods_per_year / (self.num_values - 1)) - 1
+
+    def get_sharpe_ratio(self):
+        if self._count == 0:
+            return 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(np.float64(self._m2) / self._count)
+            return (self._mean - self._target) / std * np.sqrt(self.periods_per_year)
+
+    def get_sortino_ratio(self):
+        if self._count == 0:
+            return 0.0
+        downside_deviation = math.sqrt(self._downside_squares / self._count)
+        if downside_deviation == 0:
+            return np.inf
+        return (self._mean - self._target) / downside_deviation * np.sqrt(self.periods_per_year)
+
+    def get_max_drawdown(self):
+        if self.num_values < 2:
+            return 0.0
+        return self._max_drawdown
+
+    def get_calmar_ratio(self):
+        max_drawdown = self.get_max_drawdown()
+        if max_drawdown == 0:
+            return np.inf
+        return self.get_cagr() / abs(max_drawdown)
+
+    def get_alpha_beta(self):
+        if self._pairs < 2 or self._benchmark_m2 == 0:
+            return 0.0, 0.0
+        # The risk-free shift cancels in beta; alpha is the intercept on excess returns
+        beta = self._co_moment / self._benchmark_m2
+        alpha_per_period = (self._paired_mean - self._target) - beta * (self._benchmark_mean - self._target)
+        return alpha_per_period * self.periods_per_year, beta
+
+    def get_var(self, confidence_level=0.95):
+        if self._count == 0:
+            return 0.0
+        return self._returns.value_at_rank(int(np.floor((1 - confidence_level) * self._count)))
+
+    def get_cvar(self, confidence_level=0.95):
+        if self._count == 0:
+            return 0.0
+        return self._returns.mean_below_rank(int(np.floor((1 - confidence_level) * self._count)))
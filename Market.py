@@ -1,74 +1,155 @@
 
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from data_loader import load_stock_data
+import config
+from data_sources import FIELDS, create_data_source
+
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+CLOSE = FIELD_INDEX['Close']
+
+class Bar:
+    """
+    One ticker's OHLCV values for a tick. Indexable by field name (bar['Close']) like the
+    pandas row it replaces, without building a Series per ticker per tick.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, field):
+        return self.values[FIELD_INDEX[field]]
+
+    def __contains__(self, field):
+        return field in FIELD_INDEX
+
+    def __repr__(self):
+        return f"Bar({dict(zip(FIELDS, self.values))})"
 
 class Market:
-    def __init__(self, tickers, interval, start_date=None, end_date=None, benchmark_ticker='^NSEI'):
+    streaming = False # The whole history is in memory (see StreamingMarket)
+
+    def __init__(self, tickers, interval, start_date=None, end_date=None, benchmark_ticker='^NSEI', data_source=None):
+        """
+        Loads `tickers` from `data_source` (a data_sources.DataSource; by default the one
+        named by config.DATA_SOURCE) into one (ticker x time x field) array. The benchmark is
+        fetched on a background thread meanwhile. Tickers that failed to load are listed in
+        `missing_tickers`.
+        """
         if not isinstance(tickers, list):
             tickers = [tickers] # Ensure tickers is always a list
         self.tickers = tickers
         self.interval = interval
         self.start_date = start_date
         self.end_date = end_date
-        self.data = self._load_all_data()
-        if self.data.empty:
+        self.data_source = data_source if data_source is not None else create_data_source()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='benchmark-load') as pool:
+            benchmark_data = pool.submit(self.load_benchmark_data, benchmark_ticker, interval, start_date, end_date)
+            symbols, dates, values = self.data_source.load_arrays(tickers, interval, start_date, end_date)
+        if not symbols or not len(dates):
             raise ValueError(f"Could not load data for {tickers} with interval {interval}")
+        self._data = None
+        self._set_arrays(symbols, dates, values)
+        self.missing_tickers = [ticker for ticker in tickers if ticker not in symbols]
         self.current_tick = 0
-        self.benchmark_data = self.load_benchmark_data(benchmark_ticker, interval, start_date, end_date)
-
-    def _load_all_data(self):
-        all_data = {}
-        for ticker in self.tickers:
-            stock_data = load_stock_data(ticker, self.interval, self.start_date, self.end_date)
-            if not stock_data.empty:
-                all_data[ticker] = stock_data
-            else:
-                print(f"Warning: No data loaded for {ticker}.")
-        
-        if not all_data:
-            return pd.DataFrame()
-
-        # Merge all dataframes on their index (Date)
-        # Use outer join to keep all dates, fill missing values if necessary
-        merged_data = pd.concat(all_data.values(), axis=1, keys=all_data.keys())
-        merged_data.index.name = 'Date'
-        return merged_data
+        self.benchmark_data = benchmark_data.result()
+
+    @classmethod
+    def from_arrays(cls, symbols, dates, values, interval, benchmark_data=None, start_date=None, end_date=None):
+        """
+        Builds a Market around already loaded arrays without copying them (e.g. a view onto
+        shared memory). `values` is the (ticker x time x field) array for `symbols`, and
+        `benchmark_data` the benchmark 'Close' Series, if any.
+        """
+        market = cls.__new__(cls)
+        market.tickers = list(symbols)
+        market.interval = interval
+        market.start_date = start_date
+        market.end_date = end_date
+        market.data_source = None
+        market.missing_tickers = []
+        market._data = None
+        market._set_arrays(list(symbols), pd.DatetimeIndex(dates, name='Date'), values)
+        market.current_tick = 0
+        market.benchmark_data = benchmark_data
+        return market
+
+    @property
+    def data(self):
+        """
+        The merged DataFrame with (ticker, field) columns, built from the arrays on first access.
+        """
+        if self._data is None:
+            frames = [pd.DataFrame(self.values[i], index=self.dates, columns=list(FIELDS)) for i in range(len(self.symbols))]
+            self._data = pd.concat(frames, axis=1, keys=self.symbols)
+            self._data.index.name = 'Date'
+        return self._data
+
+    def _set_arrays(self, symbols, dates, values):
+        self.symbols = symbols
+        self.dates = dates
+        self.values = values
+        self.close = values[:, :, CLOSE]
+        self.num_ticks = len(dates)
 
     def get_next_tick(self):
         """
         Returns the next available price data for all tickers (as a tuple: date, dictionary of rows).
         Returns None, None if there is no more data.
         """
-        if self.current_tick < len(self.data):
-            date = self.data.index[self.current_tick]
-            # Extract row for each ticker
-            current_rows = {ticker: self.data[ticker].loc[date] for ticker in self.tickers if ticker in self.data.columns.levels[0]}
-            self.current_tick += 1
-            return date, current_rows
-        return None, None
+        date = self.advance_tick()
+        if date is None:
+            return None, None
+        return date, self.get_current_rows()
+
+    def advance_tick(self):
+        """
+        Moves to the next tick and returns its date (None at the end of the data) without
+        building the per-ticker rows; batched strategies read get_current_price_array instead.
+        """
+        tick = self.current_tick
+        if tick < self.num_ticks:
+            self.current_tick = tick + 1
+            return self.dates[tick]
+        return None
+
+    def get_current_rows(self):
+        """
+        Returns the current tick's Bar for every ticker as a dictionary {symbol: Bar}.
+        """
+        if self.current_tick > 0 and self.current_tick <= self.num_ticks:
+            # One C-level conversion for all tickers, then a light Bar per ticker
+            return dict(zip(self.symbols, map(Bar, self.values[:, self.current_tick - 1, :].tolist())))
+        return {}
 
     def get_current_prices(self):
         """
         Returns the 'Close' prices of the current tick for all tickers as a dictionary {symbol: price}.
         """
-        if self.current_tick > 0 and self.current_tick <= len(self.data):
-            current_prices = {}
-            for ticker in self.tickers:
-                if ticker in self.data.columns.levels[0]:
-                    current_prices[ticker] = self.data[ticker].iloc[self.current_tick - 1]['Close']
-            return current_prices
+        if self.current_tick > 0 and self.current_tick <= self.num_ticks:
+            return dict(zip(self.symbols, self.close[:, self.current_tick - 1].tolist()))
         return {}
 
+    def get_current_price_array(self):
+        """
+        Returns the 'Close' prices of the current tick as an array aligned with `self.symbols`.
+        """
+        if self.current_tick > 0 and self.current_tick <= self.num_ticks:
+            return self.close[:, self.current_tick - 1]
+        return None
+
     def load_benchmark_data(self, ticker, interval, start_date, end_date):
         """
         Loads benchmark data.
         """
         print(f"Loading benchmark data for {ticker}...")
-        benchmark_data = load_stock_data(ticker, interval, start_date, end_date)
-        if benchmark_data.empty:
-            print(f"Warning: Could not load benchmark data for {ticker}.")
+        frames, failures = self.data_source.load_frames([ticker], interval, start_date, end_date)
+        if ticker not in frames:
+            print(f"Warning: Could not load benchmark data for {ticker} ({failures[ticker]}).")
             return None
-        return benchmark_data['Close']
+        return frames[ticker]['Close']
 
     def get_benchmark_price(self, date):
         """
@@ -78,3 +159,171 @@ class Market:
             return self.benchmark_data.loc[date]
         return None
 
+    def view(self):
+        """A Market over the same arrays (not copied) with a cursor of its own, at the first tick."""
+        market = copy.copy(self)
+        market.current_tick = 0
+        return market
+
+
+class StreamingMarket(Market):
+    """
+    A Market that pulls its bars from the data source in chunks of `chunk_size` ticks
+    (DataSource.iter_chunks) while the simulation runs. The next chunk is fetched on a
+    background thread while the current one is stepped through, so at most two chunks of
+    bars are in memory however long the date range is.
+
+    Ticks, `current_tick`, prices and bars behave as in Market, so strategies run
+    unchanged. `values`, `close` and `chunk_dates` hold only the current chunk, whose first
+    tick is `chunk_start`. The dates of past chunks are kept (8 bytes a tick) and joined
+    into `dates` only when something reads the whole history. Consumers of the whole
+    history (the vectorized engine, rewinding `current_tick`) need a Market. Callables in
+    `chunk_listeners` get each new chunk's dates (Simulator aligns the benchmark with them).
+    Memory is bounded only if the source generates or reads chunks incrementally
+    (synthetic, store); the default DataSource.iter_chunks loads everything first.
+    """
+    streaming = True
+
+    def __init__(self, tickers, interval, start_date=None, end_date=None, benchmark_ticker='^NSEI', data_source=None,
+                 chunk_size=None):
+        if not isinstance(tickers, list):
+            tickers = [tickers]
+        self.tickers = tickers
+        self.interval = interval
+        self.start_date = start_date
+        self.end_date = end_date
+        self.data_source = data_source if data_source is not None else create_data_source()
+        self.chunk_size = chunk_size or config.STREAM_CHUNK_SIZE
+        self.chunk_listeners = []
+        self._data = None
+        self._chunks = self.data_source.iter_chunks(tickers, interval, start_date, end_date, chunk_size=self.chunk_size)
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='market-prefetch')
+        self._next_chunk = None
+
+        # The benchmark loads on the prefetch thread while the first chunk loads here
+        benchmark_data = self._prefetcher.submit(self.load_benchmark_data, benchmark_ticker, interval, start_date, end_date)
+        chunk = self._fetch()
+        if chunk is None or not chunk[0]:
+            self._prefetcher.shutdown(wait=True)
+            raise ValueError(f"Could not load data for {tickers} with interval {interval}")
+        self.symbols = list(chunk[0])
+        self.missing_tickers = [ticker for ticker in tickers if ticker not in self.symbols]
+        self._date_chunks = [] # chunk_dates of every chunk so far
+        self._dates = None
+        self.num_ticks = 0 # Ticks loaded so far
+        self.benchmark_data = benchmark_data.result()
+        self._load_chunk(chunk)
+        self.current_tick = 0
+
+    def _fetch(self):
+        # The next non-empty chunk, or None at the end. Runs on the prefetch thread, one call at a time.
+        for chunk in self._chunks:
+            if len(chunk[1]):
+                return chunk
+        return None
+
+    def _load_chunk(self, chunk):
+        symbols, dates, values = chunk
+        if list(symbols) != self.symbols:
+            raise ValueError("Every chunk must have the same symbols")
+        self.chunk_start = self.num_ticks
+        self.chunk_dates = pd.DatetimeIndex(dates, name='Date')
+        self.values = values
+        self.close = values[:, :, CLOSE]
+        self._chunk_length = len(dates)
+        self.num_ticks += len(dates)
+        self._date_chunks.append(self.chunk_dates)
+        self._dates = None
+        self._data = None
+        # Start fetching the next chunk while this one is stepped through
+        self._next_chunk = self._prefetcher.submit(self._fetch)
+        for listener in self.chunk_listeners:
+            listener(self.chunk_dates)
+
+    def _advance(self):
+        if self._next_chunk is None:
+            return False
+        chunk = self._next_chunk.result()
+        if chunk is None:
+            self._next_chunk = None
+            self._prefetcher.shutdown(wait=False)
+            return False
+        self._load_chunk(chunk)
+        return True
+
+    @property
+    def dates(self):
+        """Dates of every tick loaded so far, joined from the chunks' dates when first read after a chunk."""
+        if self._dates is None:
+            self._dates = self._date_chunks[0].append(self._date_chunks[1:])
+        return self._dates
+
+    @property
+    def data(self):
+        """The current chunk as a merged DataFrame (the whole history is never in memory)."""
+        if self._data is None:
+            frames = [pd.DataFrame(self.values[i], index=self.chunk_dates, columns=list(FIELDS)) for i in range(len(self.symbols))]
+            self._data = pd.concat(frames, axis=1, keys=self.symbols)
+            self._data.index.name = 'Date'
+        return self._data
+
+    def advance_tick(self):
+        index = self.current_tick - self.chunk_start
+        if index >= self._chunk_length:
+            if not self._advance():
+                return None
+            index = 0
+        self.current_tick += 1
+        return self.chunk_dates[index]
+
+    def get_current_rows(self):
+        index = self.current_tick - 1 - self.chunk_start
+        if 0 <= index < self._chunk_length:
+            return dict(zip(self.symbols, map(Bar, self.values[:, index, :].tolist())))
+        return {}
+
+    def get_current_prices(self):
+        index = self.current_tick - 1 - self.chunk_start
+        if 0 <= index < self._chunk_length:
+            return dict(zip(self.symbols, self.close[:, index].tolist()))
+        return {}
+
+    def get_current_price_array(self):
+        index = self.current_tick - 1 - self.chunk_start
+        if 0 <= index < self._chunk_length:
+            return self.close[:, index]
+        return None
+
+    def view(self):
+        raise ValueError("A streaming market can't be shared; its bars are consumed as it runs")
+
+# --- In-process dataset registry ---
+
+_datasets = {} # {(tickers, interval, start, end, benchmark, data source): Market}
+_datasets_lock = threading.Lock()
+
+def load_market(tickers, interval, start_date=None, end_date=None, benchmark_ticker='^NSEI', data_source=None):
+    """
+    A Market from the in-process dataset registry. The first request for a set of tickers,
+    interval, date range, benchmark and data source loads it; later requests get a view of
+    the same arrays with a cursor of their own, so several Simulators (and strategy swaps)
+    share one load instead of fetching the data again. Markets stay registered (and in
+    memory) until clear_datasets(). A Market that loaded only in part (missing tickers or
+    no benchmark) is returned but not registered, so the next request downloads again.
+    """
+    if not isinstance(tickers, list):
+        tickers = [tickers]
+    key = (tuple(tickers), interval, start_date, end_date, benchmark_ticker,
+           data_source if data_source is not None else config.DATA_SOURCE)
+    with _datasets_lock:
+        market = _datasets.get(key)
+        if market is None:
+            market = Market(tickers, interval, start_date, end_date, benchmark_ticker=benchmark_ticker, data_source=data_source)
+            if not market.missing_tickers and market.benchmark_data is not None:
+                _datasets[key] = market
+    return market.view()
+
+def clear_datasets():
+    """Empties the dataset registry, so the next load_market fetches the data again."""
+    with _datasets_lock:
+        _datasets.clear()
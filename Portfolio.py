@@ -1,9 +1,14 @@
 
 from enum import Enum
+import numpy as np
+from events import OrderEvent, FillEvent
+from trade_ledger import TradeLedger, BUY, SELL
+from order_book import OrderBook
 
 class OrderType(Enum):
     MARKET = 1
     LIMIT = 2
+    STOP = 3
 
 class OrderStatus(Enum):
     PENDING = 1
@@ -11,23 +16,18 @@ class OrderStatus(Enum):
     CANCELLED = 3
 
 class Order:
+    __slots__ = ('order_type', 'symbol', 'quantity', 'price', 'date', 'status', 'fill_price', 'fill_quantity', 'commission')
+
     def __init__(self, order_type, symbol, quantity, price, date, status=OrderStatus.PENDING):
         self.order_type = order_type
         self.symbol = symbol
         self.quantity = quantity
-        self.price = price  # For limit orders, this is the limit price; for market, it's the requested price
+        self.price = price  # Limit price, stop price, or for market orders the requested price
         self.date = date
         self.status = status
         self.fill_price = None
         self.fill_quantity = 0
-
-class FillEvent:
-    def __init__(self, order, fill_price, fill_quantity, commission, date):
-        self.order = order
-        self.fill_price = fill_price
-        self.fill_quantity = fill_quantity
-        self.commission = commission
-        self.date = date
+        self.commission = 0.0
 
 class Portfolio:
     def __init__(self, initial_cash=10000, commission=0.001, slippage=0.0005, stop_loss_percentage=None, events=None):
@@ -37,11 +37,53 @@ class Portfolio:
         self.slippage = slippage
         self.stop_loss_percentage = stop_loss_percentage
         self.positions = {}
-        self.trades = []
+        self.trades = TradeLedger()
         self.stop_loss_prices = {} # {symbol: stop_loss_price}
-        self.pending_orders = []
-        self.events = events # Event queue for communication
-        self.pending_orders = []
+        self.order_book = OrderBook() # Resting limit and stop orders
+        self.events = events # Event queue the on_* handlers put their follow-up events on
+        # Positions and stop-loss prices again as vectors indexed like the market's tickers
+        # (see bind_symbols); `positions` and `stop_loss_prices` stay the dict views of them
+        self.symbols = []
+        self.symbol_ids = {}
+        self.position_vector = np.zeros(0)
+        self.stop_vector = np.zeros(0) # NaN where there is no stop
+
+    def bind_symbols(self, symbols):
+        """Indexes the position and stop vectors like `symbols` (the market's ticker order)."""
+        self.symbols = list(symbols)
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.position_vector = np.zeros(len(self.symbols))
+        self.stop_vector = np.full(len(self.symbols), np.nan)
+        for symbol, quantity in self.positions.items():
+            self.position_vector[self._symbol_id(symbol)] = quantity
+        for symbol, stop_loss_price in self.stop_loss_prices.items():
+            self.stop_vector[self._symbol_id(symbol)] = stop_loss_price
+
+    def _symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            # Traded outside the bound tickers: give it a slot at the end
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            self.symbol_ids[symbol] = symbol_id
+            self.position_vector = np.append(self.position_vector, 0.0)
+            self.stop_vector = np.append(self.stop_vector, np.nan)
+        return symbol_id
+
+    def reset(self):
+        """Back to the initial cash with no positions, trades or resting orders."""
+        self.cash = self.initial_cash
+        self.positions = {}
+        self.stop_loss_prices = {}
+        self.trades.clear()
+        self.order_book.clear()
+        self.position_vector[:] = 0.0
+        self.stop_vector[:] = np.nan
+
+    @property
+    def pending_orders(self):
+        """The resting limit and stop orders, oldest first."""
+        return self.order_book.orders()
 
     def get_total_value(self, current_prices):
         """
@@ -58,6 +100,24 @@ class Portfolio:
                 print(f"Warning: Current price for {symbol} not available. Assuming 0 for total value calculation.")
         return self.cash + positions_value
 
+    def get_total_value_array(self, prices):
+        """
+        `get_total_value` for a price array aligned with the bound symbols (e.g.
+        Market.get_current_price_array): one dot product instead of a loop over positions.
+        """
+        num_prices = len(prices)
+        positions = self.position_vector[:num_prices]
+        positions_value = positions @ prices
+        if np.isnan(positions_value):
+            # NaN: a symbol that isn't held has no price yet (0 * NaN); only held ones count
+            held = positions != 0
+            positions_value = positions[held] @ prices[held]
+        if len(self.position_vector) > num_prices:
+            for symbol in self.symbols[num_prices:]:
+                if self.positions.get(symbol):
+                    print(f"Warning: Current price for {symbol} not available. Assuming 0 for total value calculation.")
+        return self.cash + positions_value
+
     def get_position_value(self, symbol, current_price):
         """
         Calculates the value of a specific position.
@@ -67,17 +127,38 @@ class Portfolio:
         return 0
 
     def place_order(self, order_type, symbol, quantity, price, date=None):
+        """
+        Market orders are filled immediately at `price`; returns the order, or False if it
+        could not be filled. Limit and stop orders rest in the order book until
+        `process_orders` sees their price crossed.
+        """
         order = Order(order_type, symbol, quantity, price, date)
-        self.pending_orders.append(order)
+        if order_type == OrderType.MARKET:
+            return order if self._execute_trade(order, price, date) else False
+        self._rest(order)
         return order
 
+    def _rest(self, order, signal=None):
+        # Buy limits and sell stops trigger when the price falls to `order.price`; sell limits
+        # and buy stops when it rises to it
+        buy = order.quantity > 0
+        self.order_book.add(order, buy if order.order_type == OrderType.LIMIT else not buy, signal)
+
+    def cancel_order(self, order):
+        """Cancels a resting order. Returns False if it was not resting (already filled or cancelled)."""
+        if not self.order_book.cancel(order):
+            return False
+        order.status = OrderStatus.CANCELLED
+        return True
+
     def _execute_trade(self, order, fill_price, date):
         # This is a helper method to encapsulate the actual trade execution logic
-        # It's called by process_orders and check_stop_loss
+        # It's called by place_order, on_order and process_orders
         symbol = order.symbol
         quantity = order.quantity
         
-        if order.order_type == OrderType.BUY:
+        # Sell orders carry a negative quantity (see `sell`)
+        if quantity > 0:
             adjusted_price = fill_price * (1 + self.slippage)
             cost_before_commission = quantity * adjusted_price
             commission_amount = cost_before_commission * self.commission
@@ -86,31 +167,23 @@ class Portfolio:
             if self.cash >= total_cost:
                 self.cash -= total_cost
                 self.positions[symbol] = self.positions.get(symbol, 0) + quantity
-                self.trades.append({
-                    'type': 'buy',
-                    'symbol': symbol,
-                    'quantity': quantity,
-                    'price': fill_price, # Original price
-                    'adjusted_price': adjusted_price, # Price after slippage
-                    'cost_before_commission': cost_before_commission,
-                    'commission_amount': commission_amount,
-                    'total_cost': total_cost,
-                    'cash_after_trade': self.cash,
-                    'date': date
-                })
+                symbol_id = self._symbol_id(symbol)
+                self.position_vector[symbol_id] = self.positions[symbol]
+                self.trades.append(BUY, symbol, quantity, fill_price, adjusted_price, cost_before_commission,
+                                   commission_amount, total_cost, self.cash, date)
                 if self.stop_loss_percentage is not None:
-                    self.stop_loss_prices[symbol] = adjusted_price * (1 - self.stop_loss_percentage)
+                    self.stop_loss_prices[symbol] = self.stop_vector[symbol_id] = adjusted_price * (1 - self.stop_loss_percentage)
                 order.status = OrderStatus.FILLED
                 order.fill_price = adjusted_price
                 order.fill_quantity = quantity
-                if self.events:
-                    self.events.put(FillEvent(order, adjusted_price, quantity, commission_amount, date))
+                order.commission = commission_amount
                 return True
             else:
                 print(f"{date}: Not enough cash to buy {quantity} of {symbol} at {fill_price:.2f}")
                 return False
 
-        elif order.order_type == OrderType.SELL:
+        elif quantity < 0:
+            quantity = -quantity
             if self.positions.get(symbol, 0) >= quantity:
                 adjusted_price = fill_price * (1 - self.slippage)
                 proceeds_before_commission = quantity * adjusted_price
@@ -119,27 +192,19 @@ class Portfolio:
 
                 self.cash += total_proceeds
                 self.positions[symbol] -= quantity
+                symbol_id = self._symbol_id(symbol)
+                self.position_vector[symbol_id] = self.positions[symbol]
                 if self.positions[symbol] == 0:
                     del self.positions[symbol]
+                    self.stop_vector[symbol_id] = np.nan
                     if symbol in self.stop_loss_prices:
                         del self.stop_loss_prices[symbol]
-                self.trades.append({
-                    'type': 'sell',
-                    'symbol': symbol,
-                    'quantity': quantity,
-                    'price': fill_price, # Original price
-                    'adjusted_price': adjusted_price, # Price after slippage
-                    'proceeds_before_commission': proceeds_before_commission,
-                    'commission_amount': commission_amount,
-                    'total_proceeds': total_proceeds,
-                    'cash_after_trade': self.cash,
-                    'date': date
-                })
+                self.trades.append(SELL, symbol, quantity, fill_price, adjusted_price, proceeds_before_commission,
+                                   commission_amount, total_proceeds, self.cash, date)
                 order.status = OrderStatus.FILLED
                 order.fill_price = adjusted_price
                 order.fill_quantity = quantity
-                if self.events:
-                    self.events.put(FillEvent(order, adjusted_price, quantity, commission_amount, date))
+                order.commission = commission_amount
                 return True
             else:
                 print(f"{date}: Not enough shares of {symbol} to sell {quantity}")
@@ -147,32 +212,37 @@ class Portfolio:
         return False
 
     def process_orders(self, current_prices, date):
-        orders_to_remove = []
-        for order in self.pending_orders:
-            if order.status == OrderStatus.PENDING:
-                symbol = order.symbol
-                if symbol not in current_prices:
-                    continue # Cannot process if price not available
-
-                current_price = current_prices[symbol]
-
-                if order.order_type == OrderType.MARKET:
-                    # Market orders are always filled at current price
-                    if self._execute_trade(order, current_price, date):
-                        orders_to_remove.append(order)
-                elif order.order_type == OrderType.LIMIT:
-                    if order.quantity > 0: # Buy Limit
-                        if current_price <= order.price:
-                            if self._execute_trade(order, current_price, date):
-                                orders_to_remove.append(order)
-                    else: # Sell Limit (quantity < 0 for short selling, but here we assume quantity > 0 for simplicity)
-                        # For a sell limit, the current price must be >= the limit price
-                        if current_price >= order.price:
-                            if self._execute_trade(order, current_price, date):
-                                orders_to_remove.append(order)
-        
-        # Remove filled or cancelled orders
-        self.pending_orders = [order for order in self.pending_orders if order not in orders_to_remove]
+        """
+        Fills the resting orders whose price was crossed by `current_prices`, at the current
+        price: buy limits at or below their limit, sell limits at or above it, buy stops at or
+        above their stop and sell stops at or below it. Only the crossed orders are visited.
+        Orders that can't be filled (not enough cash or shares) stay resting. With an event
+        queue, a FillEvent is put for each fill. Returns the filled orders.
+        """
+        if not self.order_book:
+            return []
+        filled = self.order_book.match(current_prices, lambda order, price: self._execute_trade(order, price, date))
+        if self.events is not None:
+            for order, signal in filled:
+                self.events.put(FillEvent(order, order.fill_price, order.fill_quantity, order.commission, date, signal))
+        return [order for order, _ in filled]
+
+    def on_order(self, event):
+        """
+        OrderEvent handler: fills market orders at their price, putting a FillEvent on the
+        queue, and rests limit and stop orders in the order book.
+        """
+        order = event.order
+        if order.order_type != OrderType.MARKET:
+            self._rest(order, event.signal)
+        elif self._execute_trade(order, order.price, order.date):
+            self.events.put(FillEvent(order, order.fill_price, order.fill_quantity, order.commission, order.date, event.signal))
+
+    def on_stop_loss(self, event):
+        """StopLossTriggeredEvent handler: orders the sale of the whole position."""
+        print(f"{event.date}: STOP LOSS triggered for {event.symbol} at {event.price:.2f}")
+        order = Order(OrderType.MARKET, event.symbol, -self.positions[event.symbol], event.price, event.date)
+        self.events.put(OrderEvent(order))
 
     def buy(self, symbol, quantity, price, date=None, order_type=OrderType.MARKET):
         return self.place_order(order_type, symbol, quantity, price, date)
@@ -184,9 +254,29 @@ class Portfolio:
         """
         Checks if stop-loss for a given symbol has been triggered.
         """
-        if self.stop_loss_percentage is not None and symbol in self.positions and symbol in self.stop_loss_prices:
-            if current_price <= self.stop_loss_prices[symbol]:
-                print(f"{date}: STOP LOSS triggered for {symbol} at {current_price:.2f}")
-                self.sell(symbol, self.positions[symbol], current_price, date=date)
-                return True
+        if self.stop_loss_triggered(symbol, current_price):
+            print(f"{date}: STOP LOSS triggered for {symbol} at {current_price:.2f}")
+            self.sell(symbol, self.positions[symbol], current_price, date=date)
+            return True
         return False
+
+    def stop_loss_breaches(self, prices):
+        """
+        Symbols whose stop-loss `prices` (aligned with the bound symbols) are at or below,
+        from one vectorized comparison. In the order the positions were opened, which is the
+        order check_stop_loss over `positions` would find them.
+        """
+        if self.stop_loss_percentage is None:
+            return []
+        breached = np.flatnonzero(prices <= self.stop_vector[:len(prices)])
+        if len(breached) == 0:
+            return []
+        if len(breached) == 1:
+            return [self.symbols[breached[0]]]
+        breached = {self.symbols[i] for i in breached}
+        return [symbol for symbol in self.positions if symbol in breached]
+
+    def stop_loss_triggered(self, symbol, current_price):
+        """True if `current_price` is at or below the stop-loss of an open position."""
+        return (self.stop_loss_percentage is not None and symbol in self.positions and symbol in self.stop_loss_prices
+                and current_price <= self.stop_loss_prices[symbol])
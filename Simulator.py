@@ -1,75 +1,319 @@
-from Market import Market
-from Portfolio import Portfolio
-from Strategy import MovingAverageStrategy, BuyAndHoldStrategy
+import copy
+import io
+import pickle
+import numpy as np
+from Market import StreamingMarket, load_market
+from Portfolio import Portfolio, Order, OrderType
+from event_queue import EventQueue
+from profiling import StepProfiler
+from events import MarketTickEvent, SignalEvent, OrderEvent, FillEvent, StopLossTriggeredEvent
+from Strategy import create_strategy
+from vectorized import run_vectorized, compare_with_loop
 
-class Simulator:
-    def __init__(self, tickers=["SWIGGY.NS"], interval="1d", start_date=None, end_date=None, strategy_type="MovingAverageStrategy"):
-        # Configuration
-        initial_cash = 100000
+class _StatePickler(pickle.Pickler):
+    # Writes the simulator's shared objects (market, event queue, ...) as names instead of copies
+    def __init__(self, file, shared):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._names = {id(obj): name for name, obj in shared.items()}
+
+    def persistent_id(self, obj):
+        return self._names.get(id(obj))
+
+class _StateUnpickler(pickle.Unpickler):
+    # Resolves those names to the restoring simulator's objects
+    def __init__(self, file, shared):
+        super().__init__(file)
+        self._shared = shared
 
+    def persistent_load(self, name):
+        return self._shared[name]
+
+PORTFOLIO_SETTINGS = ('initial_cash', 'commission', 'slippage', 'stop_loss_percentage') # Changeable with Simulator.configure
+
+class Simulator:
+    def __init__(self, tickers=["SWIGGY.NS"], interval="1d", start_date=None, end_date=None, strategy_type="MovingAverageStrategy",
+                 strategy_params=None, initial_cash=100000, commission=0.001, slippage=0.0005, stop_loss_percentage=None,
+                 benchmark_ticker='^NSEI', market=None, data_source=None, stream_chunk_size=None):
+        """
+        Builds a simulation. Pass `market` to reuse already loaded data instead of loading
+        `tickers` (from `data_source`, see data_sources.py); loaded data is kept in the
+        dataset registry (Market.load_market), so Simulators over the same data share it.
+        `strategy_params` are keyword arguments for the strategy (e.g. short_window). With
+        `stream_chunk_size` the bars are streamed in chunks of that many ticks
+        (StreamingMarket) instead of loaded up front.
+        """
         # 1. Initialize components
-        self.portfolio = Portfolio(initial_cash)
+        self.portfolio = Portfolio(initial_cash, commission=commission, slippage=slippage, stop_loss_percentage=stop_loss_percentage)
         self.portfolio_history = []
         self.market = None
         self.benchmark_history = []
         self.strategy = None
-        self.update_market_and_strategy(tickers, interval, start_date, end_date, strategy_type)
+        self.events = None
+        self.profiler = None # A StepProfiler while profiling is on (see enable_profiling)
+        if market is not None:
+            self.market = market
+            self._align_benchmark()
+            self.portfolio.bind_symbols(market.symbols)
+            self.strategy = create_strategy(strategy_type, self.portfolio, market.tickers, **(strategy_params or {}))
+            self.strategy.bind_symbols(market.symbols)
+            self._register_handlers()
+        else:
+            self.update_market_and_strategy(tickers, interval, start_date, end_date, strategy_type, strategy_params, benchmark_ticker,
+                                            data_source, stream_chunk_size)
+
+    def update_market_and_strategy(self, tickers, interval, start_date, end_date, strategy_type, strategy_params=None, benchmark_ticker='^NSEI',
+                                   data_source=None, stream_chunk_size=None):
+        if stream_chunk_size:
+            self.market = StreamingMarket(tickers, interval, start_date, end_date, benchmark_ticker=benchmark_ticker,
+                                          data_source=data_source, chunk_size=stream_chunk_size)
+        else:
+            self.market = load_market(tickers, interval, start_date, end_date, benchmark_ticker=benchmark_ticker, data_source=data_source)
+        self._align_benchmark()
+        self.portfolio.bind_symbols(self.market.symbols)
+        self.strategy = create_strategy(strategy_type, self.portfolio, tickers, **(strategy_params or {}))
+        self.strategy.bind_symbols(self.market.symbols)
+        self._register_handlers()
+
+    def configure(self, strategy_type=None, strategy_params=None, **portfolio_settings):
+        """
+        Swaps the strategy and/or the portfolio settings and restarts the run on the market
+        already loaded, without fetching any data. A new `strategy_type` or `strategy_params`
+        builds a new strategy (of the current type if no type is given; parameters not
+        given take their defaults). `portfolio_settings` are any of PORTFOLIO_SETTINGS.
+        """
+        unknown = set(portfolio_settings) - set(PORTFOLIO_SETTINGS)
+        if unknown:
+            raise TypeError(f"Unknown portfolio settings: {', '.join(sorted(unknown))}")
+        for name, value in portfolio_settings.items():
+            setattr(self.portfolio, name, value)
+        if strategy_type is not None or strategy_params is not None:
+            strategy_type = strategy_type or type(self.strategy).__name__
+            self.strategy = create_strategy(strategy_type, self.portfolio, self.market.tickers, **(strategy_params or {}))
+            self.strategy.bind_symbols(self.market.symbols)
+        self.reset()
 
-    def update_market_and_strategy(self, tickers, interval, start_date, end_date, strategy_type):
-        self.market = Market(tickers, interval, start_date, end_date)
+    def _register_handlers(self):
+        """
+        Wires the components through the event queue:
+        MarketTickEvent -> (StopLossTriggeredEvent ->) SignalEvent -> OrderEvent -> FillEvent.
+        The portfolio value is recorded once per tick, in portfolio_history.
+        Call again after replacing the strategy or portfolio (bind a new strategy to the
+        market's symbols first, see Strategy.bind_symbols).
+        """
+        self.events = EventQueue()
+        self.portfolio.events = self.events
+        self.strategy.events = self.events
+        self.events.register(MarketTickEvent, self._on_market_tick)
+        self.events.register(StopLossTriggeredEvent, self.portfolio.on_stop_loss)
+        self.events.register(SignalEvent, self._on_signal)
+        self.events.register(OrderEvent, self.portfolio.on_order)
+        self.events.register(FillEvent, self._on_fill)
 
+    def _align_benchmark(self):
         # Get benchmark data for analysis
         self.benchmark_history = []
-        if self.market.benchmark_data is not None:
+        if self.market.streaming:
+            # Aligned chunk by chunk as the market streams them in
+            self.market.chunk_listeners.append(self._extend_benchmark)
+            self._extend_benchmark(self.market.chunk_dates)
+        elif self.market.benchmark_data is not None:
             # Align benchmark data with market data dates
-            # The market data is now a MultiIndex DataFrame, so we need to adjust how we reindex
-            # We'll use the first ticker's index as the reference for dates
-            first_ticker_data_index = self.market.data.index
-            aligned_benchmark_data = self.market.benchmark_data.reindex(first_ticker_data_index, method='ffill')
+            aligned_benchmark_data = self.market.benchmark_data.reindex(self.market.dates, method='ffill')
             self.benchmark_history = aligned_benchmark_data.dropna().tolist()
 
-        if strategy_type == "MovingAverageStrategy":
-            self.strategy = MovingAverageStrategy(self.portfolio, tickers=tickers)
-        elif strategy_type == "BuyAndHoldStrategy":
-            self.strategy = BuyAndHoldStrategy(self.portfolio, tickers=tickers)
-        elif strategy_type == "MomentumStrategy":
-            from Strategy import MomentumStrategy
-            self.strategy = MomentumStrategy(self.portfolio, tickers=tickers)
-        else:
-            raise ValueError("Unknown strategy type")
+    def _extend_benchmark(self, dates):
+        if self.market.benchmark_data is not None:
+            self.benchmark_history.extend(self.market.benchmark_data.reindex(dates, method='ffill').dropna().tolist())
 
     def step(self):
         """
         Perform a single simulation step (tick):
         - Advance market
         - Update portfolio value
+        - Fill resting limit/stop orders crossed by the new prices
         - Check stop-loss
         - Generate strategy signals
-        Returns True if step was performed, False if at end of data.
+        Everything after advancing the market runs as handlers of the tick's MarketTickEvent
+        (see _register_handlers). Returns True if step was performed, False if at end of data.
+        While profiling is on, each of these phases is timed (see profiling.PHASES).
         """
-        date, rows = self.market.get_next_tick()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start_tick(self.market.current_tick)
+        date = self.market.advance_tick()
         if date is None:
             return False
 
+        # Batched strategies take the close array, so the per-ticker rows are only built for the others
+        rows = None if self.strategy.supports_batch else self.market.get_current_rows()
+        if profiler is not None:
+            profiler.lap('advance')
         current_prices = self.market.get_current_prices()
+        if profiler is not None:
+            profiler.lap('prices')
+        self.events.put(MarketTickEvent(date, current_prices, rows))
+        self.events.dispatch()
+        if profiler is not None:
+            profiler.end_tick()
+        return True
+
+    def _on_market_tick(self, event):
+        profiler = self.profiler
+        current_prices = event.current_prices
         if current_prices:
             self.update_portfolio_history(current_prices)
-            for symbol in list(self.portfolio.positions.keys()):
-                if symbol in current_prices:
-                    self.portfolio.check_stop_loss(symbol, current_prices[symbol], date=date)
+            if profiler is not None:
+                profiler.lap('portfolio_value')
+            portfolio = self.portfolio
+            if portfolio.order_book:
+                portfolio.process_orders(current_prices, event.date)
+            if profiler is not None:
+                profiler.lap('orders')
+            # One vectorized comparison against the stop vector
+            for symbol in portfolio.stop_loss_breaches(self.market.get_current_price_array()):
+                self.events.put(StopLossTriggeredEvent(symbol, current_prices[symbol], event.date))
+            if profiler is not None:
+                profiler.lap('stop_loss')
 
-        # Pass the entire row data (which is now a dictionary of rows per ticker) to the strategy
-        self.strategy.generate_signals(date, rows)
-        return True
+        strategy = self.strategy
+        if event.rows is None:
+            # Batched: the closes of all tickers in, (buys, sells) arrays out
+            close = self.market.get_current_price_array()
+            strategy.emit_signals(event.date, close, strategy.generate_batch_signals(event.date, close))
+        else:
+            # Pass the entire row data (which is now a dictionary of rows per ticker) to the strategy
+            strategy.generate_signals(event.date, event.rows)
+        if profiler is not None:
+            profiler.lap('signals')
+
+    def _on_signal(self, signal):
+        quantity = self.strategy.order_quantity(signal)
+        if quantity > 0:
+            if signal.signal_type == 'SELL':
+                quantity = -quantity # Sell orders carry a negative quantity
+            order = Order(OrderType.MARKET, signal.symbol, quantity, signal.price, signal.date)
+            self.events.put(OrderEvent(order, signal))
+
+    def _on_fill(self, fill):
+        # Stop-loss exits have no signal; the strategy only hears about its own orders
+        if fill.signal is not None:
+            self.strategy.on_fill(fill)
 
     def update_portfolio_history(self, current_prices):
         if current_prices:
-            total_value = self.portfolio.get_total_value(current_prices)
+            # Position vector . price vector (the portfolio's vectors follow the market's ticker order)
+            total_value = self.portfolio.get_total_value_array(self.market.get_current_price_array())
             self.portfolio_history.append(total_value)
 
-    def run_simulation(self):
-        while self.step():
-            pass
+    def enable_profiling(self, trace=False, profile_ticks=None):
+        """
+        Starts timing each phase of `step` and returns the StepProfiler (see profiling.py).
+        `trace` keeps every timed phase for export_chrome_trace; `profile_ticks=(start, end)`
+        runs cProfile over those ticks. The event loop only: the vectorized engine has no steps.
+        """
+        self.disable_profiling()
+        self.profiler = StepProfiler(trace=trace, profile_ticks=profile_ticks)
+        return self.profiler
+
+    def disable_profiling(self):
+        """Stops profiling and returns the StepProfiler that was running, if any."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    def reset(self):
+        """
+        Back to the first tick with the initial cash and no positions, orders or trades. The
+        strategy is reset too, keeping parameter changes made since it was built.
+        """
+        self._check_rewindable()
+        self.market.current_tick = 0
+        self.portfolio_history = []
+        self.portfolio.reset()
+        self.strategy.reset()
+        self._register_handlers()
+
+    def snapshot(self):
+        """
+        The state of the run between two ticks as compact bytes: the market's current tick,
+        the portfolio (cash, positions, stops, resting orders, trades), the strategy's
+        indicator buffers and flags, and the portfolio history. The market data is not
+        included; `restore` the bytes onto a Simulator over the same market.
+        """
+        self._check_rewindable()
+        state = {'symbols': list(self.market.symbols), 'tick': self.market.current_tick,
+                 'strategy_type': type(self.strategy).__name__, 'portfolio': vars(self.portfolio),
+                 'strategy': vars(self.strategy), 'portfolio_history': np.asarray(self.portfolio_history, dtype=np.float64)}
+        buffer = io.BytesIO()
+        _StatePickler(buffer, self._shared_objects()).dump(state)
+        return buffer.getvalue()
+
+    def restore(self, snapshot):
+        """
+        Puts the run back to a `snapshot` and continues from its tick. The portfolio and
+        strategy objects are kept and their state replaced.
+        """
+        self._check_rewindable()
+        state = _StateUnpickler(io.BytesIO(snapshot), self._shared_objects()).load()
+        if state['symbols'] != list(self.market.symbols):
+            raise ValueError("The snapshot was taken on a market with different tickers")
+        if state['strategy_type'] != type(self.strategy).__name__:
+            raise ValueError(f"The snapshot is of a {state['strategy_type']} run, not {type(self.strategy).__name__}")
+        self.portfolio.__dict__ = state['portfolio']
+        self.strategy.__dict__ = state['strategy']
+        self.portfolio_history = state['portfolio_history'].tolist()
+        self.market.current_tick = state['tick']
+        self._register_handlers()
+
+    def fork(self):
+        """
+        A new Simulator that continues from this one's current tick on its own, e.g. to try
+        a what-if branch from a checkpoint. It shares the market's arrays (with a cursor of
+        its own) and copies the rest of the state in memory, so the ticks before the fork
+        are not simulated again.
+        """
+        self._check_rewindable()
+        fork = copy.copy(self)
+        fork.market = self.market.view()
+        fork.portfolio = copy.copy(self.portfolio)
+        fork.strategy = copy.copy(self.strategy)
+        fork.events = None
+        fork.profiler = None
+        fork.restore(self.snapshot())
+        return fork
+
+    def _shared_objects(self):
+        return {'market': self.market, 'events': self.events, 'portfolio': self.portfolio, 'strategy': self.strategy}
+
+    def _check_rewindable(self):
+        if self.market.streaming:
+            raise ValueError("A streaming market can't go back to an earlier tick; use a Market with the whole history")
+
+    def run_simulation(self, engine="loop", verify=False):
+        """
+        Runs the simulation to the end of the data.
+        engine="vectorized" computes the whole run with array operations (strategies that
+        implement `vectorized_signals` only); with verify=True it is also replayed through
+        the event loop and a mismatch raises an AssertionError. engine="auto" uses the
+        vectorized engine when the strategy supports it. A streaming market always runs on the loop.
+        """
+        if engine == "auto":
+            engine = "vectorized" if self.strategy.supports_vectorized and not self.market.streaming else "loop"
+        if engine == "vectorized":
+            if self.market.streaming:
+                raise ValueError("The vectorized engine needs the whole history; run a streaming market with engine='loop'")
+            if verify:
+                differences = compare_with_loop(self)
+                if differences:
+                    raise AssertionError("Vectorized run differs from the event loop: " + "; ".join(differences))
+            else:
+                run_vectorized(self)
+        elif engine == "loop":
+            while self.step():
+                pass
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
 
 if __name__ == '__main__':
     import tkinter as tk
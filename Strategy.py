@@ -1,119 +1,219 @@
-import pandas as pd
+import inspect
+import numpy as np
+from events import SignalEvent
+from indicators import ArraySMA, ArrayMomentum, rolling_mean, rate_of_change
+from indicator_cache import cached_indicator
 
 class Strategy:
+    allocation = 0.05 # Fraction of available cash invested per buy signal
+
     def __init__(self, portfolio):
         self.portfolio = portfolio
+        self.events = None # Set by the Simulator; signals are put on this queue
+        self.symbols = [] # Order of the batched interface's arrays (see bind_symbols)
+        self.traded = np.zeros(0, dtype=bool)
+        self._symbol_ids = {}
+
+    def bind_symbols(self, symbols):
+        """
+        Aligns the batched interface's arrays with `symbols` (the Simulator passes the
+        market's) and resets the strategy. `traded` masks the symbols among its tickers.
+        """
+        self.symbols = list(symbols)
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        tickers = set(getattr(self, 'tickers', self.symbols))
+        self.traded = np.array([symbol in tickers for symbol in self.symbols], dtype=bool)
+        self.reset()
 
     def generate_signals(self, date, rows):
-        raise NotImplementedError("Subclasses must implement this method")
+        """
+        Per-symbol interface: `rows` maps each symbol to its Bar for the tick. Batched
+        strategies need not implement it; their closes are gathered from `rows` instead.
+        """
+        if type(self).generate_batch_signals is Strategy.generate_batch_signals:
+            raise NotImplementedError("Subclasses must implement this method")
+        close = np.array([rows[symbol]['Close'] if symbol in rows else np.nan for symbol in self.symbols])
+        self.emit_signals(date, close, self.generate_batch_signals(date, close))
+
+    def generate_batch_signals(self, date, close):
+        """
+        Batched interface: `close` holds the tick's close prices aligned with `symbols`
+        (read-only). Returns boolean (buys, sells) arrays aligned the same way, or None for
+        no signals, so a tick costs a few array operations however many tickers there are.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not implement the batched interface")
+
+    @property
+    def supports_batch(self):
+        # A subclass that overrides generate_signals gets its per-symbol rows again
+        cls = type(self)
+        return cls.generate_batch_signals is not Strategy.generate_batch_signals and cls.generate_signals is Strategy.generate_signals
+
+    def emit_signals(self, date, close, signals):
+        """Puts a SignalEvent for each True entry of generate_batch_signals' (buys, sells), in symbol order."""
+        if signals is None:
+            return
+        buys, sells = signals
+        indices = np.flatnonzero(buys | sells)
+        for i, price in zip(indices.tolist(), close[indices].tolist()):
+            self.signal(self.symbols[i], 'BUY' if buys[i] else 'SELL', price, date)
+
+    def signal(self, symbol, signal_type, price, date):
+        events = self.events
+        if events is None:
+            raise RuntimeError(f"{type(self).__name__} is not bound to an event queue: set strategy.events "
+                               "(an events.EventQueue), or run it through a Simulator, which does")
+        events.put(SignalEvent(symbol, signal_type, price, date))
+
+    def order_quantity(self, signal):
+        """
+        Shares to trade for a signal, sized when the signal is handled (after earlier orders
+        of the same tick have filled): `allocation` of the available cash for a buy, the
+        whole position for a sell. Zero means no order.
+        """
+        if signal.signal_type == 'BUY':
+            return int(self.portfolio.cash * self.allocation // signal.price)
+        return self.portfolio.positions.get(signal.symbol, 0)
+
+    def on_fill(self, fill):
+        """Called for fills of orders that came from this strategy's signals."""
+        pass
+
+    def reset(self):
+        """
+        Clears the strategy's per-symbol state so a run can restart. Subclasses rebuild their
+        indicators here, so parameter changes made before a reset take effect.
+        """
+        pass
+
+    def vectorized_signals(self, close, market=None):
+        """
+        Optional hook for the vectorized engine: given a (ticker x time) array of closes,
+        returns boolean (entries, exits) arrays of the same shape. Strategies that need
+        tick-by-tick feedback leave this unimplemented. `market` is the Market the closes
+        come from, if any; indicators are then shared through the indicator cache.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support the vectorized engine")
+
+    @property
+    def supports_vectorized(self):
+        return type(self).vectorized_signals is not Strategy.vectorized_signals
 
 class MovingAverageStrategy(Strategy):
     def __init__(self, portfolio, short_window=10, long_window=30, tickers=['SWIGGY.NS']):
         super().__init__(portfolio)
         self.short_window = short_window
         self.long_window = long_window
-        self.prices = {ticker: [] for ticker in tickers}
-        self.invested = {ticker: False for ticker in tickers}
         self.tickers = tickers
-
-    def generate_signals(self, date, rows):
-        for symbol in self.tickers:
-            if symbol not in rows:
-                continue
-            row = rows[symbol]
-
-            # Always update price history on every tick
-            self.prices[symbol].append(row['Close'])
-            if len(self.prices[symbol]) > self.long_window * 2:
-                self.prices[symbol] = self.prices[symbol][-self.long_window * 2:]
-
-            if len(self.prices[symbol]) < self.long_window:
-                continue
-
-            temp_prices = pd.Series(self.prices[symbol])
-            short_ma = temp_prices.rolling(window=self.short_window).mean().iloc[-1]
-            long_ma = temp_prices.rolling(window=self.long_window).mean().iloc[-1]
-
-            if short_ma > long_ma and not self.invested[symbol]:
-                price = row['Close']
-                # Invest a fixed percentage of available cash per stock, or manage allocation differently
-                cash_to_invest = self.portfolio.cash * 0.05 # Example: 5% of cash per stock
-                quantity_to_buy = int(cash_to_invest // price)
-
-                if quantity_to_buy > 0 and self.portfolio.buy(symbol, quantity_to_buy, price, date=date):
-                    print(f"{date}: BUY signal for {quantity_to_buy} shares of {symbol} at {price:.2f}")
-                    self.invested[symbol] = True
-
-            elif short_ma < long_ma and self.invested[symbol]:
-                price = row['Close']
-                quantity_to_sell = self.portfolio.positions.get(symbol, 0)
-
-                if quantity_to_sell > 0 and self.portfolio.sell(symbol, quantity_to_sell, price, date=date):
-                    print(f"{date}: SELL signal for {quantity_to_sell} shares of {symbol} at {price:.2f}")
-                    self.invested[symbol] = False
+        self.bind_symbols(tickers)
+
+    def reset(self):
+        self.short_ma = ArraySMA(self.short_window, len(self.symbols))
+        self.long_ma = ArraySMA(self.long_window, len(self.symbols))
+        self.invested = np.zeros(len(self.symbols), dtype=bool)
+
+    def generate_batch_signals(self, date, close):
+        # Always update the moving averages on every tick
+        short_ma = self.short_ma.update(close)
+        long_ma = self.long_ma.update(close)
+
+        if not self.long_ma.ready:
+            return None
+
+        return ((short_ma > long_ma) & ~self.invested & self.traded,
+                (short_ma < long_ma) & self.invested & self.traded)
+
+    def on_fill(self, fill):
+        order = fill.order
+        if order.quantity > 0:
+            print(f"{fill.date}: BUY signal for {order.quantity} shares of {order.symbol} at {order.price:.2f}")
+            self.invested[self._symbol_ids[order.symbol]] = True
+        else:
+            print(f"{fill.date}: SELL signal for {-order.quantity} shares of {order.symbol} at {order.price:.2f}")
+            self.invested[self._symbol_ids[order.symbol]] = False
+
+    def vectorized_signals(self, close, market=None):
+        # Same moving averages as generate_batch_signals, computed for the whole history at once
+        short_ma = cached_indicator(rolling_mean, close, self.short_window, market=market)
+        long_ma = cached_indicator(rolling_mean, close, self.long_window, market=market)
+        return short_ma > long_ma, short_ma < long_ma
 
 class BuyAndHoldStrategy(Strategy):
     def __init__(self, portfolio, tickers=['SWIGGY.NS']):
         super().__init__(portfolio)
-        self.bought = {ticker: False for ticker in tickers}
         self.tickers = tickers
+        self.bind_symbols(tickers)
 
-    def generate_signals(self, date, rows):
-        for symbol in self.tickers:
-            if symbol not in rows:
-                continue
-            row = rows[symbol]
-
-            if not self.bought[symbol]:
-                price = row['Close']
-                # Invest a fixed percentage of initial cash per stock
-                cash_to_invest = self.portfolio.initial_cash * 0.05 # Example: 5% of initial cash per stock
-                quantity_to_buy = int(cash_to_invest // price)
-                if quantity_to_buy > 0 and self.portfolio.buy(symbol, quantity_to_buy, price, date=date):
-                    print(f"{date}: BUY signal for {quantity_to_buy} shares of {symbol} at {price:.2f}")
-                    print(f"{date}: BUY and HOLD: Bought {quantity_to_buy} shares of {symbol} at {price:.2f}")
-                    self.bought[symbol] = True
+    def reset(self):
+        self.bought = np.zeros(len(self.symbols), dtype=bool)
+
+    def generate_batch_signals(self, date, close):
+        # Buy every ticker not bought yet; no sells
+        return ~self.bought & self.traded, np.zeros(len(self.symbols), dtype=bool)
+
+    def order_quantity(self, signal):
+        # Invest a fixed percentage of initial cash per stock
+        cash_to_invest = self.portfolio.initial_cash * 0.05 # Example: 5% of initial cash per stock
+        return int(cash_to_invest // signal.price)
+
+    def on_fill(self, fill):
+        order = fill.order
+        print(f"{fill.date}: BUY signal for {order.quantity} shares of {order.symbol} at {order.price:.2f}")
+        print(f"{fill.date}: BUY and HOLD: Bought {order.quantity} shares of {order.symbol} at {order.price:.2f}")
+        self.bought[self._symbol_ids[order.symbol]] = True
 
 class MomentumStrategy(Strategy):
     def __init__(self, portfolio, lookback_period=20, tickers=['SWIGGY.NS']):
         super().__init__(portfolio)
         self.lookback_period = lookback_period
-        self.prices = {ticker: [] for ticker in tickers}
-        self.invested = {ticker: False for ticker in tickers}
         self.tickers = tickers
-
-    def generate_signals(self, date, rows):
-        for symbol in self.tickers:
-            if symbol not in rows:
-                continue
-            row = rows[symbol]
-
-            self.prices[symbol].append(row['Close'])
-            if len(self.prices[symbol]) > self.lookback_period * 2:
-                self.prices[symbol] = self.prices[symbol][-self.lookback_period * 2:]
-
-            if len(self.prices[symbol]) < self.lookback_period:
-                continue
-
-            current_price = row['Close']
-            past_price = self.prices[symbol][-(self.lookback_period + 1)] # Price at the start of lookback period
-
-            momentum = (current_price - past_price) / past_price
-
-            # Simple momentum: buy if positive momentum, sell if negative
-            if momentum > 0 and not self.invested[symbol]:
-                price = current_price
-                cash_to_invest = self.portfolio.cash * 0.05
-                quantity_to_buy = int(cash_to_invest // price)
-
-                if quantity_to_buy > 0 and self.portfolio.buy(symbol, quantity_to_buy, price, date=date):
-                    print(f"{date}: BUY signal (Momentum) for {quantity_to_buy} shares of {symbol} at {price:.2f}")
-                    self.invested[symbol] = True
-
-            elif momentum < 0 and self.invested[symbol]:
-                price = current_price
-                quantity_to_sell = self.portfolio.positions.get(symbol, 0)
-
-                if quantity_to_sell > 0 and self.portfolio.sell(symbol, quantity_to_sell, price, date=date):
-                    print(f"{date}: SELL signal (Momentum) for {quantity_to_sell} shares of {symbol} at {price:.2f}")
-                    self.invested[symbol] = False
\ No newline at end of file
+        self.bind_symbols(tickers)
+
+    def reset(self):
+        self.momentum = ArrayMomentum(self.lookback_period, len(self.symbols))
+        self.invested = np.zeros(len(self.symbols), dtype=bool)
+
+    def generate_batch_signals(self, date, close):
+        # Rate of change against the price at the start of the lookback period
+        momentum = self.momentum.update(close)
+
+        if not self.momentum.ready:
+            return None
+
+        # Simple momentum: buy if positive momentum, sell if negative
+        return ((momentum > 0) & ~self.invested & self.traded,
+                (momentum < 0) & self.invested & self.traded)
+
+    def on_fill(self, fill):
+        order = fill.order
+        if order.quantity > 0:
+            print(f"{fill.date}: BUY signal (Momentum) for {order.quantity} shares of {order.symbol} at {order.price:.2f}")
+            self.invested[self._symbol_ids[order.symbol]] = True
+        else:
+            print(f"{fill.date}: SELL signal (Momentum) for {-order.quantity} shares of {order.symbol} at {order.price:.2f}")
+            self.invested[self._symbol_ids[order.symbol]] = False
+
+    def vectorized_signals(self, close, market=None):
+        momentum = cached_indicator(rate_of_change, close, self.lookback_period, market=market)
+        return momentum > 0, momentum < 0
+
+STRATEGIES = {
+    'MovingAverageStrategy': MovingAverageStrategy,
+    'BuyAndHoldStrategy': BuyAndHoldStrategy,
+    'MomentumStrategy': MomentumStrategy,
+}
+
+def strategy_param_names(strategy_type):
+    """Keyword arguments a strategy accepts, other than the portfolio and tickers."""
+    if strategy_type not in STRATEGIES:
+        raise ValueError("Unknown strategy type")
+    signature = inspect.signature(STRATEGIES[strategy_type].__init__)
+    return tuple(name for name in signature.parameters if name not in ('self', 'portfolio', 'tickers'))
+
+def create_strategy(strategy_type, portfolio, tickers, **params):
+    """
+    Builds a strategy by name; `params` are its keyword arguments (e.g. short_window).
+    """
+    if strategy_type not in STRATEGIES:
+        raise ValueError("Unknown strategy type")
+    return STRATEGIES[strategy_type](portfolio, tickers=tickers, **params)
@@ -1,11 +1,13 @@
+import time
 import tkinter as tk
 from tkinter import ttk
-import mplfinance as mpf
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
-import pandas as pd
-from Analysis import Analysis
-from Market import Market
+from Analysis import OnlineAnalysis
+from Market import load_market
+from Strategy import strategy_param_names
+from live_chart import LiveChart
+from sim_worker import SimulationWorker, SPEEDS
 
 class Visualizer:
     def __init__(self, root, simulator):
@@ -90,6 +92,7 @@ class Visualizer:
         ttk.Label(data_selection_frame, text="Chart Ticker:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.E)
         self.chart_ticker_selection = ttk.Combobox(data_selection_frame, values=[], state="readonly", width=12)
         self.chart_ticker_selection.grid(row=2, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+        self.chart_ticker_selection.bind("<<ComboboxSelected>>", self.on_chart_ticker_selected)
 
         
 
@@ -187,6 +190,11 @@ class Visualizer:
         self.strategy_selection.set("MovingAverageStrategy") # Default strategy
         self.strategy_selection.bind("<<ComboboxSelected>>", self.on_strategy_selected)
 
+        ttk.Label(controls_frame, text="Speed:").grid(row=6, column=0, padx=5, pady=5, sticky=tk.E)
+        self.speed_selection = ttk.Combobox(controls_frame, values=list(SPEEDS), state="readonly", width=10)
+        self.speed_selection.grid(row=6, column=1, padx=5, pady=5, sticky=tk.W)
+        self.speed_selection.set('1x')
+
         # --- Chart Figure and Axes ---
         self.fig = Figure(figsize=(12, 9), dpi=100, facecolor='#101010')
         gs = self.fig.add_gridspec(3, 1, height_ratios=[4, 1, 2])
@@ -200,8 +208,12 @@ class Visualizer:
         self.equity_ax.tick_params(axis='x', colors='#FFA500')
         self.equity_ax.tick_params(axis='y', colors='#FFA500')
         self.fig.subplots_adjust(hspace=0.1)
+        self.online_analysis = OnlineAnalysis()
+        self.analyzed_ticks = 0
         self.canvas = FigureCanvasTkAgg(self.fig, master=chart_frame)
         self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+        self.chart = LiveChart(self.fig, self.ax, self.vol_ax, self.equity_ax)
+        self.worker = SimulationWorker(self.simulator) # Steps the simulation off the UI thread
         self.load_data()
 
     
@@ -213,21 +225,22 @@ class Visualizer:
         current_start_date = self.start_date_entry.get()
         current_end_date = self.end_date_entry.get()
         current_benchmark = self.benchmark_entry.get()
+        self.worker.stop()
 
         try:
             # Create a new Market instance with the updated list of tickers
-            self.simulator.market = Market(new_tickers, current_interval, current_start_date, current_end_date, benchmark_ticker=current_benchmark)
+            self.simulator.market = load_market(new_tickers, current_interval, current_start_date, current_end_date, benchmark_ticker=current_benchmark)
             
-            # Update the strategy's tickers if it has a tickers attribute
+            # Update the strategy's tickers if it has a tickers attribute, and realign it with the new market
             if hasattr(self.simulator.strategy, 'tickers'):
                 self.simulator.strategy.tickers = new_tickers
+            self.simulator.strategy.bind_symbols(self.simulator.market.symbols)
 
             # Reset the market's current tick to re-simulate from the beginning with new data
             self.simulator.market.current_tick = 0
             self.simulator.portfolio_history = []
-            self.simulator.portfolio.cash = self.simulator.portfolio.initial_cash
-            self.simulator.portfolio.positions = {}
-            self.simulator.portfolio.trades = []
+            self.simulator.portfolio.bind_symbols(self.simulator.market.symbols)
+            self.simulator.portfolio.reset()
 
             # Update benchmark history for analysis
             self.simulator.benchmark_history = []
@@ -308,15 +321,12 @@ class Visualizer:
         except Exception:
             stop_loss = None
 
+        self.worker.stop()
         try:
-            self.simulator.__init__(tickers=tickers, interval=interval, start_date=start_date, end_date=end_date, strategy_type=strategy_type)
-            self.simulator.portfolio.commission = commission
-            self.simulator.portfolio.slippage = slippage
-            self.simulator.portfolio.stop_loss_percentage = stop_loss
-            if hasattr(self.simulator.strategy, 'short_window'):
-                self.simulator.strategy.short_window = short_window
-            if hasattr(self.simulator.strategy, 'long_window'):
-                self.simulator.strategy.long_window = long_window
+            # Data already loaded with the same settings comes from the dataset registry
+            self.simulator.update_market_and_strategy(tickers, interval, start_date, end_date, strategy_type,
+                                                      self._strategy_params(strategy_type, short_window, long_window))
+            self.simulator.configure(commission=commission, slippage=slippage, stop_loss_percentage=stop_loss)
             # Update ticker ComboBoxes for chart and trading
             if hasattr(self.simulator.market, 'data') and hasattr(self.simulator.market.data, 'columns'):
                 if hasattr(self.simulator.market.data.columns, 'levels'):
@@ -336,58 +346,48 @@ class Visualizer:
         self.running = not self.running
         if self.running:
             self.play_pause_button.config(text="Pause")
+            self.worker.start()
             self.update_chart()
         else:
+            self.worker.pause()
             self.play_pause_button.config(text="Play")
 
     def stop_simulation(self):
         self.running = False
+        self.worker.stop()
         self.play_pause_button.config(text="Play")
         # Optionally reset the chart to initial state or clear it
-        self.ax.clear()
-        self.vol_ax.clear()
+        self.chart.reset()
         self.canvas.draw()
 
     def reset_simulation(self):
         self.running = False
+        self.worker.stop()
         self.play_pause_button.config(text="Play")
-        self.simulator.market.current_tick = 0
-        self.simulator.portfolio_history = []
-        self.simulator.portfolio.cash = self.simulator.portfolio.initial_cash
-        self.simulator.portfolio.positions = {}
-        self.simulator.portfolio.trades = []
+        # Back to the first tick: cash, positions, stops, resting orders, trades and the
+        # strategy's state (indicators are rebuilt for the current windows)
+        self.simulator.reset()
         self.start_date_entry.delete(0, tk.END)
         self.start_date_entry.insert(0, "2020-01-01")
         self.end_date_entry.delete(0, tk.END)
         self.end_date_entry.insert(0, "2025-06-27")
-        # Reset strategy's internal state for multi-ticker support
-        if hasattr(self.simulator.strategy, 'prices'):
-            if isinstance(self.simulator.strategy.prices, dict):
-                for ticker in self.simulator.strategy.prices:
-                    self.simulator.strategy.prices[ticker] = []
-            else:
-                self.simulator.strategy.prices = []
-        if hasattr(self.simulator.strategy, 'invested'):
-            if isinstance(self.simulator.strategy.invested, dict):
-                for ticker in self.simulator.strategy.invested:
-                    self.simulator.strategy.invested[ticker] = False
-            else:
-                self.simulator.strategy.invested = False
-        if hasattr(self.simulator.strategy, 'bought'):
-            if isinstance(self.simulator.strategy.bought, dict):
-                for ticker in self.simulator.strategy.bought:
-                    self.simulator.strategy.bought[ticker] = False
-            else:
-                self.simulator.strategy.bought = False
-        self.update_chart()
+        self.online_analysis = OnlineAnalysis()
+        self.analyzed_ticks = 0
+        self.chart.set_market(self.simulator.market, self.chart_ticker_selection.get())
+        self.draw_chart()
+
+    def on_chart_ticker_selected(self, event):
+        with self.worker.lock:
+            self.chart.set_symbol(self.chart_ticker_selection.get())
+        self.draw_chart()
+
+    def _strategy_params(self, strategy_type, short_window, long_window):
+        # The window entries apply to the strategies that take them
+        names = strategy_param_names(strategy_type)
+        return {name: value for name, value in (('short_window', short_window), ('long_window', long_window)) if name in names}
 
     def on_strategy_selected(self, event):
         selected_strategy = self.strategy_selection.get()
-        current_tickers_str = self.ticker_entry.get()
-        current_tickers = [t.strip() for t in current_tickers_str.split(',') if t.strip()]
-        current_interval = self.interval_selection.get()
-        current_start_date = self.start_date_entry.get()
-        current_end_date = self.end_date_entry.get()
         try:
             short_window = int(self.short_window_entry.get())
         except Exception:
@@ -408,14 +408,11 @@ class Visualizer:
             stop_loss = float(self.stop_loss_entry.get()) / 100.0 if self.stop_loss_entry.get() else None
         except Exception:
             stop_loss = None
-        self.simulator.__init__(tickers=current_tickers, interval=current_interval, start_date=current_start_date, end_date=current_end_date, strategy_type=selected_strategy)
-        self.simulator.portfolio.commission = commission
-        self.simulator.portfolio.slippage = slippage
-        self.simulator.portfolio.stop_loss_percentage = stop_loss
-        if hasattr(self.simulator.strategy, 'short_window'):
-            self.simulator.strategy.short_window = short_window
-        if hasattr(self.simulator.strategy, 'long_window'):
-            self.simulator.strategy.long_window = long_window
+        self.worker.stop()
+        # Swap the strategy on the market already loaded; nothing is fetched again
+        self.simulator.configure(strategy_type=selected_strategy,
+                                 strategy_params=self._strategy_params(selected_strategy, short_window, long_window),
+                                 commission=commission, slippage=slippage, stop_loss_percentage=stop_loss)
         self.reset_simulation()
 
 
@@ -443,11 +440,11 @@ class Visualizer:
                 stop_loss_percentage_str = self.stop_loss_entry.get()
                 stop_loss_percentage = float(stop_loss_percentage_str) / 100 if stop_loss_percentage_str else None
 
-                self.simulator.portfolio.commission = commission
-                self.simulator.portfolio.slippage = slippage
-                self.simulator.portfolio.stop_loss_percentage = stop_loss_percentage
-
-                self.simulator.portfolio.buy(symbol, quantity, price, date=current_date)
+                with self.worker.lock:
+                    self.simulator.portfolio.commission = commission
+                    self.simulator.portfolio.slippage = slippage
+                    self.simulator.portfolio.stop_loss_percentage = stop_loss_percentage
+                    self.simulator.portfolio.buy(symbol, quantity, price, date=current_date)
         except ValueError:
             tk.messagebox.showerror("Error", "Invalid quantity or input.")
             pass
@@ -476,100 +473,91 @@ class Visualizer:
                 stop_loss_percentage_str = self.stop_loss_entry.get()
                 stop_loss_percentage = float(stop_loss_percentage_str) / 100 if stop_loss_percentage_str else None
 
-                self.simulator.portfolio.commission = commission
-                self.simulator.portfolio.slippage = slippage
-                self.simulator.portfolio.stop_loss_percentage = stop_loss_percentage
-
-                self.simulator.portfolio.sell(symbol, quantity, price, date=current_date)
+                with self.worker.lock:
+                    self.simulator.portfolio.commission = commission
+                    self.simulator.portfolio.slippage = slippage
+                    self.simulator.portfolio.stop_loss_percentage = stop_loss_percentage
+                    self.simulator.portfolio.sell(symbol, quantity, price, date=current_date)
         except ValueError:
             tk.messagebox.showerror("Error", "Invalid quantity or input.")
             pass
 
-    def update_chart(self):
-        if not self.running:
+    def update_analysis(self):
+        """Feeds the equity values added since the last frame into the online metrics."""
+        history = self.simulator.portfolio_history
+        benchmark = self.simulator.benchmark_history
+        # The aligned benchmark drops leading ticks that have no benchmark price yet
+        offset = self.simulator.market.num_ticks - len(benchmark)
+        for tick in range(self.analyzed_ticks, len(history)):
+            benchmark_tick = tick - offset
+            self.online_analysis.update(history[tick], benchmark[benchmark_tick] if 0 <= benchmark_tick < len(benchmark) else None)
+        self.analyzed_ticks = len(history)
+
+    def update_labels(self, snapshot):
+        """Shows the portfolio values of a worker snapshot and the online metrics."""
+        current_prices = snapshot.current_prices
+        if not current_prices:
             return
+        holdings_text = "Holdings: "
+        for symbol, quantity in snapshot.positions.items():
+            price_for_holding = current_prices.get(symbol, 0)
+            holding_value = quantity * price_for_holding
+            holdings_text += f"{symbol}: {quantity} shares (₹{holding_value:,.2f}) "
+        if not snapshot.positions:
+            holdings_text += "None"
+        self.portfolio_label.config(text=f"Portfolio Value: ₹{snapshot.total_value:,.2f}   |   Cash: ₹{snapshot.cash:,.2f}")
+        self.holdings_label.config(text=holdings_text)
+        if self.analyzed_ticks > 1:
+            analysis = self.online_analysis
+            total_return = analysis.get_total_return()
+            cagr = analysis.get_cagr()
+            sharpe_ratio = analysis.get_sharpe_ratio()
+            sortino_ratio = analysis.get_sortino_ratio()
+            max_drawdown = analysis.get_max_drawdown()
+            calmar_ratio = analysis.get_calmar_ratio()
+            alpha, beta = analysis.get_alpha_beta()
+            var_95 = analysis.get_var(confidence_level=0.95)
+            cvar_95 = analysis.get_cvar(confidence_level=0.95)
+
+            self.metrics_label.config(text=f"Return: {total_return:.2%} | CAGR: {cagr:.2%} | Sharpe: {sharpe_ratio:.2f} | Sortino: {sortino_ratio:.2f} | Drawdown: {max_drawdown:.2%} | Calmar: {calmar_ratio:.2f} | Alpha: {alpha:.2f} | Beta: {beta:.2f}")
+            self.var_label.config(text=f"VaR (95%): {var_95:.2%}")
+            self.cvar_label.config(text=f"CVaR (95%): {cvar_95:.2%}")
+
+    def draw_chart(self):
+        """Draws the selected ticker's bars up to the current tick, its trades and the equity curve."""
+        with self.worker.lock:
+            self.chart.prepare(self.simulator.market.current_tick, self.simulator.portfolio_history, self.simulator.portfolio.trades)
+        self.chart.show()
 
-        # Use the centralized simulation step
-        step_result = self.simulator.step()
-        if not step_result:
-            self.running = False
-            self.play_pause_button.config(text="Simulation Finished")
-            self.portfolio_label.config(text="Simulation Finished.")
-            self.metrics_label.config(text="")
+    def update_chart(self):
+        """
+        One GUI frame: lets the worker take the selected speed's steps and shows the newest
+        state it has published. Frames keep the interval's pace however many steps they
+        cover, and a slow step delays the next snapshot rather than the UI.
+        """
+        if not self.running:
             return
 
-        # Display the selected ticker's chart (LIVE: plot only up to current tick, no static blue line)
-        if not self.simulator.market.data.empty:
-            chart_ticker = self.chart_ticker_selection.get()
-            if chart_ticker and chart_ticker in self.simulator.market.data.columns.levels[0]:
-                ticker_data = self.simulator.market.data[chart_ticker]
-                if not isinstance(ticker_data.index, pd.DatetimeIndex):
-                    ticker_data.index = pd.to_datetime(ticker_data.index)
-
-                self.ax.clear()
-                self.vol_ax.clear()
-                mc = mpf.make_marketcolors(up='green', down='red', inherit=True)
-                s = mpf.make_mpf_style(marketcolors=mc, gridcolor='gray', figcolor='#2e2e2e', y_on_right=True)
-                # Only plot up to the current tick
-                current_data_index = self.simulator.market.current_tick
-                data_to_plot = ticker_data.iloc[:current_data_index]
-                mpf.plot(data_to_plot, type='candle', ax=self.ax, volume=self.vol_ax, style=s, warn_too_much_data=1000)
-
-                # Plot trades for the specific chart_ticker
-                buy_trades = [trade for trade in self.simulator.portfolio.trades if trade['type'] == 'buy' and trade['symbol'] == chart_ticker]
-                sell_trades = [trade for trade in self.simulator.portfolio.trades if trade['type'] == 'sell' and trade['symbol'] == chart_ticker]
-
-                buy_dates = [trade['date'] for trade in buy_trades]
-                buy_prices = [trade['price'] for trade in buy_trades]
-                sell_dates = [trade['date'] for trade in sell_trades]
-                sell_prices = [trade['price'] for trade in sell_trades]
-
-                plotted_dates = data_to_plot.index.tolist()
-                buy_x = [plotted_dates.index(d) for d in buy_dates if d in plotted_dates]
-                sell_x = [plotted_dates.index(d) for d in sell_dates if d in plotted_dates]
-
-                self.ax.plot(buy_x, buy_prices, '^', markersize=10, color='green', label='Buy', alpha=0.7)
-                self.ax.plot(sell_x, sell_prices, 'v', markersize=10, color='red', label='Sell', alpha=0.7)
-
-        self.equity_ax.clear()
-        if self.simulator.portfolio_history:
-            self.equity_ax.plot(self.simulator.portfolio_history, color='purple')
-            self.equity_ax.set_title('Portfolio Equity Curve')
-            self.equity_ax.set_xlabel('Time (Ticks)')
-            self.equity_ax.set_ylabel('Portfolio Value')
-            self.equity_ax.grid(True)
-
-        self.canvas.draw()
-
-        # Update portfolio values using get_current_prices
-        current_prices = self.simulator.market.get_current_prices()
-        if current_prices:
-            total_value = self.simulator.portfolio.get_total_value(current_prices)
-            cash = self.simulator.portfolio.cash
-            holdings_text = "Holdings: "
-            for symbol, quantity in self.simulator.portfolio.positions.items():
-                price_for_holding = current_prices.get(symbol, 0)
-                holding_value = quantity * price_for_holding
-                holdings_text += f"{symbol}: {quantity} shares (₹{holding_value:,.2f}) "
-            if not self.simulator.portfolio.positions:
-                holdings_text += "None"
-            self.portfolio_label.config(text=f"Portfolio Value: ₹{total_value:,.2f}   |   Cash: ₹{cash:,.2f}")
-            self.holdings_label.config(text=holdings_text)
-            if len(self.simulator.portfolio_history) > 1:
-                analysis = Analysis(self.simulator.portfolio_history, benchmark_history=self.simulator.benchmark_history)
-                total_return = analysis.get_total_return()
-                cagr = analysis.get_cagr()
-                sharpe_ratio = analysis.get_sharpe_ratio()
-                sortino_ratio = analysis.get_sortino_ratio()
-                max_drawdown = analysis.get_max_drawdown()
-                calmar_ratio = analysis.get_calmar_ratio()
-                alpha, beta = analysis.get_alpha_beta()
-                var_95 = analysis.get_var(confidence_level=0.95)
-                cvar_95 = analysis.get_cvar(confidence_level=0.95)
-
-                self.metrics_label.config(text=f"Return: {total_return:.2%} | CAGR: {cagr:.2%} | Sharpe: {sharpe_ratio:.2f} | Sortino: {sortino_ratio:.2f} | Drawdown: {max_drawdown:.2%} | Calmar: {calmar_ratio:.2f} | Alpha: {alpha:.2f} | Beta: {beta:.2f}")
-                self.var_label.config(text=f"VaR (95%): {var_95:.2%}")
-                self.cvar_label.config(text=f"CVaR (95%): {cvar_95:.2%}")
+        self.worker.request(SPEEDS[self.speed_selection.get()])
+        snapshot = self.worker.latest()
+        if snapshot is not None:
+            frame_start = time.perf_counter()
+            # Read the simulation state under the worker's lock; render outside it
+            with self.worker.lock:
+                self.chart.prepare(self.simulator.market.current_tick, self.simulator.portfolio_history, self.simulator.portfolio.trades)
+                self.update_analysis()
+            self.chart.show()
+            profiler = self.simulator.profiler
+            if profiler is not None:
+                profiler.record('gui', frame_start, time.perf_counter())
+
+            if snapshot.finished:
+                self.running = False
+                self.play_pause_button.config(text="Simulation Finished")
+                self.portfolio_label.config(text="Simulation Finished.")
+                self.metrics_label.config(text="")
+                return
+            self.update_labels(snapshot)
 
         # Adjust update speed based on interval
         update_delay = 200 # Default for daily
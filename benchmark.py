@@ -0,0 +1,220 @@
+# Sim/benchmark.py
+#
+# Reproducible performance benchmarks for the simulation hot path. Runs offline against
+# data/SWIGGY_NS.csv and synthetic datasets, and saves machine-readable results:
+#
+#   python benchmark.py --preset quick
+#   python benchmark.py --preset full --output bench_results/full.json
+#   python benchmark.py --compare bench_results/old.json bench_results/new.json
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+import config
+from Analysis import Analysis
+from Market import Market, FIELDS
+from Simulator import Simulator
+from data_loader import read_ohlcv_csv
+from data_sources import SESSION_MINUTES, SyntheticDataSource
+from event_queue import EventQueue
+from events import MarketTickEvent
+
+# (name, number of bars, number of tickers)
+PRESETS = {
+    'quick': [
+        ('swiggy', None, 1),
+        ('gbm', 1_000, 1),
+        ('gbm', 10_000, 10),
+        ('gbm', 100_000, 1),
+    ],
+    'full': [
+        ('swiggy', None, 1),
+        ('gbm', 1_000, 1),
+        ('gbm', 100_000, 1),
+        ('gbm', 1_000_000, 1),
+        ('gbm', 10_000_000, 1),
+        ('gbm', 10_000, 10),
+        ('gbm', 10_000, 100),
+        ('gbm', 10_000, 500),
+        ('gbm', 100_000, 100),
+    ],
+}
+
+EVENT_BUDGET_NS = 1000 # Target for the queue's own cost per dispatched event
+
+def generate_market(num_bars, num_tickers, seed=42, interval='1m'):
+    """A Market of `num_bars` synthetic geometric Brownian motion bars per ticker, fully deterministic."""
+    days = pd.bdate_range('2000-01-03', periods=-(-num_bars // SESSION_MINUTES) + 1)
+    symbols, dates, values = SyntheticDataSource(seed=seed).load_arrays(
+        [f"SYN{i}" for i in range(num_tickers)], interval, days[0], days[-1])
+    return Market.from_arrays(symbols, dates[:num_bars], values[:, :num_bars], interval)
+
+def swiggy_market():
+    stock_data = read_ohlcv_csv(os.path.join(config.DATA_DIR, 'SWIGGY_NS.csv'))
+    values = stock_data[list(FIELDS)].to_numpy(dtype=np.float64)[np.newaxis]
+    return Market.from_arrays(['SWIGGY.NS'], stock_data.index, values, '1d', benchmark_data=stock_data['Close'])
+
+def _view(market, num_ticks=None):
+    """A fresh Market at tick 0 over the same arrays, optionally truncated."""
+    return Market.from_arrays(market.symbols, market.dates[:num_ticks], market.values[:, :num_ticks],
+                              market.interval, benchmark_data=market.benchmark_data)
+
+def time_components(market, strategy_type):
+    """Runs the event loop with the Simulator's per-phase profiler on (see profiling.py)."""
+    simulator = Simulator(market=market, strategy_type=strategy_type)
+    profiler = simulator.enable_profiling()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.run_simulation(engine='loop')
+    simulator.disable_profiling()
+    return {name: {'total_s': seconds, 'per_tick_us': seconds / market.num_ticks * 1e6} for name, seconds in profiler.totals.items()}
+
+def event_overhead(num_events=200_000):
+    """Nanoseconds per event the queue adds (put plus dispatch) over calling the handler directly."""
+    def handler(event):
+        pass
+    queue = EventQueue()
+    queue.register(MarketTickEvent, handler)
+    event = MarketTickEvent(None, None, None)
+
+    start = time.perf_counter()
+    for _ in range(num_events):
+        handler(event)
+    direct = time.perf_counter() - start
+
+    # One tick's worth of events at a time, like Simulator.step
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(num_events // 10):
+            for _ in range(10):
+                queue.put(event)
+            queue.dispatch()
+        best = min(best, time.perf_counter() - start)
+    return (best - direct) / num_events * 1e9
+
+def run_case(name, num_bars, num_tickers, strategy_type, max_loop_ticks, repeat):
+    market = swiggy_market() if name == 'swiggy' else generate_market(num_bars, num_tickers)
+    loop_ticks = min(market.num_ticks, max_loop_ticks)
+    result = {'dataset': name, 'bars': market.num_ticks, 'tickers': len(market.symbols),
+              'strategy': strategy_type, 'loop_ticks': loop_ticks}
+
+    # End-to-end event loop, best of `repeat`
+    best = float('inf')
+    for _ in range(repeat):
+        simulator = Simulator(market=_view(market, loop_ticks), strategy_type=strategy_type)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.run_simulation(engine='loop')
+        best = min(best, time.perf_counter() - start)
+    result['loop_seconds'] = best
+    result['loop_ticks_per_second'] = loop_ticks / best
+
+    result['components'] = time_components(_view(market, loop_ticks), strategy_type)
+
+    # Whole history through the vectorized engine
+    best = float('inf')
+    for _ in range(repeat):
+        simulator = Simulator(market=_view(market), strategy_type=strategy_type)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.run_simulation(engine='vectorized')
+        best = min(best, time.perf_counter() - start)
+    result['vectorized_seconds'] = best
+    result['vectorized_ticks_per_second'] = market.num_ticks / best
+
+    start = time.perf_counter()
+    Analysis(simulator.portfolio_history).get_metrics()
+    result['analysis_seconds'] = time.perf_counter() - start
+
+    # Peak traced memory of building the dataset and running it vectorized, measured
+    # separately because tracing slows everything else down
+    del market, simulator
+    tracemalloc.start()
+    market = swiggy_market() if name == 'swiggy' else generate_market(num_bars, num_tickers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        Simulator(market=market, strategy_type=strategy_type).run_simulation(engine='vectorized')
+    result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare(old_path, new_path):
+    """Prints new/old speed ratios for the cases present in both result files."""
+    with open(old_path) as f:
+        old = {(c['dataset'], c['bars'], c['tickers']): c for c in json.load(f)['cases']}
+    with open(new_path) as f:
+        new = json.load(f)['cases']
+    print(f"{'case':<28}{'loop':>10}{'vectorized':>12}{'memory':>10}")
+    for case in new:
+        key = (case['dataset'], case['bars'], case['tickers'])
+        if key not in old:
+            continue
+        before = old[key]
+        loop = case['loop_ticks_per_second'] / before['loop_ticks_per_second']
+        vectorized = case['vectorized_ticks_per_second'] / before['vectorized_ticks_per_second']
+        memory = case['peak_memory_mb'] / before['peak_memory_mb']
+        print(f"{'%s %dx%d' % key:<28}{loop:>9.2f}x{vectorized:>11.2f}x{memory:>9.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot path.")
+    parser.add_argument('--preset', default='quick', choices=list(PRESETS))
+    parser.add_argument('--strategy', default='MovingAverageStrategy')
+    parser.add_argument('--max-loop-ticks', type=int, default=20_000,
+                        help="Cap on ticks replayed through the event loop per case")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per measurement; the best is kept")
+    parser.add_argument('--output', help="Result file (default: bench_results/<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {'environment': environment(), 'preset': args.preset, 'cases': []}
+    results['event_overhead_ns'] = event_overhead()
+    print(f"Event queue overhead: {results['event_overhead_ns']:.0f} ns/event (budget {EVENT_BUDGET_NS} ns)")
+    if results['event_overhead_ns'] > EVENT_BUDGET_NS:
+        print("Warning: event queue overhead is over budget.")
+    for name, num_bars, num_tickers in PRESETS[args.preset]:
+        case = run_case(name, num_bars, num_tickers, args.strategy, args.max_loop_ticks, args.repeat)
+        results['cases'].append(case)
+        print(f"{name:>6} {case['bars']:>10} bars x {case['tickers']:>3} tickers: "
+              f"loop {case['loop_ticks_per_second']:>10,.0f} ticks/s | "
+              f"vectorized {case['vectorized_ticks_per_second']:>12,.0f} ticks/s | "
+              f"peak {case['peak_memory_mb']:>8.1f} MB")
+
+    output = args.output or os.path.join('bench_results', f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Sim/cli.py
+#
+# Headless entry point: `python -m cli run [options]`.
+# Nothing on this path imports tkinter, matplotlib or mplfinance, so it runs on servers
+# without a display.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import pandas as pd
+
+import config
+from Analysis import Analysis
+from data_sources import DATA_SOURCES
+from Simulator import Simulator
+from Strategy import STRATEGIES, strategy_param_names
+
+def _stop_loss(value):
+    return None if value.lower() == 'none' else float(value)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Run simulations without the GUI.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Run one simulation and write metrics, equity curve and trades.")
+    run.add_argument('--tickers', nargs='+', default=config.TICKERS)
+    run.add_argument('--interval', default=config.INTERVAL)
+    run.add_argument('--start', default=config.START_DATE)
+    run.add_argument('--end', default=config.END_DATE)
+    run.add_argument('--benchmark', default=config.BENCHMARK_TICKER)
+    run.add_argument('--strategy', default=config.STRATEGY_TYPE, choices=list(STRATEGIES))
+    run.add_argument('--short-window', type=int, default=config.SHORT_WINDOW)
+    run.add_argument('--long-window', type=int, default=config.LONG_WINDOW)
+    run.add_argument('--lookback-period', type=int, default=config.LOOKBACK_PERIOD)
+    run.add_argument('--cash', type=float, default=config.INITIAL_CASH)
+    run.add_argument('--commission', type=float, default=config.COMMISSION)
+    run.add_argument('--slippage', type=float, default=config.SLIPPAGE)
+    run.add_argument('--stop-loss', type=_stop_loss, default=config.STOP_LOSS_PERCENTAGE, help="Stop-loss fraction, or 'none'")
+    run.add_argument('--engine', default='auto', choices=['auto', 'loop', 'vectorized'])
+    run.add_argument('--offline', action='store_true', help="Only use cached or local CSV data")
+    run.add_argument('--data-source', default=config.DATA_SOURCE, choices=list(DATA_SOURCES),
+                     help="'synthetic' generates deterministic bars instead of downloading")
+    run.add_argument('--stream-chunk-size', type=int, default=None,
+                     help="Stream the bars in chunks of this many ticks instead of loading them all (bounded memory)")
+    run.add_argument('--output-dir', default='results', help="Directory for the output files")
+    run.add_argument('--format', default='json', choices=['json', 'csv'])
+    run.add_argument('--verbose', action='store_true', help="Show the per-trade log of the event loop")
+    run.add_argument('--bootstrap', type=int, default=0, metavar='PATHS',
+                     help="Add 95%% block-bootstrap confidence intervals from this many resampled paths")
+    run.add_argument('--profile', action='store_true', help="Time each phase of the event loop's ticks and print a report")
+    run.add_argument('--trace', metavar='PATH', help="Write the timed phases as a Chrome trace-event JSON file (implies --profile)")
+    run.add_argument('--profile-ticks', type=int, nargs=2, metavar=('START', 'END'),
+                     help="Run cProfile over ticks [START, END) and print the top functions (implies --profile)")
+    return parser
+
+def run(args):
+    if args.offline:
+        config.OFFLINE = True
+    config.DATA_SOURCE = args.data_source
+    candidates = {'short_window': args.short_window, 'long_window': args.long_window, 'lookback_period': args.lookback_period}
+    strategy_params = {name: candidates[name] for name in strategy_param_names(args.strategy) if name in candidates}
+    simulator = Simulator(tickers=args.tickers, interval=args.interval, start_date=args.start, end_date=args.end,
+                          strategy_type=args.strategy, strategy_params=strategy_params, initial_cash=args.cash,
+                          commission=args.commission, slippage=args.slippage, stop_loss_percentage=args.stop_loss,
+                          benchmark_ticker=args.benchmark, stream_chunk_size=args.stream_chunk_size)
+
+    profiler = None
+    if args.profile or args.trace or args.profile_ticks:
+        profiler = simulator.enable_profiling(trace=bool(args.trace), profile_ticks=args.profile_ticks)
+        if args.engine == 'auto':
+            args.engine = 'loop' # Only the event loop has ticks to time
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        simulator.run_simulation(engine=args.engine)
+    if profiler is not None:
+        simulator.disable_profiling()
+        profiler.print_report()
+        if args.trace:
+            profiler.export_chrome_trace(args.trace)
+            print(f"Trace saved to {args.trace}")
+        stats = profiler.profile_stats()
+        if stats is not None:
+            stats.print_stats(20)
+
+    analysis = Analysis(simulator.portfolio_history, benchmark_history=simulator.benchmark_history or None)
+    metrics = analysis.get_metrics()
+    if args.bootstrap:
+        for name, (low, high) in analysis.get_confidence_intervals(num_paths=args.bootstrap).items():
+            metrics[f'{name}_ci_low'], metrics[f'{name}_ci_high'] = low, high
+    metrics['final_value'] = simulator.portfolio_history[-1] if simulator.portfolio_history else args.cash
+    metrics['num_trades'] = len(simulator.portfolio.trades)
+    settings = {key: value for key, value in vars(args).items()
+                if key not in ('command', 'output_dir', 'format', 'verbose', 'profile', 'trace', 'profile_ticks')}
+    write_results(simulator, metrics, settings, args.output_dir, args.format)
+    return metrics
+
+def equity_frame(simulator):
+    """The equity curve by date, with the aligned benchmark where it is available."""
+    dates = simulator.market.dates[:len(simulator.portfolio_history)]
+    equity = pd.DataFrame({'portfolio_value': simulator.portfolio_history}, index=dates)
+    benchmark = simulator.benchmark_history
+    if benchmark:
+        # The aligned benchmark drops leading ticks that have no benchmark price yet
+        offset = simulator.market.num_ticks - len(benchmark)
+        equity['benchmark'] = pd.Series(benchmark, index=simulator.market.dates[offset:]).reindex(dates)
+    return equity
+
+def trades_frame(simulator):
+    return simulator.portfolio.trades.to_frame()
+
+def write_results(simulator, metrics, settings, output_dir, output_format='json'):
+    os.makedirs(output_dir, exist_ok=True)
+    equity = equity_frame(simulator)
+    trades = trades_frame(simulator)
+    if output_format == 'json':
+        results = {
+            'settings': settings,
+            'metrics': metrics,
+            'equity': json.loads(equity.reset_index().to_json(orient='records', date_format='iso', double_precision=15)),
+            'trades': json.loads(trades.to_json(orient='records', date_format='iso', double_precision=15)),
+        }
+        path = os.path.join(output_dir, 'results.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, default=float)
+        print(f"Results saved to {path}")
+    else:
+        pd.DataFrame([{**settings, **metrics}]).to_csv(os.path.join(output_dir, 'metrics.csv'), index=False)
+        equity.to_csv(os.path.join(output_dir, 'equity.csv'))
+        trades.to_csv(os.path.join(output_dir, 'trades.csv'), index=False)
+        print(f"Results saved to {output_dir}/metrics.csv, equity.csv and trades.csv")
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'run':
+        metrics = run(args)
+        print(json.dumps(metrics, indent=2, default=float))
+
+if __name__ == '__main__':
+    main()
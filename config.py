@@ -8,6 +8,24 @@ TICKERS = ['SWIGGY.NS']
 INTERVAL = '1d'
 BENCHMARK_TICKER = '^NSEI'
 
+# --- Data Settings ---
+DATA_DIR = 'data' # CSV files written by download_data.py
+CACHE_DIR = 'data/cache' # On-disk OHLCV cache used by data_loader
+OFFLINE = False # If True, never download; use the cache and DATA_DIR CSVs only
+DATA_SOURCE = 'yahoo' # 'yahoo', 'synthetic' (generated bars, see data_sources.py), 'store' or 'delayed'
+TICK_STORE_DIR = 'data/store' # Memory-mapped tick stores, one directory per interval (see tick_store.py)
+STREAM_CHUNK_SIZE = 50_000 # Ticks per chunk when a StreamingMarket pulls bars during the run
+LOAD_WORKERS = 32 # Most tickers (or ticker batches) fetched at the same time
+LOAD_RETRIES = 2 # Retries of a fetch that failed with a network error
+LOAD_BACKOFF = 0.5 # Seconds before the first retry, doubled for every further one
+YAHOO_BATCH_SIZE = 20 # Tickers per Yahoo Finance download request
+INDICATOR_CACHE_BYTES = 512 * 2**20 # Memory for shared indicator arrays; least recently used are evicted beyond it
+INDICATOR_CACHE_PERSIST = False # If True, indicator arrays are also saved to INDICATOR_CACHE_DIR and reused by later runs
+INDICATOR_CACHE_DIR = 'data/cache/indicators'
+
+# --- Profiling Settings ---
+TRACE_MAX_EVENTS = 1_000_000 # Phase events a StepProfiler trace keeps (see profiling.py); later ones are dropped
+
 # --- Portfolio Settings ---
 COMMISSION = 0.001  # 0.1%
 SLIPPAGE = 0.0005 # 0.05%
@@ -32,3 +50,4 @@ UPDATE_DELAY = {
     '1wk': 300,
     '1mo': 500
 }
+CHART_WINDOW = 200 # Ticks visible in the live chart; the view slides forward as the simulation runs
@@ -1,28 +1,82 @@
-import yfinance as yf
+import datetime
+import hashlib
+import json
+import logging
 import os
+import threading
 import pandas as pd
 
-def load_stock_data(ticker, interval, start_date=None, end_date=None):
+import config
+
+logger = logging.getLogger("data_loader")
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# yf.download collects its results in module-global state, so two downloads must not run
+# at once; concurrency comes from downloading many tickers in one call instead
+_download_lock = threading.Lock()
+
+def load_stock_data(ticker, interval, start_date=None, end_date=None, use_cache=True, offline=None):
     """
-    Downloads historical stock data from Yahoo Finance.
+    Loads historical stock data, serving repeat requests from the local cache.
 
     Args:
         ticker (str): The stock ticker symbol (e.g., 'SWIGGY', 'SWIGGY.NS').
         interval (str): The data interval (e.g., '1m', '5m', '1h', '1d', '1wk', '1mo').
         start_date (str, optional): Start date for historical data (YYYY-MM-DD). Defaults to None.
-        end_date (str, optiona  l): End date for historical data (YYYY-MM-DD). Defaults to None.
+        end_date (str, optional): End date for historical data (YYYY-MM-DD). Defaults to None.
+        use_cache (bool, optional): Read from and write to the on-disk cache. Defaults to True.
+        offline (bool, optional): Never touch the network; only the cache and the CSV files in
+            config.DATA_DIR are used. Defaults to config.OFFLINE.
 
     Returns:
         pandas.DataFrame: Historical stock data.
     """
-    import logging
     logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger("data_loader")
-    logger.info(f"Downloading data for {ticker} at {interval} interval...")
+    if offline is None:
+        offline = config.OFFLINE
 
+    ticker = yahoo_symbol(ticker)
+
+    if not use_cache and not offline:
+        return download_stock_data(ticker, interval, start_date, end_date)
+
+    start, end = resolve_date_range(interval, start_date, end_date)
+    return get_cache().load(ticker, interval, start, end, offline=offline)
+
+def load_stock_data_batch(tickers, interval, start_date=None, end_date=None, offline=None):
+    """
+    Like load_stock_data for several tickers, downloading the ones the cache can't serve in
+    one multi-ticker request. Returns {ticker: DataFrame} (empty where nothing was found).
+    """
+    logging.basicConfig(level=logging.INFO)
+    if offline is None:
+        offline = config.OFFLINE
+    start, end = resolve_date_range(interval, start_date, end_date)
+    symbols = {ticker: yahoo_symbol(ticker) for ticker in tickers}
+    loaded = get_cache().load_many(list(dict.fromkeys(symbols.values())), interval, start, end, offline=offline)
+    return {ticker: loaded[symbol] for ticker, symbol in symbols.items()}
+
+def yahoo_symbol(ticker):
     # Append .NS for Indian stocks if no domain is specified and it's not an index
     if '.' not in ticker and not ticker.startswith('^'):
-        ticker = f"{ticker}.NS"
+        return f"{ticker}.NS"
+    return ticker
+
+def download_stock_data(ticker, interval, start_date=None, end_date=None):
+    """
+    Downloads historical stock data from Yahoo Finance, bypassing the cache.
+    """
+    try:
+        return _download(ticker, interval, start_date, end_date)
+    except Exception as e:
+        logger.error(f"Error downloading data for {ticker}: {e}")
+        return pd.DataFrame()
+
+def _download(ticker, interval, start_date=None, end_date=None):
+    # download_stock_data, raising when the download fails rather than returning an empty frame
+    import yfinance as yf
+    logger.info(f"Downloading data for {ticker} at {interval} interval...")
 
     # Only set period if start_date and end_date are not provided
     period = None
@@ -32,27 +86,291 @@ def load_stock_data(ticker, interval, start_date=None, end_date=None):
         else:
             period = "60d" # Default to 60 days for intraday intervals
 
+    with _download_lock:
+        with _DownloadErrors([ticker]):
+            if period:
+                stock_data = yf.download(ticker, start=start_date, end=end_date, interval=interval, period=period)
+            else:
+                stock_data = yf.download(ticker, start=start_date, end=end_date, interval=interval)
+
+    if stock_data.empty:
+        logger.warning(f"No data found for ticker {ticker} with interval {interval}.")
+        return pd.DataFrame()
+
+    stock_data = _normalize_columns(stock_data)
+    logger.info(f"Data downloaded successfully for {ticker}.")
+    return stock_data
+
+def download_stock_data_batch(tickers, interval, start_date, end_date):
+    """
+    Downloads several tickers from Yahoo Finance in one request, bypassing the cache.
+    Returns {ticker: DataFrame}, with an empty frame for tickers that returned no data.
+    """
     try:
-        if period:
-            stock_data = yf.download(ticker, start=start_date, end=end_date, interval=interval, period=period)
+        return _download_batch(tickers, interval, start_date, end_date)
+    except Exception as e:
+        logger.error(f"Error downloading data for {tickers}: {e}")
+        return {ticker: pd.DataFrame() for ticker in tickers}
+
+def _download_batch(tickers, interval, start_date, end_date):
+    # download_stock_data_batch, raising when the download fails for any of the tickers
+    if len(tickers) == 1:
+        return {tickers[0]: _download(tickers[0], interval, start_date, end_date)}
+    import yfinance as yf
+    logger.info(f"Downloading data for {len(tickers)} tickers at {interval} interval...")
+    with _download_lock:
+        with _DownloadErrors(tickers):
+            stock_data = yf.download(tickers, start=start_date, end=end_date, interval=interval, group_by='ticker')
+
+    frames = {}
+    for ticker in tickers:
+        if stock_data.empty or ticker not in stock_data.columns.get_level_values(0):
+            logger.warning(f"No data found for ticker {ticker} with interval {interval}.")
+            frames[ticker] = pd.DataFrame()
+            continue
+        frames[ticker] = _normalize_columns(stock_data[ticker].dropna(how='all'))
+    return frames
+
+# yfinance's messages for a range that simply has no bars, as opposed to a failed download
+NO_DATA_ERRORS = ('no price data found', 'no data found', 'possibly delisted')
+
+class _DownloadErrors(logging.Handler):
+    """
+    Raises on exit if yfinance logged a failed download (network error, rate limit) for any
+    of `tickers`. yf.download logs those and returns no rows rather than raising, which
+    would make a failure indistinguishable from a range without any bars.
+    """
+    def __init__(self, tickers):
+        super().__init__(logging.ERROR)
+        self.tickers = [ticker.upper() for ticker in tickers]
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def __enter__(self):
+        logging.getLogger('yfinance').addHandler(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        logging.getLogger('yfinance').removeHandler(self)
+        failed = [message for message in self.messages
+                  if any(ticker in message.upper() for ticker in self.tickers)
+                  and not any(text in message.lower() for text in NO_DATA_ERRORS)]
+        if exc_type is None and failed:
+            raise RuntimeError('; '.join(failed))
+
+def _attempt(download, *args):
+    """`download(*args)`, or None (logged) if it raised."""
+    try:
+        return download(*args)
+    except Exception as e:
+        logger.error(f"Error downloading data for {args[0]}: {e}")
+        return None
+
+def read_ohlcv_csv(path):
+    """
+    Reads an OHLCV CSV file, either a plain one-row header or the 3-row header
+    written by yfinance's `to_csv` (Price / Ticker / Date rows).
+    """
+    with open(path) as f:
+        first_lines = [f.readline() for _ in range(3)]
+    if first_lines[1].startswith('Ticker,') and first_lines[2].startswith('Date,'):
+        stock_data = pd.read_csv(path, header=[0, 1], index_col=0, skiprows=[2])
+    else:
+        stock_data = pd.read_csv(path, index_col=0)
+    stock_data.index = pd.to_datetime(stock_data.index)
+    return _normalize_columns(stock_data)
+
+def resolve_date_range(interval, start_date=None, end_date=None):
+    """
+    Turns optional start/end dates into a concrete [start, end) pair of YYYY-MM-DD strings,
+    using the same default periods as the download (5 years daily, 60 days intraday).
+    """
+    lookback = pd.DateOffset(years=5) if interval in ['1d', '5d', '1wk', '1mo', '3mo'] else pd.DateOffset(days=60)
+    if end_date:
+        end = pd.Timestamp(end_date)
+    else:
+        end = pd.Timestamp(datetime.date.today()) + pd.Timedelta(days=1)
+    start = pd.Timestamp(start_date) if start_date else end - lookback
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+def _normalize_columns(stock_data):
+    # Handle potential MultiIndex columns from yfinance
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        stock_data.columns = stock_data.columns.droplevel(1) # Drop the second level (e.g., the ticker)
+
+    # Rename columns to match expected format (Open, High, Low, Close, Volume)
+    stock_data.columns = [col.capitalize() for col in stock_data.columns]
+    stock_data = stock_data[OHLCV_COLUMNS]
+    stock_data.index.name = 'Date'
+    return stock_data
+
+def _slice_dates(stock_data, start, end):
+    """Rows with start <= date < end, honouring timezone-aware intraday indexes."""
+    tz = getattr(stock_data.index, 'tz', None)
+    lower = pd.Timestamp(start, tz=tz)
+    upper = pd.Timestamp(end, tz=tz)
+    return stock_data[(stock_data.index >= lower) & (stock_data.index < upper)]
+
+class OHLCVCache:
+    """
+    Local store of downloaded bars. Each (ticker, interval) series lives in one pickle named
+    by the hash of its key, next to a manifest of the [start, end) spans already fetched.
+    A request for (ticker, interval, start, end) is answered from disk when the spans cover
+    it; otherwise only the missing spans are downloaded and merged in.
+
+    Spans are only recorded up to today: bars from today on may be incomplete or not exist
+    yet, so they are downloaded again by every request that reaches them. A download that
+    returns no bars is recorded too (weekends, holidays); one that fails is not.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._memory = {} # {(ticker, interval): (frame, spans)}
+        self._write_lock = threading.Lock() # Entries may be loaded from several threads
+
+    def load(self, ticker, interval, start, end, offline=False):
+        stock_data, spans = self._read(ticker, interval)
+        missing = _missing_spans(spans, start, end)
+
+        if missing and offline:
+            if stock_data.empty:
+                return self._load_local_csv(ticker, interval, start, end)
+            logger.warning(f"Offline: cached {ticker} {interval} data does not cover {missing}.")
+        elif missing:
+            downloads = [_attempt(_download, ticker, interval, gap_start, gap_end) for gap_start, gap_end in missing]
+            stock_data = self._merge(ticker, interval, stock_data, spans, missing, downloads)
         else:
-            stock_data = yf.download(ticker, start=start_date, end=end_date, interval=interval)
-        
+            logger.info(f"Loaded {ticker} at {interval} interval from cache.")
+
         if stock_data.empty:
-            logger.warning(f"No data found for ticker {ticker} with interval {interval}.")
             return pd.DataFrame()
+        return _slice_dates(stock_data, start, end).copy()
 
-        # Handle potential MultiIndex columns from yfinance
-        if isinstance(stock_data.columns, pd.MultiIndex):
-            stock_data.columns = stock_data.columns.droplevel(1) # Drop the second level (e.g., 'Adj Close')
+    def load_many(self, tickers, interval, start, end, offline=False):
+        """
+        Like `load` for each of `tickers`. Tickers missing the same spans (typically all of
+        them, for a universe that is always loaded together) are downloaded in one request
+        per span. Returns {ticker: DataFrame}.
+        """
+        results = {}
+        groups = {} # {missing spans: tickers}
+        for ticker in tickers:
+            _, spans = self._read(ticker, interval)
+            missing = tuple(_missing_spans(spans, start, end))
+            if len(missing) and not offline:
+                groups.setdefault(missing, []).append(ticker)
+            else:
+                results[ticker] = self.load(ticker, interval, start, end, offline=offline)
 
-        # Rename columns to match expected format (Open, High, Low, Close, Volume)
-        stock_data.columns = [col.capitalize() for col in stock_data.columns]
-        stock_data = stock_data[['Open', 'High', 'Low', 'Close', 'Volume']]
-        stock_data.index.name = 'Date'
-        
-        logger.info(f"Data downloaded successfully for {ticker}.")
+        for missing, group in groups.items():
+            downloads = [_attempt(_download_batch, group, interval, gap_start, gap_end) for gap_start, gap_end in missing]
+            for ticker in group:
+                stock_data, spans = self._read(ticker, interval)
+                ticker_downloads = [frames[ticker] if frames is not None else None for frames in downloads]
+                stock_data = self._merge(ticker, interval, stock_data, spans, missing, ticker_downloads)
+                results[ticker] = _slice_dates(stock_data, start, end).copy() if not stock_data.empty else pd.DataFrame()
+        return results
+
+    def _merge(self, ticker, interval, stock_data, spans, missing, downloads):
+        # Adds the data downloaded for the `missing` spans (None where the download failed)
+        # to the entry and writes it back
+        today = datetime.date.today().strftime('%Y-%m-%d')
+        fetched = []
+        recorded = False
+        for (gap_start, gap_end), gap_data in zip(missing, downloads):
+            if gap_data is None:
+                continue # Don't record the span, so a failed download is retried next time
+            if not gap_data.empty:
+                fetched.append(gap_data)
+            covered_end = min(gap_end, today)
+            if gap_start < covered_end:
+                spans = _merge_spans(spans + [(gap_start, covered_end)])
+                recorded = True
+        if fetched:
+            stock_data = pd.concat([stock_data] + fetched) if not stock_data.empty else pd.concat(fetched)
+            stock_data = stock_data[~stock_data.index.duplicated(keep='last')].sort_index()
+        if fetched or recorded:
+            self._write(ticker, interval, stock_data, spans)
         return stock_data
-    except Exception as e:
-        logger.error(f"Error downloading data for {ticker}: {e}")
-        return pd.DataFrame()
+
+    def _load_local_csv(self, ticker, interval, start, end):
+        # The CSV files hold daily bars, so they can't stand in for any other interval
+        if interval != '1d':
+            logger.warning(f"Offline: no cached {interval} data for {ticker}; {config.DATA_DIR} CSVs only serve '1d'.")
+            return pd.DataFrame()
+        path = os.path.join(config.DATA_DIR, f"{ticker.replace('.', '_')}.csv")
+        if not os.path.exists(path):
+            logger.warning(f"Offline: no cached data or {path} for {ticker}.")
+            return pd.DataFrame()
+        logger.info(f"Offline: loading {ticker} from {path}.")
+        return _slice_dates(read_ohlcv_csv(path), start, end)
+
+    def _paths(self, ticker, interval):
+        key = hashlib.sha1(f"{ticker}|{interval}".encode()).hexdigest()[:16]
+        base = os.path.join(self.cache_dir, f"{ticker.replace('.', '_').replace('^', '')}_{interval}_{key}")
+        return base + '.pkl', base + '.json'
+
+    def _read(self, ticker, interval):
+        if (ticker, interval) in self._memory:
+            return self._memory[(ticker, interval)]
+        data_path, manifest_path = self._paths(ticker, interval)
+        stock_data, spans = pd.DataFrame(), []
+        if os.path.exists(data_path) and os.path.exists(manifest_path):
+            try:
+                with open(manifest_path) as f:
+                    spans = [tuple(span) for span in json.load(f)['spans']]
+                stock_data = pd.read_pickle(data_path)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable cache entry for {ticker} {interval}: {e}")
+                stock_data, spans = pd.DataFrame(), []
+        self._memory[(ticker, interval)] = (stock_data, spans)
+        return stock_data, spans
+
+    def _write(self, ticker, interval, stock_data, spans):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, manifest_path = self._paths(ticker, interval)
+        # Write to temporary files first so an interrupted run never leaves a torn entry
+        with self._write_lock:
+            stock_data.to_pickle(data_path + '.tmp')
+            with open(manifest_path + '.tmp', 'w') as f:
+                json.dump({'ticker': ticker, 'interval': interval, 'spans': spans}, f)
+            os.replace(data_path + '.tmp', data_path)
+            os.replace(manifest_path + '.tmp', manifest_path)
+            self._memory[(ticker, interval)] = (stock_data, spans)
+
+def _merge_spans(spans):
+    merged = []
+    for span_start, span_end in sorted(spans):
+        if merged and span_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], span_end))
+        else:
+            merged.append((span_start, span_end))
+    return merged
+
+def _missing_spans(spans, start, end):
+    """Parts of [start, end) not covered by the (sorted, merged) cached spans."""
+    missing = []
+    cursor = start
+    for span_start, span_end in spans:
+        if span_end <= cursor:
+            continue
+        if span_start >= end:
+            break
+        if span_start > cursor:
+            missing.append((cursor, span_start))
+        cursor = max(cursor, span_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+_cache = None
+
+def get_cache():
+    """Returns the process-wide cache rooted at config.CACHE_DIR."""
+    global _cache
+    if _cache is None or _cache.cache_dir != config.CACHE_DIR:
+        _cache = OHLCVCache(config.CACHE_DIR)
+    return _cache
@@ -0,0 +1,443 @@
+# Sim/data_sources.py
+#
+# Where Market gets its bars from. YahooDataSource is the default (downloads through the
+# cache in data_loader); SyntheticDataSource generates reproducible OHLCV for any number of
+# tickers without touching the network; TickStoreDataSource memory-maps a tick store;
+# DelayedDataSource stands in for a slow, flaky remote provider.
+
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import threading
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+import config
+from data_loader import load_stock_data, load_stock_data_batch, read_ohlcv_csv, resolve_date_range
+from tick_store import TickStore, store_path
+
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+# Bars per trading day for intraday intervals, for a 09:15-15:30 session
+SESSION_START = pd.Timedelta(hours=9, minutes=15)
+SESSION_MINUTES = 375
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+BARS_PER_YEAR = {'1d': 252, '5d': 252 / 5, '1wk': 52, '1mo': 12, '3mo': 4}
+PERIODIC_FREQUENCIES = {'5d': '5B', '1wk': 'W-MON', '1mo': 'MS', '3mo': 'QS'}
+
+class LoadError(Exception):
+    """A fetch that failed in a way worth retrying (a dropped connection, a rate limit)."""
+
+# Exceptions after which load_frames retries a request; anything else is a bug and propagates
+TRANSIENT_ERRORS = (LoadError, ConnectionError, TimeoutError)
+
+class DataSource:
+    """
+    Base class for Market data sources. Subclasses implement `load` for one ticker; the
+    array and chunk methods build on it unless a source can produce arrays directly.
+    Sources whose provider takes several tickers per request also override `load_batch`
+    and raise `batch_size`.
+    """
+    batch_size = 1 # Tickers per request
+    retry_empty = False # Whether an empty result may be transient, and is retried
+
+    def load(self, ticker, interval, start_date=None, end_date=None):
+        """Returns one ticker's bars as a DataFrame with OHLCV columns and a 'Date' index."""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def load_batch(self, tickers, interval, start_date=None, end_date=None):
+        """Returns {ticker: DataFrame} for one request's worth of tickers; by default one `load` each."""
+        return {ticker: self.load(ticker, interval, start_date, end_date) for ticker in tickers}
+
+    def load_frames(self, tickers, interval, start_date=None, end_date=None, max_workers=None):
+        """
+        Loads `tickers` concurrently: batches of `batch_size` go to `load_batch` on a pool of
+        up to `max_workers` (config.LOAD_WORKERS) threads, so a universe takes about as long
+        as its slowest request rather than the sum of all of them. A request that raises one
+        of TRANSIENT_ERRORS is retried up to config.LOAD_RETRIES times, after
+        config.LOAD_BACKOFF seconds doubled on every retry; so are tickers that came back
+        empty if `retry_empty`. Returns ({ticker: DataFrame} for the tickers with data,
+        {ticker: reason} for the rest).
+        """
+        tickers = list(dict.fromkeys(tickers))
+        batches = [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+        frames, failures = {}, {}
+        if len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers or config.LOAD_WORKERS, len(batches)),
+                                    thread_name_prefix='data-load') as pool:
+                results = list(pool.map(lambda batch: self._load_with_retry(batch, interval, start_date, end_date), batches))
+        else:
+            results = [self._load_with_retry(batch, interval, start_date, end_date) for batch in batches]
+        for batch_frames, batch_failures in results:
+            frames.update(batch_frames)
+            failures.update(batch_failures)
+        return frames, failures
+
+    def _load_with_retry(self, tickers, interval, start_date, end_date):
+        frames, failures = {}, {}
+        pending = tickers
+        for attempt in range(config.LOAD_RETRIES + 1):
+            if attempt:
+                time.sleep(config.LOAD_BACKOFF * 2 ** (attempt - 1))
+            try:
+                loaded = self.load_batch(pending, interval, start_date, end_date)
+            except TRANSIENT_ERRORS as e:
+                failures.update(dict.fromkeys(pending, f"{type(e).__name__}: {e}"))
+                continue
+            retry = []
+            for ticker in pending:
+                stock_data = loaded.get(ticker)
+                if stock_data is not None and not stock_data.empty:
+                    frames[ticker] = stock_data
+                    failures.pop(ticker, None)
+                else:
+                    failures[ticker] = 'no data'
+                    if self.retry_empty:
+                        retry.append(ticker)
+            pending = retry
+            if not pending:
+                break
+        return frames, failures
+
+    def load_arrays(self, tickers, interval, start_date=None, end_date=None):
+        """
+        Returns (symbols, dates, values): the tickers that have data, in the requested order,
+        the union of their dates, and a (ticker x time x field) float array with NaN where a
+        ticker has no bar. The tickers are fetched concurrently (see `load_frames`).
+        """
+        frames, failures = self.load_frames(tickers, interval, start_date, end_date)
+        all_data = {ticker: frames[ticker] for ticker in dict.fromkeys(tickers) if ticker in frames}
+        for ticker, reason in failures.items():
+            print(f"Warning: No data loaded for {ticker} ({reason}).")
+        if failures:
+            print(f"Warning: {len(failures)} of {len(all_data) + len(failures)} tickers failed to load.")
+        if not all_data:
+            return [], pd.DatetimeIndex([], name='Date'), np.empty((0, 0, len(FIELDS)))
+
+        # Outer join on the dates so every ticker keeps all of its bars
+        merged_data = pd.concat(all_data.values(), axis=1, keys=all_data.keys())
+        symbols = list(all_data)
+        values = np.empty((len(symbols), len(merged_data.index), len(FIELDS)), dtype=np.float64)
+        for i, ticker in enumerate(symbols):
+            values[i] = merged_data[ticker][list(FIELDS)].to_numpy(dtype=np.float64)
+        return symbols, pd.DatetimeIndex(merged_data.index, name='Date'), values
+
+    def iter_chunks(self, tickers, interval, start_date=None, end_date=None, chunk_size=100_000):
+        """
+        Yields (symbols, dates, values) for consecutive blocks of at most `chunk_size` ticks.
+        This default loads everything first; sources that can generate or read incrementally
+        override it so the full history never has to be in memory.
+        """
+        symbols, dates, values = self.load_arrays(tickers, interval, start_date, end_date)
+        for start in range(0, len(dates), chunk_size):
+            yield symbols, dates[start:start + chunk_size], values[:, start:start + chunk_size]
+
+class YahooDataSource(DataSource):
+    """
+    Yahoo Finance bars through the local cache (or offline CSVs, see config.OFFLINE).
+    Tickers missing from the cache are downloaded config.YAHOO_BATCH_SIZE at a time.
+    """
+    @property
+    def batch_size(self):
+        return config.YAHOO_BATCH_SIZE
+
+    @property
+    def retry_empty(self):
+        # yfinance reports a failed download as an empty frame
+        return not config.OFFLINE
+
+    def load(self, ticker, interval, start_date=None, end_date=None):
+        return load_stock_data(ticker, interval, start_date, end_date)
+
+    def load_batch(self, tickers, interval, start_date=None, end_date=None):
+        return load_stock_data_batch(tickers, interval, start_date, end_date)
+
+class SyntheticDataSource(DataSource):
+    """
+    Deterministic generated bars.
+
+    model='gbm' is geometric Brownian motion, 'jump' adds Merton jumps (Poisson arrivals of
+    normal log-jumps), and 'bootstrap' resamples blocks of consecutive real bars from the
+    CSV files in `csv_dir`. Every ticker draws from its own random streams derived from
+    `seed` and its name, so a ticker's path does not depend on which other tickers are
+    loaded, and generating in chunks gives exactly the same bars as generating at once.
+    Bars follow a weekday calendar; intraday intervals use a 09:15-15:30 session.
+    """
+    MODELS = ('gbm', 'jump', 'bootstrap')
+
+    def __init__(self, model='gbm', seed=42, drift=0.08, volatility=0.25, initial_price=100.0,
+                 jump_intensity=5.0, jump_mean=-0.02, jump_std=0.05, block_size=20, csv_dir=None,
+                 demean=True, base_volume=100_000):
+        """
+        Args:
+            drift, volatility: Annualized drift and volatility of the log price.
+            initial_price: Typical first price; each ticker is scaled around it.
+            jump_intensity: Expected jumps per year ('jump').
+            jump_mean, jump_std: Mean and standard deviation of the log jump size ('jump').
+            block_size: Length of the resampled blocks of bars ('bootstrap').
+            csv_dir: Directory of OHLCV CSVs to resample. Defaults to config.DATA_DIR.
+            demean: Remove the sample's average return before resampling ('bootstrap'), so
+                long paths built from a short trending sample don't drift to zero or explode.
+            base_volume: Typical volume per bar ('gbm' and 'jump').
+        """
+        if model not in self.MODELS:
+            raise ValueError(f"Unknown synthetic model: {model}. Choose from {self.MODELS}")
+        self.model = model
+        self.seed = seed
+        self.drift = drift
+        self.volatility = volatility
+        self.initial_price = initial_price
+        self.jump_intensity = jump_intensity
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        self.block_size = block_size
+        self.csv_dir = csv_dir
+        self.demean = demean
+        self.base_volume = base_volume
+        self._bootstrap_pool = None
+
+    def load(self, ticker, interval, start_date=None, end_date=None):
+        symbols, dates, values = self.load_arrays([ticker], interval, start_date, end_date)
+        if not symbols:
+            return pd.DataFrame()
+        return pd.DataFrame(values[0], index=dates, columns=list(FIELDS))
+
+    def load_arrays(self, tickers, interval, start_date=None, end_date=None):
+        dates = self.dates(interval, start_date, end_date)
+        values = np.empty((len(tickers), len(dates), len(FIELDS)), dtype=np.float64)
+        position = 0
+        for _, chunk_dates, chunk in self.iter_chunks(tickers, interval, start_date, end_date):
+            values[:, position:position + len(chunk_dates)] = chunk
+            position += len(chunk_dates)
+        return list(tickers), dates, values
+
+    def iter_chunks(self, tickers, interval, start_date=None, end_date=None, chunk_size=100_000):
+        tickers = list(tickers)
+        dates = self.dates(interval, start_date, end_date)
+        dt = 1.0 / _bars_per_year(interval)
+        states = [self._initial_state(ticker) for ticker in tickers]
+        for start in range(0, len(dates), chunk_size):
+            chunk_dates = dates[start:start + chunk_size]
+            yield tickers, chunk_dates, self._generate(states, len(chunk_dates), dt)
+
+    def dates(self, interval, start_date=None, end_date=None):
+        """The bar timestamps for [start_date, end_date) at `interval`."""
+        start, end = resolve_date_range(interval, start_date, end_date)
+        days = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1))
+        if interval in INTRADAY_MINUTES:
+            step = INTRADAY_MINUTES[interval]
+            offsets = SESSION_START + pd.to_timedelta(np.arange(0, SESSION_MINUTES, step), unit='min')
+            stamps = days.values[:, np.newaxis] + offsets.values[np.newaxis, :]
+            return pd.DatetimeIndex(stamps.ravel(), name='Date')
+        if interval in PERIODIC_FREQUENCIES:
+            return pd.date_range(start, pd.Timestamp(end) - pd.Timedelta(days=1),
+                                 freq=PERIODIC_FREQUENCIES[interval], name='Date')
+        if interval == '1d':
+            return pd.DatetimeIndex(days, name='Date')
+        raise ValueError(f"Unsupported interval for synthetic data: {interval}")
+
+    # --- Generation ---
+
+    def _initial_state(self, ticker):
+        # Independent streams per ticker and purpose, so draws never depend on chunking
+        sequence = np.random.SeedSequence([self.seed, zlib.crc32(ticker.encode())])
+        streams = [np.random.Generator(np.random.PCG64(child)) for child in sequence.spawn(6)]
+        log_price = np.log(self.initial_price) + 0.5 * streams[0].standard_normal()
+        return {'returns': streams[1], 'ranges': streams[2], 'volumes': streams[3], 'jumps': streams[4], 'jump_sizes': streams[5],
+                'log_close': log_price, 'close': float(np.exp(log_price)), 'pending': np.empty(0, dtype=np.int64)}
+
+    def _generate(self, states, num_bars, dt):
+        if self.model == 'bootstrap':
+            return self._generate_bootstrap(states, num_bars)
+
+        sigma = self.volatility * np.sqrt(dt)
+        log_returns = np.stack([state['returns'].standard_normal(num_bars) for state in states]) * sigma
+        drift = self.drift - 0.5 * self.volatility ** 2
+        if self.model == 'jump':
+            # Compensate the drift so jumps don't change the expected return
+            drift -= self.jump_intensity * (np.exp(self.jump_mean + 0.5 * self.jump_std ** 2) - 1)
+            counts = np.stack([state['jumps'].poisson(self.jump_intensity * dt, num_bars) for state in states])
+            sizes = np.stack([state['jump_sizes'].standard_normal(num_bars) for state in states])
+            log_returns += counts * self.jump_mean + np.sqrt(counts) * self.jump_std * sizes
+        log_returns += drift * dt
+
+        # Accumulating from the carried log price keeps chunked and one-shot paths identical
+        log_close = np.cumsum(np.concatenate([np.array([[state['log_close']] for state in states]), log_returns], axis=1), axis=1)
+        prices = np.exp(log_close)
+        open_, close = prices[:, :-1], prices[:, 1:]
+        ranges = np.abs(np.stack([state['ranges'].standard_normal(2 * num_bars).reshape(num_bars, 2) for state in states]))
+        volumes = np.stack([state['volumes'].standard_normal(num_bars) for state in states])
+
+        values = np.empty((len(states), num_bars, len(FIELDS)))
+        values[:, :, 0] = open_
+        values[:, :, 1] = np.maximum(open_, close) * np.exp(0.5 * sigma * ranges[:, :, 0])
+        values[:, :, 2] = np.minimum(open_, close) * np.exp(-0.5 * sigma * ranges[:, :, 1])
+        values[:, :, 3] = close
+        values[:, :, 4] = np.round(self.base_volume * np.exp(0.5 * volumes))
+        for state, last in zip(states, log_close[:, -1]):
+            state['log_close'] = float(last)
+        return values
+
+    def _generate_bootstrap(self, states, num_bars):
+        ratios, volume, starts = self._bootstrap_source()
+        values = np.empty((len(states), num_bars, len(FIELDS)))
+        offsets = np.arange(self.block_size)
+        for i, state in enumerate(states):
+            # Whole blocks are drawn with one uniform each; the unused tail of the last
+            # block carries over to the next chunk
+            needed = num_bars - len(state['pending'])
+            num_blocks = max(0, -(-needed // self.block_size))
+            picks = starts[(state['returns'].random(num_blocks) * len(starts)).astype(np.int64)]
+            indices = np.concatenate([state['pending'], (picks[:, np.newaxis] + offsets).ravel()])
+            state['pending'] = indices[num_bars:]
+            indices = indices[:num_bars]
+
+            prices = np.cumprod(np.concatenate([[state['close']], ratios[indices, 3]]))
+            previous, close = prices[:-1], prices[1:]
+            bars = values[i]
+            bars[:, :4] = previous[:, np.newaxis] * ratios[indices]
+            bars[:, 3] = close
+            # Rescaling can round the close a hair outside the resampled high/low
+            bars[:, 1] = np.maximum(bars[:, 1], close)
+            bars[:, 2] = np.minimum(bars[:, 2], close)
+            bars[:, 4] = volume[indices]
+            state['close'] = float(prices[-1])
+        return values
+
+    def _bootstrap_source(self):
+        """
+        OHLC of every CSV bar relative to the previous close, the volumes, and the positions
+        where a whole block fits inside one file.
+        """
+        if self._bootstrap_pool is None:
+            csv_dir = self.csv_dir or config.DATA_DIR
+            ratios, volumes, starts = [], [], []
+            offset = 0
+            for path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+                bars = read_ohlcv_csv(path)[list(FIELDS)].dropna()
+                prices = bars[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=np.float64)
+                if len(prices) <= self.block_size:
+                    continue
+                ratios.append(prices[1:] / prices[:-1, 3:4])
+                volumes.append(bars['Volume'].to_numpy(dtype=np.float64)[1:])
+                starts.append(offset + np.arange(len(prices) - self.block_size))
+                offset += len(prices) - 1
+            if not ratios:
+                raise ValueError(f"No CSV in {csv_dir} has more than {self.block_size} bars to resample")
+            ratios, starts = np.concatenate(ratios), np.concatenate(starts)
+            if self.demean:
+                # Bars in the middle of a file fall in more blocks, so weight the mean by how
+                # often each bar is drawn. Scaling all four prices keeps each bar consistent.
+                weights = np.bincount((starts[:, np.newaxis] + np.arange(self.block_size)).ravel(), minlength=len(ratios))
+                ratios /= np.exp(np.average(np.log(ratios[:, 3]), weights=weights))
+            self._bootstrap_pool = (ratios, np.concatenate(volumes), starts)
+        return self._bootstrap_pool
+
+class TickStoreDataSource(DataSource):
+    """
+    Bars from the tick stores under `path` (default config.TICK_STORE_DIR), one store per
+    interval, written by `python tick_store.py`. load_arrays returns views of the mapped
+    files, so opening years of 1-minute bars is instant and costs no memory until the ticks
+    are read. start_date/end_date are found by binary search; None means the whole store.
+    """
+    def __init__(self, path=None):
+        self.path = path or config.TICK_STORE_DIR
+        self._stores = {}
+
+    def store(self, interval):
+        if interval not in self._stores:
+            path = store_path(interval, self.path)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                raise FileNotFoundError(f"No tick store for {interval} at {path}. Write one with tick_store.py.")
+            store = TickStore(path)
+            if store.fields != FIELDS:
+                raise ValueError(f"Tick store {path} has fields {store.fields}, expected {FIELDS}")
+            self._stores[interval] = store
+        return self._stores[interval]
+
+    def load(self, ticker, interval, start_date=None, end_date=None):
+        store = self.store(interval)
+        if ticker not in store:
+            return pd.DataFrame()
+        _, dates, values = store.read([ticker], start_date, end_date)
+        return pd.DataFrame(values[0], index=dates, columns=list(FIELDS))
+
+    def load_arrays(self, tickers, interval, start_date=None, end_date=None):
+        store = self.store(interval)
+        for ticker in tickers:
+            if ticker not in store:
+                print(f"Warning: No data loaded for {ticker}.")
+        return store.read(tickers, start_date, end_date)
+
+    def __getstate__(self):
+        # Worker processes re-open the stores (and share their pages) instead of pickling them
+        state = self.__dict__.copy()
+        state['_stores'] = {}
+        return state
+
+class DelayedDataSource(DataSource):
+    """
+    A local stand-in for a remote provider, to exercise concurrent loading offline. Serves
+    the bars of `source` (a DataSource or a name; default 'synthetic') taking `batch_size`
+    tickers per request. Each request waits `latency` seconds plus up to `jitter` more, and
+    a fraction `failure_rate` of requests raise a LoadError. Tickers in `missing` come back
+    empty. The draws depend only on `seed`, the request's tickers and the attempt number.
+    """
+    def __init__(self, source='synthetic', latency=0.2, jitter=0.0, failure_rate=0.0, batch_size=1, missing=(), seed=0):
+        self.source = create_data_source(source) if isinstance(source, str) else source
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.batch_size = batch_size
+        self.missing = set(missing)
+        self.seed = seed
+        self.requests = 0 # Requests made, including failed ones
+        self._attempts = {} # {tickers: requests for them so far}
+        self._lock = threading.Lock()
+
+    def load(self, ticker, interval, start_date=None, end_date=None):
+        return self.load_batch([ticker], interval, start_date, end_date)[ticker]
+
+    def load_batch(self, tickers, interval, start_date=None, end_date=None):
+        key = ','.join(tickers)
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        rng = np.random.default_rng([self.seed, zlib.crc32(key.encode()), attempt])
+        time.sleep(self.latency + self.jitter * rng.random())
+        if rng.random() < self.failure_rate:
+            raise LoadError(f"Simulated failure fetching {key} (attempt {attempt})")
+        return {ticker: pd.DataFrame() if ticker in self.missing else self.source.load(ticker, interval, start_date, end_date)
+                for ticker in tickers}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def _bars_per_year(interval):
+    if interval in INTRADAY_MINUTES:
+        return BARS_PER_YEAR['1d'] * SESSION_MINUTES / INTRADAY_MINUTES[interval]
+    if interval in BARS_PER_YEAR:
+        return BARS_PER_YEAR[interval]
+    raise ValueError(f"Unsupported interval for synthetic data: {interval}")
+
+DATA_SOURCES = {
+    'yahoo': YahooDataSource,
+    'synthetic': SyntheticDataSource,
+    'store': TickStoreDataSource,
+    'delayed': DelayedDataSource,
+}
+
+def create_data_source(name=None, **params):
+    """Instantiates a data source by name (default config.DATA_SOURCE)."""
+    name = name or config.DATA_SOURCE
+    if name not in DATA_SOURCES:
+        raise ValueError(f"Unknown data source: {name}")
+    return DATA_SOURCES[name](**params)
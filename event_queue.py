@@ -3,8 +3,34 @@
 from collections import deque
 
 class EventQueue:
+    """
+    Event queue with a handler registry.
+
+    Handlers are registered per event class and resolved when they are registered, so
+    `dispatch` only does one dict lookup per event. Dispatch is depth-first: the events a
+    handler puts are moved onto the dispatch stack as one batch when it returns and are
+    handled next, in the order they were put. A signal's order and fill therefore complete
+    before the next signal is handled, the same sequencing as calling the components directly.
+    """
     def __init__(self):
         self._queue = deque()
+        self._stack = []
+        self._registered = {} # {event class: [handlers]} as registered
+        self._handlers = {} # {event class: tuple of handlers, including base-class handlers}
+        self._bind()
+
+    def _bind(self):
+        # The deque's own append, so putting an event costs no Python-level call
+        self.put = self._queue.append
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['put']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
 
     def put(self, event):
         self._queue.append(event)
@@ -14,3 +40,53 @@ class EventQueue:
 
     def empty(self):
         return len(self._queue) == 0
+
+    def register(self, event_type, handler):
+        """Calls `handler(event)` for every event of `event_type` (or a subclass of it)."""
+        self._registered.setdefault(event_type, []).append(handler)
+        self._resolve()
+
+    def unregister(self, event_type, handler):
+        handlers = self._registered.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        self._resolve()
+
+    def clear(self):
+        """Drops queued events; the handlers stay registered."""
+        self._queue.clear()
+        self._stack.clear()
+
+    def _resolve(self):
+        # Precompute the handler tuple of every class that can be looked up, so dispatch
+        # never walks the MRO
+        classes = set(self._registered)
+        for event_type in list(classes):
+            classes.update(_subclasses(event_type))
+        self._handlers = {
+            event_class: tuple(handler for base in reversed(event_class.__mro__)
+                               for handler in self._registered.get(base, ()))
+            for event_class in classes
+        }
+
+    def dispatch(self):
+        """Handles queued events, and the ones they produce, until the queue is empty."""
+        queue = self._queue
+        stack = self._stack
+        lookup = self._handlers.get
+        while queue:
+            # Newly put events go on top of the stack, first-put on top
+            queue.reverse()
+            stack += queue
+            queue.clear()
+            while stack:
+                event = stack.pop()
+                for handler in lookup(type(event), ()):
+                    handler(event)
+                if queue:
+                    break
+
+def _subclasses(event_type):
+    for subclass in event_type.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
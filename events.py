@@ -1,11 +1,16 @@
 # Sim/events.py
+#
+# Events carry references only (no copies) and use __slots__, since the engine creates
+# several per tick.
 
 class Event:
     """Base class for all events."""
-    pass
+    __slots__ = ()
 
 class MarketTickEvent(Event):
-    """Event generated when the market advances a tick."""
+    """Event generated when the market advances a tick. `rows` is None for batched strategies."""
+    __slots__ = ('date', 'current_prices', 'rows')
+
     def __init__(self, date, current_prices, rows):
         self.date = date
         self.current_prices = current_prices
@@ -13,6 +18,8 @@ class MarketTickEvent(Event):
 
 class SignalEvent(Event):
     """Event generated by a strategy when it produces a signal."""
+    __slots__ = ('symbol', 'signal_type', 'price', 'date')
+
     def __init__(self, symbol, signal_type, price, date):
         self.symbol = symbol
         self.signal_type = signal_type  # 'BUY' or 'SELL'
@@ -20,21 +27,29 @@ class SignalEvent(Event):
         self.date = date
 
 class OrderEvent(Event):
-    """Event generated when an order is placed."""
-    def __init__(self, order):
+    """Event generated when an order is placed. `signal` is the SignalEvent behind it, if any."""
+    __slots__ = ('order', 'signal')
+
+    def __init__(self, order, signal=None):
         self.order = order
+        self.signal = signal
 
 class FillEvent(Event):
     """Event generated when an order is filled."""
-    def __init__(self, order, fill_price, fill_quantity, commission, date):
+    __slots__ = ('order', 'fill_price', 'fill_quantity', 'commission', 'date', 'signal')
+
+    def __init__(self, order, fill_price, fill_quantity, commission, date, signal=None):
         self.order = order
         self.fill_price = fill_price
         self.fill_quantity = fill_quantity
         self.commission = commission
         self.date = date
+        self.signal = signal
 
 class PortfolioUpdateEvent(Event):
     """Event generated when the portfolio value or holdings change."""
+    __slots__ = ('total_value', 'cash', 'positions', 'current_prices', 'portfolio_history', 'benchmark_history')
+
     def __init__(self, total_value, cash, positions, current_prices, portfolio_history, benchmark_history):
         self.total_value = total_value
         self.cash = cash
@@ -45,6 +60,8 @@ class PortfolioUpdateEvent(Event):
 
 class StopLossTriggeredEvent(Event):
     """Event generated when a stop-loss is triggered."""
+    __slots__ = ('symbol', 'price', 'date')
+
     def __init__(self, symbol, price, date):
         self.symbol = symbol
         self.price = price
@@ -0,0 +1,151 @@
+# Sim/indicator_cache.py
+#
+# Full-history indicator arrays shared by every strategy in the process. An indicator of a
+# ticker's closes is computed once per (ticker, interval, date range, indicator, params) and
+# then served from memory, or from disk if the cache persists its arrays.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+import config
+
+FINGERPRINT_SAMPLES = 256 # Closes per row that go into a key, besides the row's sum
+
+class IndicatorCache:
+    """
+    Read-only indicator arrays, one per ticker, keyed by (ticker, interval, first date,
+    last date, number of ticks, fingerprint of the closes, indicator, params). The
+    fingerprint keeps different data under the same names apart (e.g. two synthetic seeds).
+
+    Arrays stay in memory up to `max_bytes`; beyond it the least recently used are evicted
+    (0 keeps nothing in memory). With `persist` they are also written to `cache_dir` and
+    read back from there by later runs and by other processes, such as sweep workers.
+    """
+    def __init__(self, max_bytes=None, cache_dir=None, persist=None):
+        self.max_bytes = config.INDICATOR_CACHE_BYTES if max_bytes is None else max_bytes
+        self.cache_dir = cache_dir or config.INDICATOR_CACHE_DIR
+        self.persist = config.INDICATOR_CACHE_PERSIST if persist is None else persist
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # {key: array}, least recently used first
+        self._lock = threading.Lock()
+
+    def indicator(self, market, function, close, *params):
+        """
+        `function(close, *params)` for the (ticker x time) `close` of `market` (e.g.
+        rolling_mean(close, 20)), assembled from the cached rows. The missing rows are
+        computed together in one call and cached.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        keys = self._keys(market, close, function.__name__, params)
+        rows = [self.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            computed = function(close[missing], *params)
+            for i, row in zip(missing, computed):
+                rows[i] = self.put(keys[i], row)
+        return np.stack(rows) if rows else np.empty(close.shape)
+
+    def get(self, key):
+        """The array cached under `key` (read-only), or None."""
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return array
+        array = self._read(key) if self.persist else None
+        if array is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return self._remember(key, array)
+
+    def put(self, key, array):
+        """Caches a copy of `array` under `key` and returns it (read-only)."""
+        array = np.array(array, dtype=np.float64)
+        if self.persist:
+            self._write(key, array)
+        return self._remember(key, array)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remember(self, key, array):
+        array.flags.writeable = False # Shared by every caller
+        if array.nbytes > self.max_bytes:
+            return array
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = array
+            self.nbytes += array.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return array
+
+    @staticmethod
+    def _keys(market, close, name, params):
+        # The data part of the key: each row's sum and a fixed sample of its values, a few
+        # array operations for all rows rather than a hash of every close
+        num_ticks = close.shape[1]
+        sample = close[:, np.linspace(0, num_ticks - 1, min(num_ticks, FINGERPRINT_SAMPLES)).astype(np.int64)]
+        fingerprints = np.concatenate([close.sum(axis=1)[:, np.newaxis], sample], axis=1)
+        dates = market.dates
+        first, last = (str(dates[0]), str(dates[-1])) if len(dates) else (None, None)
+        return [(symbol, market.interval, first, last, num_ticks, hashlib.blake2b(fingerprint.tobytes(), digest_size=16).hexdigest(), name, params)
+                for symbol, fingerprint in zip(market.symbols, fingerprints)]
+
+    def _path(self, key):
+        symbol, interval = key[0], key[1]
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{symbol.replace('.', '_').replace('^', '')}_{interval}_{key[6]}_{digest}.npy")
+
+    def _read(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable indicator cache entry {path}: {e}")
+            return None
+
+    def _write(self, key, array):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Write to a temporary file first so an interrupted run never leaves a torn entry
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            np.save(f, array)
+        os.replace(temporary, path)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_indicator_cache():
+    """The process-wide IndicatorCache, created from config on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = IndicatorCache()
+        return _cache
+
+def cached_indicator(function, close, *params, market=None):
+    """
+    `function(close, *params)` through the process-wide cache when the closes come from
+    `market`; computed directly without one.
+    """
+    if market is None:
+        return function(close, *params)
+    return get_indicator_cache().indicator(market, function, close, *params)
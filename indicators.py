@@ -0,0 +1,349 @@
+# Sim/indicators.py
+
+import math
+import numpy as np
+import pandas as pd
+
+NAN = float('nan')
+
+class RingBuffer:
+    """
+    Fixed-size circular buffer of the last `size` values. Storage is allocated once;
+    `push` overwrites the oldest value and returns it (NaN until the buffer is full).
+    """
+    __slots__ = ('size', 'count', '_values', '_index')
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("RingBuffer size must be at least 1")
+        self.size = size
+        self.count = 0
+        self._values = [NAN] * size
+        self._index = 0
+
+    def push(self, value):
+        index = self._index
+        oldest = self._values[index]
+        self._values[index] = value
+        self._index = index + 1 if index + 1 < self.size else 0
+        if self.count < self.size:
+            self.count += 1
+        return oldest
+
+    def oldest(self):
+        """The value that the next push will overwrite."""
+        return self._values[self._index]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # Oldest to newest
+        start = self._index if self.count == self.size else 0
+        for n in range(self.count):
+            yield self._values[(start + n) % self.size]
+
+class Indicator:
+    """
+    Base class for streaming indicators. `update(value)` consumes one observation in
+    constant time and returns the new indicator value, NaN until `ready`.
+    Like pandas rolling windows, a NaN input makes the value NaN while it is in the window.
+    """
+    __slots__ = ('window', 'value', '_updates', '_last_nan')
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("Indicator window must be at least 1")
+        self.window = window
+        self.value = NAN
+        self._updates = 0
+        self._last_nan = -window - 1 # Update number of the most recent NaN input
+
+    @property
+    def ready(self):
+        return self._updates >= self.window
+
+    def update(self, value):
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def _observe(self, value):
+        """Counts the update and returns True if no NaN is inside the current window."""
+        self._updates += 1
+        if value != value:
+            self._last_nan = self._updates
+        return self._updates - self._last_nan >= self.window
+
+class SMA(Indicator):
+    """Simple moving average over a running sum, re-summed exactly once per window."""
+    __slots__ = ('_buffer', '_sum')
+
+    def __init__(self, window):
+        super().__init__(window)
+        self._buffer = RingBuffer(window)
+        self._sum = 0.0
+
+    def update(self, value):
+        clean = self._observe(value)
+        oldest = self._buffer.push(value)
+        if oldest == oldest:
+            self._sum -= oldest
+        if value == value:
+            self._sum += value
+        # Re-add the window once per pass so rounding error in the running sum can't build up
+        if self._buffer._index == 0:
+            self._sum = math.fsum(v for v in self._buffer._values if v == v)
+        self.value = self._sum / self.window if clean and self.ready else NAN
+        return self.value
+
+class EMA(Indicator):
+    """Exponential moving average with alpha = 2 / (window + 1), seeded with the first value."""
+    __slots__ = ('alpha',)
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.alpha = 2.0 / (window + 1)
+
+    def update(self, value):
+        self._updates += 1
+        if value != value:
+            return self.value
+        if self.value != self.value:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+class RollingStd(Indicator):
+    """
+    Rolling standard deviation (sample, ddof=1 by default) from a running mean and sum of
+    squared deviations (Welford's update, sliding a value in and out), re-computed exactly
+    once per window. Unlike sum-of-squares, it keeps its precision on large prices.
+    """
+    __slots__ = ('ddof', '_buffer', '_count', '_mean', '_m2')
+
+    def __init__(self, window, ddof=1):
+        super().__init__(window)
+        self.ddof = ddof
+        self._buffer = RingBuffer(window)
+        self._count = 0 # Non-NaN values in the window
+        self._mean = 0.0
+        self._m2 = 0.0 # Sum of squared deviations from the mean
+
+    def update(self, value):
+        clean = self._observe(value)
+        oldest = self._buffer.push(value)
+        if oldest == oldest and value == value:
+            # Replace oldest by value
+            delta = value - oldest
+            mean = self._mean + delta / self._count
+            self._m2 += delta * (value - mean + oldest - self._mean)
+            self._mean = mean
+        elif oldest == oldest:
+            self._count -= 1
+            if self._count:
+                mean = self._mean - (oldest - self._mean) / self._count
+                self._m2 -= (oldest - self._mean) * (oldest - mean)
+                self._mean = mean
+            else:
+                self._mean = self._m2 = 0.0
+        elif value == value:
+            self._count += 1
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
+        if self._buffer._index == 0:
+            values = [v for v in self._buffer._values if v == v]
+            self._count = len(values)
+            self._mean = math.fsum(values) / len(values) if values else 0.0
+            self._m2 = math.fsum((v - self._mean) ** 2 for v in values)
+        if clean and self.ready and self.window > self.ddof:
+            variance = self._m2 / (self.window - self.ddof)
+            self.value = math.sqrt(variance) if variance > 0 else 0.0 # Rounding can leave M2 a hair below 0
+        else:
+            self.value = NAN
+        return self.value
+
+class Momentum(Indicator):
+    """Rate of change against the value `window` updates ago: (x - x_past) / x_past."""
+    __slots__ = ('_buffer',)
+
+    def __init__(self, window):
+        super().__init__(window)
+        self._buffer = RingBuffer(window + 1)
+
+    @property
+    def ready(self):
+        return self._updates > self.window
+
+    def update(self, value):
+        self._updates += 1
+        self._buffer.push(value)
+        if self._updates > self.window:
+            past = self._buffer.oldest() # window + 1 values back is the next to be overwritten
+            if past:
+                self.value = (value - past) / past
+            else:
+                # inf or NaN for a zero past value, like ArrayMomentum and rate_of_change
+                self.value = math.copysign(math.inf, value) if value and value == value else NAN
+        return self.value
+
+class _RollingExtreme(Indicator):
+    """
+    Rolling max/min with a monotonic queue kept in preallocated ring storage:
+    amortized O(1) per update, each value is pushed and popped at most once.
+    """
+    __slots__ = ('_positions', '_values', '_head', '_size')
+
+    def __init__(self, window):
+        super().__init__(window)
+        self._positions = [0] * window
+        self._values = [NAN] * window
+        self._head = 0
+        self._size = 0
+
+    def _dominates(self, new, old):
+        raise NotImplementedError
+
+    def update(self, value):
+        clean = self._observe(value)
+        now = self._updates
+        window = self.window
+        positions, values = self._positions, self._values
+        # Drop the front once it has left the window
+        if self._size and positions[self._head] <= now - window:
+            self._head = (self._head + 1) % window
+            self._size -= 1
+        if value == value:
+            # Drop queued values that can never be the extreme again
+            while self._size:
+                tail = (self._head + self._size - 1) % window
+                if not self._dominates(value, values[tail]):
+                    break
+                self._size -= 1
+            tail = (self._head + self._size) % window
+            positions[tail] = now
+            values[tail] = value
+            self._size += 1
+        self.value = values[self._head] if clean and self.ready and self._size else NAN
+        return self.value
+
+class RollingMax(_RollingExtreme):
+    __slots__ = ()
+
+    def _dominates(self, new, old):
+        return new >= old
+
+class RollingMin(_RollingExtreme):
+    __slots__ = ()
+
+    def _dominates(self, new, old):
+        return new <= old
+
+# --- Cross-ticker counterparts, used by batched strategies ---
+
+class ArrayIndicator:
+    """
+    A streaming indicator over `size` series at once (one per ticker): `update(values)`
+    consumes one observation per series with a few array operations and returns the array
+    of indicator values. Element for element it gives the same values as its scalar class.
+    """
+    __slots__ = ('window', 'value', '_updates', '_last_nan')
+
+    def __init__(self, window, size):
+        if window < 1:
+            raise ValueError("Indicator window must be at least 1")
+        self.window = window
+        self.value = np.full(size, np.nan)
+        self._updates = 0
+        self._last_nan = np.full(size, -window - 1, dtype=np.int64)
+
+    @property
+    def ready(self):
+        return self._updates >= self.window
+
+    def update(self, values):
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def _observe(self, values):
+        """Counts the update and returns a mask of the series with no NaN inside the current window."""
+        self._updates += 1
+        nan = values != values
+        if nan.any():
+            self._last_nan[nan] = self._updates
+        return self._updates - self._last_nan >= self.window
+
+def _column_sums(values):
+    # Sums down the columns with Neumaier compensation, which rounds like math.fsum
+    # but for pathological inputs (at a few array operations per row rather than a call per column)
+    total = values[0].copy()
+    compensation = np.zeros_like(total)
+    for row in values[1:]:
+        new_total = total + row
+        compensation += np.where(np.abs(total) >= np.abs(row), (total - new_total) + row, (row - new_total) + total)
+        total = new_total
+    return total + compensation
+
+class ArraySMA(ArrayIndicator):
+    """SMA of each series, from a (window x size) ring of rows and a running sum re-summed once per window."""
+    __slots__ = ('_values', '_index', '_sum')
+
+    def __init__(self, window, size):
+        super().__init__(window, size)
+        self._values = np.full((window, size), np.nan)
+        self._index = 0
+        self._sum = np.zeros(size)
+
+    def update(self, values):
+        clean = self._observe(values)
+        row = self._values[self._index]
+        # NaN inputs are left out of the sum, like SMA
+        self._sum -= np.where(row == row, row, 0.0)
+        row[:] = values
+        self._sum += np.where(row == row, row, 0.0)
+        self._index += 1
+        if self._index == self.window:
+            self._index = 0
+            self._sum = _column_sums(np.where(self._values == self._values, self._values, 0.0))
+        if self.ready:
+            self.value = np.where(clean, self._sum / self.window, np.nan)
+        return self.value
+
+class ArrayMomentum(ArrayIndicator):
+    """Momentum of each series: (x - x_past) / x_past against the row `window` updates ago."""
+    __slots__ = ('_values', '_index')
+
+    def __init__(self, window, size):
+        super().__init__(window, size)
+        self._values = np.full((window + 1, size), np.nan)
+        self._index = 0
+
+    @property
+    def ready(self):
+        return self._updates > self.window
+
+    def update(self, values):
+        self._updates += 1
+        self._values[self._index] = values
+        self._index = self._index + 1 if self._index < self.window else 0
+        if self._updates > self.window:
+            past = self._values[self._index]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.value = (values - past) / past
+        return self.value
+
+# --- Whole-history counterparts, used by the vectorized engine ---
+
+def rolling_mean(values, window):
+    """Rolling mean along the last axis of a 1-D or (ticker x time) array; NaN until full."""
+    values = np.asarray(values, dtype=np.float64)
+    frame = pd.DataFrame(np.atleast_2d(values).T)
+    result = frame.rolling(window=window).mean().to_numpy().T
+    return result.reshape(values.shape)
+
+def rate_of_change(values, window):
+    """(x[t] - x[t - window]) / x[t - window] along the last axis; NaN for the first `window` ticks."""
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(values.shape, np.nan)
+    past = values[..., :-window]
+    result[..., window:] = (values[..., window:] - past) / past
+    return result
@@ -0,0 +1,202 @@
+# Sim/live_chart.py
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+import config
+from data_sources import FIELDS
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = (FIELDS.index(field) for field in ('Open', 'High', 'Low', 'Close', 'Volume'))
+UP_COLOR = np.array(to_rgba('green'))
+DOWN_COLOR = np.array(to_rgba('red'))
+BODY_WIDTH = 0.6
+Y_PADDING = 0.2 # Fraction of the data range added above and below when the y limits are refitted,
+                # so the data can move a while before the limits (and a full draw) are needed again
+
+class LiveChart:
+    """
+    Incremental candlestick, volume and equity chart of one ticker for the Visualizer.
+
+    The x axis is the tick number. A viewport of `window` ticks stays fixed until the latest
+    tick reaches its right edge, then jumps forward by half a window. While the viewport and
+    the y limits still fit the data, a frame restores the saved background and redraws only
+    the data artists (blitting). Axes, ticks and grid are redrawn only when the limits change.
+    A frame therefore costs O(window), however many ticks have been simulated.
+    """
+    def __init__(self, fig, ax, vol_ax, equity_ax, window=None):
+        self.fig = fig
+        self.ax = ax
+        self.vol_ax = vol_ax
+        self.equity_ax = equity_ax
+        self.canvas = fig.canvas
+        self.window = window or config.CHART_WINDOW
+
+        self.bodies = PolyCollection([], animated=True)
+        self.wicks = LineCollection([], linewidths=1, animated=True)
+        self.volumes = PolyCollection([], animated=True)
+        ax.add_collection(self.wicks)
+        ax.add_collection(self.bodies)
+        vol_ax.add_collection(self.volumes)
+        self.buy_markers, = ax.plot([], [], '^', markersize=10, color='green', label='Buy', alpha=0.7, animated=True)
+        self.sell_markers, = ax.plot([], [], 'v', markersize=10, color='red', label='Sell', alpha=0.7, animated=True)
+        self.equity_line, = equity_ax.plot([], [], color='purple', animated=True)
+        self.artists = (self.wicks, self.bodies, self.volumes, self.buy_markers, self.sell_markers, self.equity_line)
+
+        for axis in (ax, vol_ax, equity_ax):
+            axis.grid(True, color='gray', alpha=0.3)
+            axis.xaxis.set_major_locator(MaxNLocator(nbins=6, integer=True))
+        vol_ax.xaxis.set_major_formatter(FuncFormatter(self._format_date))
+        vol_ax.tick_params(axis='x', labelbottom=True)
+        equity_ax.set_title('Portfolio Equity Curve')
+        equity_ax.set_xlabel('Time (Ticks)')
+        equity_ax.set_ylabel('Portfolio Value')
+
+        self._background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.market = None
+        self.symbol = None
+        self.reset()
+
+    def set_market(self, market, symbol=None):
+        """Charts `market` (e.g. after new data was loaded) from its first tick."""
+        self.market = market
+        self.symbol = None
+        self.set_symbol(symbol)
+
+    def set_symbol(self, symbol):
+        self.symbol = symbol if self.market is not None and symbol in self.market.symbols else None
+        self._row = self.market.symbols.index(self.symbol) if self.symbol is not None else None
+        self.reset()
+
+    def reset(self):
+        """Empties the chart; the next `update` redraws it in full."""
+        self._view_start = 0
+        self._stale = True # Limits changed: the next frame is a full draw
+        self._reset_trades()
+        self.bodies.set_verts([])
+        self.volumes.set_verts([])
+        self.wicks.set_segments([])
+        for line in (self.buy_markers, self.sell_markers, self.equity_line):
+            line.set_data([], [])
+        self._set_xlim()
+
+    def _reset_trades(self):
+        self._trade_x = np.empty(0, dtype=np.int64) # x (tick) of the chart symbol's trades mapped so far
+        self._trade_price = np.empty(0)
+        self._trade_buy = np.empty(0, dtype=bool)
+        self._mapped_trades = 0
+
+    def update(self, tick, portfolio_history, trades):
+        """
+        Shows the chart symbol's bars before `tick` (the market's current_tick), the trade
+        markers and the equity curve, and puts the frame on screen.
+        """
+        self.prepare(tick, portfolio_history, trades)
+        self.show()
+
+    def prepare(self, tick, portfolio_history, trades):
+        """The data half of `update`: reads the simulation state into the artists without drawing."""
+        if tick > self._view_start + self.window:
+            self._view_start = max(0, tick - self.window // 2)
+            self._set_xlim()
+        start = self._view_start
+        if self._row is not None:
+            self._update_bars(start, tick)
+            self._update_trades(start, tick, trades)
+        self._update_equity(start, tick, portfolio_history)
+
+    def _update_bars(self, start, end):
+        bars = self.market.values[self._row, start:end]
+        loaded = ~np.isnan(bars[:, CLOSE])
+        bars = bars[loaded]
+        x = np.arange(start, end)[loaded]
+        opens, highs, lows, closes, volumes = bars[:, OPEN], bars[:, HIGH], bars[:, LOW], bars[:, CLOSE], bars[:, VOLUME]
+        colors = np.where((closes >= opens)[:, None], UP_COLOR, DOWN_COLOR)
+
+        left, right = x - BODY_WIDTH / 2, x + BODY_WIDTH / 2
+        self.bodies.set_verts(_rectangles(left, right, np.minimum(opens, closes), np.maximum(opens, closes)))
+        self.bodies.set_facecolors(colors)
+        self.bodies.set_edgecolors(colors)
+        self.wicks.set_segments(np.stack([np.column_stack([x, lows]), np.column_stack([x, highs])], axis=1))
+        self.wicks.set_colors(colors)
+        volumes = np.nan_to_num(volumes)
+        self.volumes.set_verts(_rectangles(left, right, np.zeros_like(volumes), volumes))
+        self.volumes.set_facecolors(colors)
+
+        if len(bars):
+            self._fit_ylim(self.ax, np.nanmin(lows), np.nanmax(highs))
+            self._fit_ylim(self.vol_ax, 0.0, volumes.max())
+
+    def _update_trades(self, start, end, trades):
+        # Map only the trades added since the last frame to ticks, through the hash index of
+        # the market's dates, and keep the results: trades are chronological, so the visible
+        # ones are a searchsorted slice
+        indices = trades.symbol_indices(self.symbol)
+        if len(indices) < self._mapped_trades:
+            self._reset_trades() # The ledger was cleared
+        new = indices[self._mapped_trades:]
+        if len(new):
+            x = self.market.dates.get_indexer(trades.dates_at(new))
+            self._trade_x = np.concatenate([self._trade_x, x])
+            self._trade_price = np.concatenate([self._trade_price, trades.price[new]])
+            self._trade_buy = np.concatenate([self._trade_buy, trades.side[new] > 0])
+            self._mapped_trades = len(indices)
+        first, last = np.searchsorted(self._trade_x, [start, end])
+        x = self._trade_x[first:last]
+        prices = self._trade_price[first:last]
+        buys = self._trade_buy[first:last]
+        self.buy_markers.set_data(x[buys], prices[buys])
+        self.sell_markers.set_data(x[~buys], prices[~buys])
+
+    def _update_equity(self, start, end, portfolio_history):
+        # The history's last value belongs to the latest tick
+        first_tick = end - len(portfolio_history)
+        visible = max(start, first_tick)
+        values = np.asarray(portfolio_history[visible - first_tick:], dtype=float)
+        self.equity_line.set_data(np.arange(visible, visible + len(values)), values)
+        if len(values):
+            self._fit_ylim(self.equity_ax, values.min(), values.max())
+
+    def _fit_ylim(self, axis, low, high):
+        # Only moved (forcing a full draw) when the data leaves the current limits, or when the
+        # viewport jumps and the limits are refitted to what is visible
+        bottom, top = axis.get_ylim()
+        if self._stale or low < bottom or high > top:
+            padding = (high - low) * Y_PADDING or abs(high) * Y_PADDING or 1.0
+            axis.set_ylim(low - padding, high + padding)
+            self._stale = True
+
+    def _set_xlim(self):
+        limits = (self._view_start - 0.5, self._view_start + self.window - 0.5)
+        for axis in (self.ax, self.vol_ax, self.equity_ax):
+            axis.set_xlim(*limits)
+        self._stale = True
+
+    def show(self):
+        """Puts the prepared frame on screen: a blit, or a full draw if the limits changed."""
+        if self._stale or self._background is None:
+            self._stale = False
+            self.canvas.draw() # Redraws the static parts, then _on_draw adds the artists
+            return
+        self.canvas.restore_region(self._background)
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+
+    def _on_draw(self, event):
+        # Any full draw (including a window resize) refreshes the saved background
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def _format_date(self, x, position=None):
+        tick = int(round(x))
+        if self.market is None or not 0 <= tick < self.market.num_ticks:
+            return ''
+        return self.market.dates[tick].strftime('%y-%m-%d %H:%M' if self.market.interval[-1] in 'mh' else '%Y-%m-%d')
+
+def _rectangles(left, right, bottom, top):
+    """(n, 4, 2) vertices of n axis-aligned rectangles."""
+    return np.stack([np.column_stack([left, bottom]), np.column_stack([left, top]),
+                     np.column_stack([right, top]), np.column_stack([right, bottom])], axis=1)
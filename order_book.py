@@ -0,0 +1,132 @@
+# Sim/order_book.py
+
+import heapq
+import itertools
+
+class _SymbolBook:
+    """
+    Resting orders of one symbol in two heaps keyed by trigger level:
+    `below` fires when the price falls to the level (buy limits, sell stops), highest level
+    first; `above` fires when the price rises to it (sell limits, buy stops), lowest first.
+    Ties are broken by arrival order.
+    """
+    __slots__ = ('below', 'above', 'live', 'cancelled')
+
+    def __init__(self):
+        self.below = [] # (-level, seq, order, signal)
+        self.above = [] # (level, seq, order, signal)
+        self.live = 0
+        self.cancelled = 0 # Cancelled entries still sitting in the heaps
+
+class OrderBook:
+    """
+    Index of resting limit and stop orders, per symbol, in price-sorted heaps. Matching a
+    tick only pops the orders whose level the price crossed; adding is O(log n) and
+    cancelling takes the order out of the live set, leaving its heap entry to be dropped
+    when it reaches the top (a symbol's heaps are compacted once they hold more cancelled
+    entries than live ones).
+    """
+    def __init__(self):
+        self._books = {} # {symbol: _SymbolBook}
+        self._resting = set() # Live orders
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._resting)
+
+    def __contains__(self, order):
+        return order in self._resting
+
+    def add(self, order, fires_below, signal=None):
+        """
+        Rests `order` at `order.price`. `fires_below` says whether it triggers when the price
+        falls to that level (True) or rises to it (False).
+        """
+        book = self._books.get(order.symbol)
+        if book is None:
+            book = self._books[order.symbol] = _SymbolBook()
+        if fires_below:
+            heapq.heappush(book.below, (-order.price, next(self._sequence), order, signal))
+        else:
+            heapq.heappush(book.above, (order.price, next(self._sequence), order, signal))
+        book.live += 1
+        self._resting.add(order)
+
+    def cancel(self, order):
+        """Removes a resting order. Returns False if it was not resting."""
+        if order not in self._resting:
+            return False
+        self._resting.remove(order)
+        book = self._books[order.symbol]
+        book.live -= 1
+        book.cancelled += 1
+        if book.cancelled > book.live:
+            self._compact(order.symbol, book)
+        return True
+
+    def clear(self):
+        self.__init__()
+
+    def __getstate__(self):
+        # Pickle the next sequence number rather than the counter, which newer Pythons can't pickle
+        state = self.__dict__.copy()
+        state['_sequence'] = next(self._sequence)
+        self._sequence = itertools.count(state['_sequence'])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sequence = itertools.count(state['_sequence'])
+
+    def _compact(self, symbol, book):
+        resting = self._resting
+        book.below = [entry for entry in book.below if entry[2] in resting]
+        book.above = [entry for entry in book.above if entry[2] in resting]
+        heapq.heapify(book.below)
+        heapq.heapify(book.above)
+        book.cancelled = 0
+        if not book.live:
+            del self._books[symbol]
+
+    def match(self, current_prices, execute):
+        """
+        For every symbol with resting orders, pops the orders crossed by its current price in
+        priority order and calls `execute(order, price)`. Orders that fail to execute
+        (e.g. not enough cash) stay in the book. Returns the (order, signal) pairs executed.
+        """
+        filled = []
+        for symbol, book in list(self._books.items()):
+            price = current_prices.get(symbol)
+            if price is None:
+                continue
+            below, above = book.below, book.above
+            if (not below or -below[0][0] < price) and (not above or above[0][0] > price):
+                continue # Nothing crossed
+            retry = []
+            while below and -below[0][0] >= price:
+                self._fire(book, heapq.heappop(below), price, execute, filled, retry, below)
+            while above and above[0][0] <= price:
+                self._fire(book, heapq.heappop(above), price, execute, filled, retry, above)
+            for heap, entry in retry:
+                heapq.heappush(heap, entry)
+            if not below and not above:
+                del self._books[symbol]
+        return filled
+
+    def _fire(self, book, entry, price, execute, filled, retry, heap):
+        order, signal = entry[2], entry[3]
+        if order not in self._resting:
+            book.cancelled -= 1 # A cancelled order reaching the top
+        elif execute(order, price):
+            self._resting.remove(order)
+            book.live -= 1
+            filled.append((order, signal))
+        else:
+            retry.append((heap, entry))
+
+    def orders(self, symbol=None):
+        """The resting orders (of `symbol`, if given), oldest first."""
+        books = self._books.values() if symbol is None else [self._books[symbol]] if symbol in self._books else []
+        entries = [entry for book in books for heap in (book.below, book.above) for entry in heap
+                   if entry[2] in self._resting]
+        return [entry[2] for entry in sorted(entries, key=lambda entry: entry[1])]
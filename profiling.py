@@ -0,0 +1,146 @@
+# Sim/profiling.py
+#
+# Instrumentation of Simulator.step, switched on at runtime: per-phase timers and counters,
+# a ticks-per-second gauge, cProfile capture over a range of ticks, and a trace that exports
+# to Chrome's trace-event format (chrome://tracing, https://ui.perfetto.dev).
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+
+import config
+
+# The phases of a tick, in the order Simulator.step runs them:
+#   advance          Market.advance_tick (and the per-ticker rows for per-symbol strategies)
+#   prices           Market.get_current_prices
+#   portfolio_value  valuing the portfolio for the history
+#   orders           filling resting limit and stop orders
+#   stop_loss        the stop-loss check
+#   signals          the strategy's signal generation
+#   dispatch         the events that follow: signals -> orders -> fills
+PHASES = ('advance', 'prices', 'portfolio_value', 'orders', 'stop_loss', 'signals', 'dispatch')
+
+class StepProfiler:
+    """
+    Times the phases of every Simulator.step (see Simulator.enable_profiling). `totals`
+    and `counts` accumulate per phase; other code, such as the GUI, adds its own phases
+    with `record`. `ticks_per_second` is a gauge over the last `rate_window` seconds.
+
+    With `trace`, each timed phase is also kept as an event (up to `max_trace_events`;
+    later ones are only counted in `dropped_events`) for export_chrome_trace. With
+    `profile_ticks=(start, end)`, cProfile runs over ticks [start, end) and
+    `profile_stats()` returns what it recorded.
+    """
+    def __init__(self, trace=False, profile_ticks=None, max_trace_events=None, rate_window=1.0):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.ticks = 0
+        self.trace = trace
+        self.max_trace_events = config.TRACE_MAX_EVENTS if max_trace_events is None else max_trace_events
+        self.trace_events = [] # (phase, start, end, thread id, tick)
+        self.dropped_events = 0
+        self.profile_ticks = profile_ticks
+        self.rate_window = rate_window
+        self._profile = cProfile.Profile() if profile_ticks is not None else None
+        self._profiling = False
+        self._captured = False
+        self._tick = None
+        self._started = self._last = time.perf_counter()
+        self._rate_time = self._started
+        self._rate_ticks = 0
+        self._rate = None
+
+    def start_tick(self, tick):
+        """Called by Simulator.step before the market advances to tick number `tick`."""
+        self._tick = tick
+        if self._profile is not None:
+            start, end = self.profile_ticks
+            if start <= tick < end and not self._profiling:
+                self._profile.enable()
+                self._profiling = self._captured = True
+            elif tick >= end and self._profiling:
+                self.stop()
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Ends `phase` of the current tick, which started when the previous one ended."""
+        now = time.perf_counter()
+        self.totals[phase] += now - self._last
+        self.counts[phase] += 1
+        if self.trace:
+            self._add_event(phase, self._last, now, threading.get_ident(), self._tick)
+        self._last = now
+
+    def end_tick(self):
+        """Called by Simulator.step once the tick's events are dispatched."""
+        self.lap('dispatch')
+        self.ticks += 1
+        if self._last - self._rate_time >= self.rate_window:
+            self._rate = (self.ticks - self._rate_ticks) / (self._last - self._rate_time)
+            self._rate_time, self._rate_ticks = self._last, self.ticks
+
+    def record(self, phase, start, end):
+        """Adds a phase timed outside Simulator.step, from time.perf_counter() readings."""
+        self.totals[phase] = self.totals.get(phase, 0.0) + end - start
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        if self.trace:
+            self._add_event(phase, start, end, threading.get_ident(), None)
+
+    def _add_event(self, phase, start, end, thread_id, tick):
+        if len(self.trace_events) < self.max_trace_events:
+            self.trace_events.append((phase, start, end, thread_id, tick))
+        else:
+            self.dropped_events += 1
+
+    def stop(self):
+        """Ends the cProfile capture, if one is running."""
+        if self._profiling:
+            self._profile.disable()
+            self._profiling = False
+
+    @property
+    def ticks_per_second(self):
+        """Ticks per second over the last full `rate_window` (over the whole run before one has passed)."""
+        if self._rate is not None:
+            return self._rate
+        elapsed = self._last - self._started
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """{phase: {'total_s', 'count', 'mean_us', 'share'}}, `share` being the fraction of all timed phases."""
+        total = sum(self.totals.values())
+        return {phase: {'total_s': seconds, 'count': self.counts[phase],
+                        'mean_us': seconds / self.counts[phase] * 1e6 if self.counts[phase] else 0.0,
+                        'share': seconds / total if total else 0.0}
+                for phase, seconds in self.totals.items()}
+
+    def print_report(self):
+        print(f"Ticks: {self.ticks} ({self.ticks_per_second:,.0f} ticks/s)")
+        print(f"{'Phase':<16}{'Total (s)':>12}{'Count':>12}{'Mean (us)':>12}{'Share':>8}")
+        for phase, row in self.summary().items():
+            print(f"{phase:<16}{row['total_s']:>12.4f}{row['count']:>12}{row['mean_us']:>12.2f}{row['share']:>8.1%}")
+
+    def profile_stats(self, sort='cumulative'):
+        """The pstats.Stats of the cProfile capture (None without `profile_ticks` or before it ran)."""
+        if not self._captured:
+            return None
+        self.stop()
+        return pstats.Stats(self._profile).sort_stats(sort)
+
+    def export_chrome_trace(self, path):
+        """Writes the trace as Chrome trace-event JSON: one complete ('X') event per timed phase."""
+        pid = os.getpid()
+        origin = self._started
+        events = [{'name': phase, 'cat': 'step' if tick is not None else 'app', 'ph': 'X',
+                   'ts': (start - origin) * 1e6, 'dur': (end - start) * 1e6, 'pid': pid, 'tid': thread_id,
+                   'args': {'tick': tick} if tick is not None else {}}
+                  for phase, start, end, thread_id, tick in self.trace_events]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'ticks': self.ticks, 'dropped_events': self.dropped_events}}, f)
@@ -0,0 +1,114 @@
+# Sim/sim_worker.py
+
+import queue
+import threading
+
+# Steps per GUI frame for each speed setting; None runs the simulation as fast as it can
+SPEEDS = {'1x': 1, '10x': 10, '100x': 100, 'max': None}
+MAX_BATCH = 1000 # Most steps taken between two snapshots
+
+class Snapshot:
+    """The portfolio state after the worker's latest batch of steps."""
+    __slots__ = ('tick', 'date', 'total_value', 'cash', 'positions', 'current_prices', 'finished')
+
+    def __init__(self, tick, date, total_value, cash, positions, current_prices, finished):
+        self.tick = tick
+        self.date = date
+        self.total_value = total_value
+        self.cash = cash
+        self.positions = positions
+        self.current_prices = current_prices
+        self.finished = finished
+
+class SimulationWorker:
+    """
+    Runs Simulator.step on a background thread, so a slow step never blocks the GUI and
+    the replay speed is no longer tied to the frame rate.
+
+    Each GUI frame calls `request(n)` to let the worker take up to n more steps (None for
+    no limit) and `latest()` to get the newest Snapshot, skipping any older ones. The
+    budget is replaced, not added to, so a worker that falls behind skips ahead instead of
+    building a backlog. The worker holds `lock` while it steps; anything else that reads or
+    changes the simulator (the chart, manual trades) must hold it too.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.lock = threading.Lock()
+        self.snapshots = queue.Queue()
+        self._condition = threading.Condition()
+        self._budget = 0
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='simulation-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread after its current batch and discards unread snapshots."""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        self._budget = 0
+        self.latest()
+
+    def request(self, steps):
+        with self._condition:
+            self._budget = steps
+            self._condition.notify()
+
+    def pause(self):
+        self.request(0)
+
+    def latest(self):
+        """The newest unread snapshot, or None."""
+        snapshot = None
+        while True:
+            try:
+                snapshot = self.snapshots.get_nowait()
+            except queue.Empty:
+                return snapshot
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._budget == 0 and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                batch = MAX_BATCH if self._budget is None else min(self._budget, MAX_BATCH)
+
+            steps = 0
+            finished = False
+            with self.lock:
+                while steps < batch:
+                    if not self.simulator.step():
+                        finished = True
+                        break
+                    steps += 1
+                snapshot = self._snapshot(finished)
+
+            with self._condition:
+                if finished:
+                    self._budget = 0
+                elif self._budget is not None:
+                    self._budget = max(0, self._budget - steps)
+            self.snapshots.put(snapshot)
+
+    def _snapshot(self, finished):
+        market = self.simulator.market
+        portfolio = self.simulator.portfolio
+        tick = market.current_tick
+        current_prices = market.get_current_prices()
+        # Valued like Simulator.update_portfolio_history (position vector . price vector), but
+        # after the tick's fills, to match the cash and positions
+        return Snapshot(tick, market.dates[tick - 1] if tick > 0 else None,
+                        portfolio.get_total_value_array(market.get_current_price_array()) if current_prices else None,
+                        portfolio.cash, dict(portfolio.positions), current_prices, finished)
@@ -0,0 +1,217 @@
+# Sim/sweep.py
+
+import argparse
+import contextlib
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+import config
+from Analysis import Analysis
+from data_sources import DATA_SOURCES, TickStoreDataSource
+from Market import Market
+from Simulator import Simulator
+from Strategy import STRATEGIES, strategy_param_names
+from vectorized import run_vectorized
+
+PORTFOLIO_PARAMS = ('commission', 'slippage', 'stop_loss_percentage')
+
+def expand_grid(grid):
+    """
+    Turns a grid such as {'strategy_type': [...], 'short_window': [5, 10], 'commission': [0.001]}
+    into one parameter dict per combination. Each strategy only varies the parameters it
+    accepts, and moving-average combinations with short_window >= long_window are skipped.
+    """
+    combinations = []
+    for strategy_type in grid.get('strategy_type', [config.STRATEGY_TYPE]):
+        if strategy_type not in STRATEGIES:
+            raise ValueError(f"Unknown strategy type: {strategy_type}")
+        names = [name for name in strategy_param_names(strategy_type) + PORTFOLIO_PARAMS if name in grid]
+        for values in itertools.product(*(grid[name] for name in names)):
+            params = {'strategy_type': strategy_type, **dict(zip(names, values))}
+            if 'short_window' in params and 'long_window' in params and params['short_window'] >= params['long_window']:
+                continue
+            combinations.append(params)
+    return combinations
+
+def run_combination(market, params, engine="auto", initial_cash=config.INITIAL_CASH, signals=None, history=None):
+    """
+    Runs one simulation on `market` (which must be at tick 0) and returns the parameters
+    together with the Analysis metrics. `signals`, if given, are precomputed
+    (entries, exits) for the vectorized engine. The equity curve is appended to `history`
+    if a list is passed.
+    """
+    strategy_type = params['strategy_type']
+    strategy_params = {name: params[name] for name in strategy_param_names(strategy_type) if name in params}
+    simulator = Simulator(market=market, strategy_type=strategy_type, strategy_params=strategy_params,
+                          initial_cash=initial_cash,
+                          commission=params.get('commission', config.COMMISSION),
+                          slippage=params.get('slippage', config.SLIPPAGE),
+                          stop_loss_percentage=params.get('stop_loss_percentage', config.STOP_LOSS_PERCENTAGE))
+    # The event loop prints every trade; keep worker output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        if signals is not None:
+            run_vectorized(simulator, signals=signals)
+        else:
+            simulator.run_simulation(engine=engine)
+    if history is not None:
+        history.extend(simulator.portfolio_history)
+
+    analysis = Analysis(simulator.portfolio_history, benchmark_history=simulator.benchmark_history or None)
+    metrics = analysis.get_metrics()
+    metrics['final_value'] = simulator.portfolio_history[-1] if simulator.portfolio_history else initial_cash
+    metrics['num_trades'] = len(simulator.portfolio.trades)
+    return {**params, **metrics}
+
+class SharedMarketData:
+    """
+    A Market's (ticker x time x field) array copied once into shared memory, with the small
+    metadata workers need to rebuild a Market around it without copying. A Market read from
+    a tick store isn't copied at all: the workers map the same store files.
+    """
+    def __init__(self, market):
+        self._shm = None
+        self.spec = {
+            'symbols': market.symbols,
+            'dates': market.dates,
+            'interval': market.interval,
+            'benchmark_data': market.benchmark_data,
+        }
+        if isinstance(market.data_source, TickStoreDataSource):
+            self.spec['store'] = (market.data_source, market.start_date, market.end_date)
+            return
+        self._shm = shared_memory.SharedMemory(create=True, size=max(market.values.nbytes, 1))
+        shared_values = np.ndarray(market.values.shape, dtype=market.values.dtype, buffer=self._shm.buf)
+        shared_values[...] = market.values
+        self.spec.update(name=self._shm.name, shape=market.values.shape, dtype=market.values.dtype.str)
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def attach_market_values(spec):
+    """
+    In a worker process: the market array described by a SharedMarketData spec, and the
+    shared memory block holding it (None for a tick store). Keep the block referenced for
+    as long as the array is used.
+    """
+    if 'store' in spec:
+        data_source, start_date, end_date = spec['store']
+        _, _, values = data_source.store(spec['interval']).read(spec['symbols'], start_date, end_date)
+        return None, values
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    values = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+    values.flags.writeable = False
+    return shm, values
+
+_worker = {}
+
+def _init_worker(spec, engine, initial_cash):
+    shm, values = attach_market_values(spec)
+    _worker.update(shm=shm, values=values, spec=spec, engine=engine, initial_cash=initial_cash)
+
+def _run_in_worker(params):
+    spec = _worker['spec']
+    market = Market.from_arrays(spec['symbols'], spec['dates'], _worker['values'], spec['interval'],
+                                benchmark_data=spec['benchmark_data'])
+    return run_combination(market, params, _worker['engine'], _worker['initial_cash'])
+
+def run_sweep(market, grid, max_workers=None, engine="auto", initial_cash=config.INITIAL_CASH):
+    """
+    Runs the Simulator for every combination in `grid` (see `expand_grid`) on a process pool
+    and returns a DataFrame with one row of parameters and metrics per combination.
+    The market data is shared with the workers through shared memory (or the mapped tick
+    store), not pickled per task.
+    """
+    combinations = expand_grid(grid)
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(combinations) <= 1:
+        rows = []
+        for params in combinations:
+            view = Market.from_arrays(market.symbols, market.dates, market.values, market.interval,
+                                      benchmark_data=market.benchmark_data)
+            rows.append(run_combination(view, params, engine, initial_cash))
+        return _results_frame(rows, combinations)
+
+    with SharedMarketData(market) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(shared.spec, engine, initial_cash)) as executor:
+            chunksize = max(1, len(combinations) // (max_workers * 4))
+            rows = list(executor.map(_run_in_worker, combinations, chunksize=chunksize))
+    return _results_frame(rows, combinations)
+
+def _results_frame(rows, combinations):
+    # Parameter columns first (strategies vary different ones), then the metrics
+    param_columns = list(dict.fromkeys(name for params in combinations for name in params))
+    metric_columns = [name for name in (rows[0] if rows else {}) if name not in param_columns]
+    return pd.DataFrame(rows, columns=param_columns + metric_columns)
+
+def _stop_loss(value):
+    return None if value.lower() == 'none' else float(value)
+
+def add_grid_arguments(parser):
+    """The market, parameter grid and worker options shared by sweep.py and walk_forward.py."""
+    parser.add_argument('--tickers', nargs='+', default=config.TICKERS)
+    parser.add_argument('--interval', default=config.INTERVAL)
+    parser.add_argument('--start', default=config.START_DATE)
+    parser.add_argument('--end', default=config.END_DATE)
+    parser.add_argument('--benchmark', default=config.BENCHMARK_TICKER)
+    parser.add_argument('--strategy', nargs='+', default=[config.STRATEGY_TYPE], choices=list(STRATEGIES))
+    parser.add_argument('--short-window', nargs='+', type=int, default=[config.SHORT_WINDOW])
+    parser.add_argument('--long-window', nargs='+', type=int, default=[config.LONG_WINDOW])
+    parser.add_argument('--lookback-period', nargs='+', type=int, default=[config.LOOKBACK_PERIOD])
+    parser.add_argument('--commission', nargs='+', type=float, default=[config.COMMISSION])
+    parser.add_argument('--slippage', nargs='+', type=float, default=[config.SLIPPAGE])
+    parser.add_argument('--stop-loss', nargs='+', type=_stop_loss, default=[config.STOP_LOSS_PERCENTAGE],
+                        help="Stop-loss fractions, or 'none'")
+    parser.add_argument('--cash', type=float, default=config.INITIAL_CASH)
+    parser.add_argument('--engine', default='auto', choices=['auto', 'loop', 'vectorized'])
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--offline', action='store_true', help="Only use cached or local CSV data")
+    parser.add_argument('--data-source', default=config.DATA_SOURCE, choices=list(DATA_SOURCES),
+                        help="'synthetic' generates deterministic bars instead of downloading")
+
+def market_and_grid(args):
+    """Loads the Market and builds the parameter grid from the options of `add_grid_arguments`."""
+    if args.offline:
+        config.OFFLINE = True
+    config.DATA_SOURCE = args.data_source
+    market = Market(args.tickers, args.interval, args.start, args.end, benchmark_ticker=args.benchmark)
+    grid = {
+        'strategy_type': args.strategy,
+        'short_window': args.short_window,
+        'long_window': args.long_window,
+        'lookback_period': args.lookback_period,
+        'commission': args.commission,
+        'slippage': args.slippage,
+        'stop_loss_percentage': args.stop_loss,
+    }
+    return market, grid
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Simulator over a grid of parameters in parallel.")
+    add_grid_arguments(parser)
+    parser.add_argument('--output', help="Write the results table to this CSV file")
+    args = parser.parse_args(argv)
+
+    market, grid = market_and_grid(args)
+    results = run_sweep(market, grid, max_workers=args.workers, engine=args.engine, initial_cash=args.cash)
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Results saved to {args.output}")
+    with pd.option_context('display.max_rows', 50, 'display.width', 200):
+        print(results.sort_values('sharpe_ratio', ascending=False).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
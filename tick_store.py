@@ -0,0 +1,159 @@
+# Sim/tick_store.py
+#
+# On-disk bars that Market can memory-map instead of loading. A store is a directory for
+# one interval:
+#   meta.json   symbols, fields, interval, number of ticks, date unit and timezone
+#   dates.bin   sorted int64 timestamps in the meta's unit (UTC for tz-aware dates)
+#   values.bin  float64 bars, time-major: (tick, symbol, field)
+# Both binary files are fixed-width and headerless, so they are appended to chunk by chunk
+# while writing and opened with np.memmap for reading: nothing is read until it is used,
+# and every process opening the same store shares one copy in the page cache.
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+import config
+
+META_FILE = 'meta.json'
+DATES_FILE = 'dates.bin'
+VALUES_FILE = 'values.bin'
+FORMAT_VERSION = 1
+
+class TickStore:
+    """A read-only, memory-mapped tick store (see the module comment for the layout)."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported tick store version in {path}: {meta.get('version')}")
+        self.symbols = meta['symbols']
+        self.fields = tuple(meta['fields'])
+        self.interval = meta['interval']
+        self.num_ticks = meta['num_ticks']
+        self.unit = meta['unit']
+        self.tz = meta['tz']
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        shape = (self.num_ticks, len(self.symbols), len(self.fields))
+        if self.num_ticks:
+            self._dates = np.memmap(os.path.join(path, DATES_FILE), dtype=np.int64, mode='r', shape=(self.num_ticks,))
+            self._values = np.memmap(os.path.join(path, VALUES_FILE), dtype=np.float64, mode='r', shape=shape)
+        else:
+            self._dates = np.empty(0, dtype=np.int64)
+            self._values = np.empty(shape)
+
+    def __contains__(self, symbol):
+        return symbol in self._symbol_ids
+
+    def tick_range(self, start_date=None, end_date=None):
+        """(first, stop) ticks of [start_date, end_date), by binary search on the date file."""
+        first = 0 if start_date is None else int(np.searchsorted(self._dates, self._date_key(start_date), side='left'))
+        stop = self.num_ticks if end_date is None else int(np.searchsorted(self._dates, self._date_key(end_date), side='left'))
+        return first, max(first, stop)
+
+    def dates(self, first=0, stop=None):
+        dates = pd.DatetimeIndex(np.asarray(self._dates[first:stop]).view(f'datetime64[{self.unit}]'), name='Date')
+        return dates.tz_localize('UTC').tz_convert(self.tz) if self.tz is not None else dates
+
+    def read(self, tickers=None, start_date=None, end_date=None):
+        """
+        Returns (symbols, dates, values) like DataSource.load_arrays for the stored `tickers`
+        (all if None) in [start_date, end_date). `values` is a (ticker x time x field) view of
+        the mapped file when the tickers are stored next to each other, otherwise a copy of
+        just those tickers over the date range.
+        """
+        first, stop = self.tick_range(start_date, end_date)
+        values = self._values[first:stop].transpose(1, 0, 2)
+        symbols = self.symbols
+        if tickers is not None:
+            ids = [self._symbol_ids[ticker] for ticker in tickers if ticker in self._symbol_ids]
+            symbols = [self.symbols[i] for i in ids]
+            if ids and ids == list(range(ids[0], ids[0] + len(ids))):
+                values = values[ids[0]:ids[0] + len(ids)]
+            else:
+                values = values[ids]
+        return symbols, self.dates(first, stop), values
+
+    def _date_key(self, date):
+        # A date as the stored integer: in the store's timezone if it has one, else naive
+        timestamp = pd.Timestamp(date)
+        if self.tz is not None:
+            timestamp = timestamp.tz_localize(self.tz) if timestamp.tz is None else timestamp
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        elif timestamp.tz is not None:
+            timestamp = timestamp.tz_localize(None)
+        return timestamp.to_datetime64().astype(f'datetime64[{self.unit}]').astype(np.int64)
+
+    @staticmethod
+    def write(path, interval, chunks, fields):
+        """
+        Writes a store from `chunks` of (symbols, dates, values) in date order, as yielded by
+        DataSource.iter_chunks, holding one chunk in memory at a time. Returns the TickStore.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path) # A store without its meta can't be opened half-written
+        symbols = None
+        unit = tz = None
+        num_ticks = 0
+        last = None
+        with open(os.path.join(path, DATES_FILE), 'wb') as dates_file, open(os.path.join(path, VALUES_FILE), 'wb') as values_file:
+            for chunk_symbols, dates, values in chunks:
+                if symbols is None:
+                    symbols = list(chunk_symbols)
+                    unit = np.datetime_data(dates.values.dtype)[0]
+                    tz = str(dates.tz) if dates.tz is not None else None
+                elif list(chunk_symbols) != symbols:
+                    raise ValueError("Every chunk must have the same symbols")
+                keys = dates.values.astype(f'datetime64[{unit}]').astype(np.int64)
+                if len(keys) and ((last is not None and keys[0] <= last) or np.any(np.diff(keys) <= 0)):
+                    raise ValueError("Tick store dates must be strictly increasing")
+                if len(keys):
+                    last = keys[-1]
+                keys.tofile(dates_file)
+                np.ascontiguousarray(np.asarray(values, dtype=np.float64).transpose(1, 0, 2)).tofile(values_file)
+                num_ticks += len(keys)
+
+        meta = {
+            'version': FORMAT_VERSION,
+            'symbols': symbols or [],
+            'fields': list(fields),
+            'interval': interval,
+            'num_ticks': num_ticks,
+            'unit': unit or 'ns',
+            'tz': tz,
+        }
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+        return TickStore(path)
+
+def store_path(interval, root=None):
+    """Directory of the store for `interval` under `root` (default config.TICK_STORE_DIR)."""
+    return os.path.join(root or config.TICK_STORE_DIR, interval)
+
+def main(argv=None):
+    from data_sources import DATA_SOURCES, FIELDS, create_data_source
+
+    parser = argparse.ArgumentParser(description="Write bars from a data source into a memory-mapped tick store.")
+    parser.add_argument('--tickers', nargs='+', default=config.TICKERS)
+    parser.add_argument('--interval', default=config.INTERVAL)
+    parser.add_argument('--start', default=config.START_DATE)
+    parser.add_argument('--end', default=config.END_DATE)
+    parser.add_argument('--data-source', default=config.DATA_SOURCE, choices=[name for name in DATA_SOURCES if name != 'store'])
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="Ticks held in memory at a time")
+    parser.add_argument('--path', default=None, help="Store root (default config.TICK_STORE_DIR)")
+    args = parser.parse_args(argv)
+
+    data_source = create_data_source(args.data_source)
+    path = store_path(args.interval, args.path)
+    chunks = data_source.iter_chunks(args.tickers, args.interval, args.start, args.end, chunk_size=args.chunk_size)
+    store = TickStore.write(path, args.interval, chunks, FIELDS)
+    print(f"Wrote {store.num_ticks} ticks of {len(store.symbols)} tickers to {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+# Sim/trade_ledger.py
+
+import numpy as np
+import pandas as pd
+
+BUY = 1
+SELL = -1
+
+# (column, dtype) of the numeric columns, in export order
+NUMERIC_COLUMNS = (
+    ('quantity', np.int64),
+    ('price', np.float64), # Requested price
+    ('adjusted_price', np.float64), # Price after slippage
+    ('value', np.float64), # Before commission: the buy cost or the sell proceeds
+    ('commission_amount', np.float64),
+    ('net_value', np.float64), # Total cost of a buy, total proceeds of a sell
+    ('cash_after_trade', np.float64),
+)
+NAT = np.datetime64('NaT')
+FLUSH_SIZE = 256 # Rows buffered before they are written to the columns
+
+class TradeLedger:
+    """
+    Append-only record of executed trades, stored as growable typed columns: one symbol id,
+    side, date and seven numbers per trade instead of a dict of ten keys.
+
+    It still behaves like the list of trade dicts it replaces: len(), iteration and
+    ledger[i] build the same dicts on demand ({'type': 'buy', 'symbol': ..., 'total_cost': ...}).
+    Bulk consumers should use the column views (`ledger.price`, `ledger.side`, ...),
+    `symbol_indices` or `to_frame`, which don't build per-trade objects.
+    """
+    def __init__(self, capacity=1024):
+        self._capacity = max(1, capacity)
+        self._size = 0 # Rows written to the columns
+        self._pending = [] # Rows appended since, written in one batch by _flush
+        self._symbols = [] # Symbol of each id
+        self._symbol_ids = {}
+        self._by_symbol = [] # Per symbol id: [array of trade indices, count]
+        self._tz = None
+        self._dated = False
+        self._symbol_id = np.empty(self._capacity, dtype=np.int32)
+        self._side = np.empty(self._capacity, dtype=np.int8)
+        self._date = np.empty(self._capacity, dtype='datetime64[ns]') # UTC; NaT if unknown
+        self._numeric = {name: np.empty(self._capacity, dtype=dtype) for name, dtype in NUMERIC_COLUMNS}
+
+    def append(self, side, symbol, quantity, price, adjusted_price, value, commission_amount, net_value, cash_after_trade, date=None):
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._add_symbol(symbol)
+        if date.__class__ is pd.Timestamp and self._dated:
+            date = date.asm8
+        else:
+            date = self._date_value(date)
+        self._pending.append((symbol_id, side, date, quantity, price, adjusted_price, value,
+                              commission_amount, net_value, cash_after_trade))
+        if len(self._pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Writes the pending rows into the columns (a few array assignments per batch, not per trade)."""
+        pending = self._pending
+        if not pending:
+            return
+        start = self._size
+        end = start + len(pending)
+        while end > self._capacity:
+            self._grow()
+        columns = list(zip(*pending))
+        symbol_ids = np.array(columns[0], dtype=np.int32)
+        self._symbol_id[start:end] = symbol_ids
+        self._side[start:end] = columns[1]
+        self._date[start:end] = np.array(columns[2], dtype=self._date.dtype)
+        for (name, _), values in zip(NUMERIC_COLUMNS, columns[3:]):
+            self._numeric[name][start:end] = values
+        self._pending = []
+        self._size = end
+
+        # Per-symbol indices of the new rows, in order
+        rows = np.arange(start, end)
+        for symbol_id in np.unique(symbol_ids):
+            new = rows[symbol_ids == symbol_id]
+            index = self._by_symbol[symbol_id]
+            if index[1] + len(new) > len(index[0]):
+                index[0] = _resized(index[0], max(2 * len(index[0]), index[1] + len(new)))
+            index[0][index[1]:index[1] + len(new)] = new
+            index[1] += len(new)
+
+    def clear(self):
+        self.__init__()
+
+    def __getstate__(self):
+        # Pickle only the rows written so far, not the spare capacity; appends grow it back
+        self._flush()
+        size = self._size
+        state = self.__dict__.copy()
+        state['_capacity'] = max(1, size)
+        state['_symbol_id'] = self._symbol_id[:state['_capacity']]
+        state['_side'] = self._side[:state['_capacity']]
+        state['_date'] = self._date[:state['_capacity']]
+        state['_numeric'] = {name: column[:state['_capacity']] for name, column in self._numeric.items()}
+        state['_by_symbol'] = [[indices[:count], count] for indices, count in self._by_symbol]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _grow(self):
+        self._capacity *= 2
+        self._symbol_id = _resized(self._symbol_id, self._capacity)
+        self._side = _resized(self._side, self._capacity)
+        self._date = _resized(self._date, self._capacity)
+        self._numeric = {name: _resized(column, self._capacity) for name, column in self._numeric.items()}
+
+    def _add_symbol(self, symbol):
+        symbol_id = len(self._symbols)
+        self._symbols.append(symbol)
+        self._symbol_ids[symbol] = symbol_id
+        self._by_symbol.append([np.empty(16, dtype=np.int64), 0])
+        return symbol_id
+
+    def _date_value(self, date):
+        if date is None:
+            return NAT
+        if not isinstance(date, pd.Timestamp):
+            date = pd.Timestamp(date)
+            if date is pd.NaT:
+                return NAT
+        if not self._dated:
+            # Store in the unit of the market's dates, which may reach past the nanosecond range
+            self._date = self._date.astype(f'datetime64[{date.unit}]')
+            self._tz = date.tz
+            self._dated = True
+        return date.asm8
+
+    # --- Column views (no copies; valid until the columns next grow) ---
+
+    def __len__(self):
+        return self._size + len(self._pending)
+
+    @property
+    def symbols(self):
+        """Symbols in order of first trade; `symbol_id` indexes into this list."""
+        return list(self._symbols)
+
+    @property
+    def symbol_id(self):
+        self._flush()
+        return self._symbol_id[:self._size]
+
+    @property
+    def side(self):
+        """BUY (1) or SELL (-1) per trade."""
+        self._flush()
+        return self._side[:self._size]
+
+    @property
+    def dates(self):
+        self._flush()
+        return self._to_dates(self._date[:self._size])
+
+    def dates_at(self, indices):
+        """Dates of the trades at `indices`, converting only those rows."""
+        self._flush()
+        return self._to_dates(self._date[indices])
+
+    def _to_dates(self, values):
+        dates = pd.DatetimeIndex(values)
+        return dates.tz_localize('UTC').tz_convert(self._tz) if self._tz is not None else dates
+
+    def column(self, name):
+        self._flush()
+        return self._numeric[name][:self._size]
+
+    def __getattr__(self, name):
+        # ledger.price, ledger.quantity, ... for the numeric columns
+        numeric = self.__dict__.get('_numeric')
+        if numeric is not None and name in numeric:
+            return self.column(name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def symbol_indices(self, symbol):
+        """Indices of `symbol`'s trades, in order, from an index kept as trades are appended."""
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            return np.empty(0, dtype=np.int64)
+        self._flush()
+        indices, count = self._by_symbol[symbol_id]
+        return indices[:count]
+
+    def to_numpy(self):
+        """A structured view of all columns as {name: array}, without copying."""
+        self._flush()
+        columns = {'symbol_id': self.symbol_id, 'side': self.side, 'date': self._date[:self._size]}
+        columns.update((name, self.column(name)) for name, _ in NUMERIC_COLUMNS)
+        return columns
+
+    def to_frame(self):
+        """The trades as a DataFrame over the ledger's arrays (symbol and type are categoricals)."""
+        self._flush()
+        size = self._size
+        data = {
+            'date': self.dates,
+            'symbol': pd.Categorical.from_codes(self._symbol_id[:size], categories=self._symbols),
+            'type': pd.Categorical.from_codes((self._side[:size] < 0).view(np.int8), categories=['buy', 'sell']),
+        }
+        data.update((name, self.column(name)) for name, _ in NUMERIC_COLUMNS)
+        return pd.DataFrame(data, copy=False)
+
+    # --- List-of-dicts compatibility ---
+
+    def __getitem__(self, index):
+        self._flush()
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("trade index out of range")
+        return self._record(index)
+
+    def __iter__(self):
+        self._flush()
+        for i in range(self._size):
+            yield self._record(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (TradeLedger, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TradeLedger({len(self)} trades, {len(self._symbols)} symbols)"
+
+    def _record(self, i):
+        numeric = self._numeric
+        buy = self._side[i] > 0
+        date = self._date[i]
+        if np.isnat(date):
+            date = None
+        else:
+            date = pd.Timestamp(date, tz='UTC').tz_convert(self._tz) if self._tz is not None else pd.Timestamp(date)
+        return {
+            'type': 'buy' if buy else 'sell',
+            'symbol': self._symbols[self._symbol_id[i]],
+            'quantity': int(numeric['quantity'][i]),
+            'price': float(numeric['price'][i]),
+            'adjusted_price': float(numeric['adjusted_price'][i]),
+            'cost_before_commission' if buy else 'proceeds_before_commission': float(numeric['value'][i]),
+            'commission_amount': float(numeric['commission_amount'][i]),
+            'total_cost' if buy else 'total_proceeds': float(numeric['net_value'][i]),
+            'cash_after_trade': float(numeric['cash_after_trade'][i]),
+            'date': date,
+        }
+
+def _resized(array, capacity):
+    resized = np.empty(capacity, dtype=array.dtype)
+    resized[:len(array)] = array
+    return resized
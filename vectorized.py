@@ -0,0 +1,155 @@
+# Sim/vectorized.py
+
+import contextlib
+import copy
+import heapq
+import io
+import numpy as np
+
+# Event phases within a tick, in the order Simulator.step handles them
+STOP_LOSS = 0
+SIGNAL = 1
+
+def run_vectorized(simulator, signals=None):
+    """
+    Runs a whole backtest without stepping tick by tick.
+
+    The strategy's entry/exit conditions are computed for the full history with array
+    operations. Only the ticks where a trade can happen are visited in Python, and they
+    go through the simulator's own Portfolio, so commission, slippage, stop-loss and the
+    recorded trades are exactly those of the event loop. Positions and cash between
+    trades are then expanded with cumulative operations to build `portfolio_history`.
+    `signals` are precomputed (entries, exits) arrays for the market's ticks, used
+    instead of the strategy's `vectorized_signals` (see walk_forward.py).
+    """
+    market = simulator.market
+    portfolio = simulator.portfolio
+    strategy = simulator.strategy
+    if market.current_tick != 0 or portfolio.positions or portfolio.trades:
+        raise ValueError("The vectorized engine must start from a fresh simulator")
+
+    close = market.close
+    num_symbols, num_ticks = close.shape
+    entries, exits = signals if signals is not None else strategy.vectorized_signals(close, market)
+    next_entry = _next_true(entries)
+    next_exit = _next_true(exits)
+
+    cash_changes = np.zeros(num_ticks)
+    quantity_changes = np.zeros((num_symbols, num_ticks + 1))
+    invested = [False] * num_symbols
+    position_order = 0 # Insertion order of portfolio.positions, which orders stop-loss checks
+
+    # Heap of (tick, phase, order within phase, symbol index)
+    events = []
+    for i in range(num_symbols):
+        _schedule(events, num_ticks, next_entry[i, 0], SIGNAL, i, i)
+
+    while events:
+        tick, phase, _, i = heapq.heappop(events)
+        symbol = market.symbols[i]
+        price = close[i, tick]
+        cash_before = portfolio.cash
+
+        if phase == STOP_LOSS:
+            quantity = portfolio.positions[symbol]
+            portfolio.check_stop_loss(symbol, price, date=market.dates[tick])
+            quantity_changes[i, tick + 1] -= quantity
+            # The strategy still believes it is invested but holds nothing, so like the
+            # event loop it never trades this symbol again.
+        elif not invested[i]:
+            quantity = int(portfolio.cash * strategy.allocation // price)
+            if quantity > 0 and portfolio.buy(symbol, quantity, price, date=market.dates[tick]):
+                invested[i] = True
+                quantity_changes[i, tick + 1] += quantity
+                position_order += 1
+                _schedule_exit(events, close, next_exit, portfolio.stop_loss_prices.get(symbol), i, tick, position_order)
+            else:
+                _schedule(events, num_ticks, next_entry[i, tick + 1], SIGNAL, i, i)
+        else:
+            quantity = portfolio.positions[symbol]
+            if portfolio.sell(symbol, quantity, price, date=market.dates[tick]):
+                invested[i] = False
+                quantity_changes[i, tick + 1] -= quantity
+                _schedule(events, num_ticks, next_entry[i, tick + 1], SIGNAL, i, i)
+
+        cash_changes[tick] += portfolio.cash - cash_before
+
+    # Positions and cash at the end of each tick
+    positions = np.cumsum(quantity_changes[:, 1:], axis=1)
+    cash = portfolio.initial_cash + np.cumsum(cash_changes)
+
+    # Simulator.step values the previous tick's holdings at the new tick's close
+    history = np.empty(num_ticks)
+    if num_ticks:
+        history[0] = portfolio.initial_cash
+        held = positions[:, :-1] != 0
+        holdings = np.where(held, positions[:, :-1] * close[:, 1:], 0.0).sum(axis=0)
+        history[1:] = cash[:-1] + holdings
+    simulator.portfolio_history = history.tolist()
+
+    market.current_tick = num_ticks
+    if hasattr(strategy, 'invested'):
+        strategy.invested[:] = invested # Bound to the market's symbols by the Simulator
+
+def compare_with_loop(simulator, rtol=1e-9):
+    """
+    Runs a copy of a fresh simulator through the event loop and the original through the
+    vectorized engine, and returns a list of differences (empty when they match).
+    """
+    loop_simulator = copy.deepcopy(simulator)
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop_simulator.run_simulation()
+        run_vectorized(simulator)
+
+    differences = []
+    loop_history = np.asarray(loop_simulator.portfolio_history, dtype=float)
+    vectorized_history = np.asarray(simulator.portfolio_history, dtype=float)
+    if loop_history.shape != vectorized_history.shape:
+        differences.append(f"portfolio_history length {len(loop_history)} != {len(vectorized_history)}")
+    elif not np.allclose(loop_history, vectorized_history, rtol=rtol, atol=0, equal_nan=True):
+        tick = int(np.argmax(~np.isclose(loop_history, vectorized_history, rtol=rtol, atol=0, equal_nan=True)))
+        differences.append(f"portfolio_history differs from tick {tick}: {loop_history[tick]} != {vectorized_history[tick]}")
+
+    loop_trades = loop_simulator.portfolio.trades
+    vectorized_trades = simulator.portfolio.trades
+    if len(loop_trades) != len(vectorized_trades):
+        differences.append(f"{len(loop_trades)} trades in the event loop, {len(vectorized_trades)} vectorized")
+    else:
+        # Column by column over the ledgers; symbol ids may differ, so compare the symbols
+        expected, actual = loop_trades.to_numpy(), vectorized_trades.to_numpy()
+        expected['symbol_id'] = np.array(loop_trades.symbols, dtype=object)[expected['symbol_id']]
+        actual['symbol_id'] = np.array(vectorized_trades.symbols, dtype=object)[actual['symbol_id']]
+        mismatch = np.zeros(len(loop_trades), dtype=bool)
+        for name in expected:
+            mismatch |= expected[name] != actual[name]
+        if mismatch.any():
+            n = int(np.argmax(mismatch))
+            differences.append(f"trade {n} differs: {loop_trades[n]} != {vectorized_trades[n]}")
+    return differences
+
+def _next_true(mask):
+    """
+    For each row, the index of the first True at or after each position; the row length
+    (one past the last tick) where there is none. Has one extra column for lookups at the end.
+    """
+    num_rows, num_ticks = mask.shape
+    positions = np.where(mask, np.arange(num_ticks), num_ticks)
+    next_index = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1]
+    return np.concatenate([next_index, np.full((num_rows, 1), num_ticks)], axis=1)
+
+def _schedule(events, num_ticks, tick, phase, order, i):
+    if tick < num_ticks:
+        heapq.heappush(events, (int(tick), phase, order, i))
+
+def _schedule_exit(events, close, next_exit, stop_price, i, entry_tick, position_order):
+    """Schedules whichever comes first after an entry: the exit signal or the stop-loss."""
+    num_ticks = close.shape[1]
+    exit_tick = next_exit[i, entry_tick + 1]
+    if stop_price is not None:
+        last_tick = min(exit_tick, num_ticks - 1)
+        hits = np.flatnonzero(close[i, entry_tick + 1:last_tick + 1] <= stop_price)
+        if len(hits):
+            # Stop-losses are checked before the strategy runs on the same tick
+            _schedule(events, num_ticks, entry_tick + 1 + hits[0], STOP_LOSS, position_order, i)
+            return
+    _schedule(events, num_ticks, exit_tick, SIGNAL, i, i)
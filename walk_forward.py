@@ -0,0 +1,210 @@
+# Sim/walk_forward.py
+#
+# Walk-forward optimization: the market's ticks are split into rolling folds, the parameter
+# grid is optimized on each fold's train window, and the winner is run on the test window
+# that follows it. The test runs are stitched into one out-of-sample equity curve.
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+import config
+from Analysis import Analysis
+from Market import Market
+from Strategy import STRATEGIES, Strategy, create_strategy, strategy_param_names
+from sweep import SharedMarketData, add_grid_arguments, attach_market_values, expand_grid, market_and_grid, run_combination
+
+TEST_METRICS = ('total_return', 'sharpe_ratio', 'max_drawdown', 'final_value', 'num_trades')
+
+def walk_forward_folds(num_ticks, train_ticks, test_ticks, anchored=False):
+    """
+    (train_start, train_end, test_start, test_end) ticks of each fold. A fold trains on
+    `train_ticks` ticks (all ticks since the start if `anchored`) and tests on the next
+    `test_ticks`; the folds move forward by `test_ticks`, so the test windows tile the range
+    after the first train window. The last test window may be shorter.
+    """
+    if train_ticks < 2 or test_ticks < 2:
+        raise ValueError("Train and test windows need at least 2 ticks")
+    folds = []
+    test_start = train_ticks
+    while test_start < num_ticks:
+        train_start = 0 if anchored else test_start - train_ticks
+        test_end = min(test_start + test_ticks, num_ticks)
+        folds.append((train_start, test_start, test_start, test_end))
+        test_start = test_end
+    return folds
+
+def _signal_key(params):
+    strategy_type = params['strategy_type']
+    return (strategy_type,) + tuple((name, params[name]) for name in strategy_param_names(strategy_type) if name in params)
+
+def _supports_vectorized(strategy_type):
+    return STRATEGIES[strategy_type].vectorized_signals is not Strategy.vectorized_signals
+
+def precompute_signals(market, combinations, engine="auto"):
+    """
+    The (entries, exits) of every distinct strategy parameter set in `combinations`, for the
+    market's whole range, stacked into one (sets x 2 x ticker x time) bool array, and the
+    index of each combination's set (-1 where the event loop has to run instead). Folds
+    slice these arrays, so the indicators are computed once rather than once per fold, and
+    each window starts with indicators warmed up on the ticks before it. Commission,
+    slippage and stop-loss don't change the signals, so combinations differing only in
+    those share a set.
+    """
+    keys = {}
+    indices = []
+    for params in combinations:
+        if engine == "loop" or not _supports_vectorized(params['strategy_type']):
+            indices.append(-1)
+            continue
+        indices.append(keys.setdefault(_signal_key(params), len(keys)))
+
+    signals = np.zeros((len(keys), 2) + market.close.shape, dtype=bool)
+    for key, n in keys.items():
+        strategy = create_strategy(key[0], None, market.symbols, **dict(key[1:]))
+        signals[n, 0], signals[n, 1] = strategy.vectorized_signals(market.close, market)
+    return signals, indices
+
+def _run_fold(fold, context):
+    """Optimizes the grid on the fold's train window and runs the best parameters on its test window."""
+    train_start, train_end, test_start, test_end = fold
+    objective = context['objective']
+    best, best_score = None, -np.inf
+    for n, params in enumerate(context['combinations']):
+        row = run_combination(_view(context, train_start, train_end), params, context['engine'], context['initial_cash'],
+                              signals=_slice_signals(context, n, train_start, train_end))
+        score = row[objective]
+        if score != score:
+            score = -np.inf # A NaN metric (e.g. no trades) never wins
+        if best is None or score > best_score:
+            best, best_score = n, score
+
+    params = context['combinations'][best]
+    history = []
+    row = run_combination(_view(context, test_start, test_end), params, context['engine'], context['initial_cash'],
+                          signals=_slice_signals(context, best, test_start, test_end), history=history)
+    dates = context['dates']
+    result = {'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+              'test_start': dates[test_start], 'test_end': dates[test_end - 1],
+              **params, f'train_{objective}': best_score}
+    result.update({f'test_{name}': row[name] for name in TEST_METRICS})
+    return result, history
+
+def _view(context, start, end):
+    # A Market over ticks [start, end) without copying the arrays
+    return Market.from_arrays(context['symbols'], context['dates'][start:end], context['values'][:, start:end],
+                              context['interval'], benchmark_data=context['benchmark_data'])
+
+def _slice_signals(context, n, start, end):
+    index = context['signal_indices'][n]
+    if index < 0:
+        return None
+    signals = context['signals'][index]
+    return signals[0, :, start:end], signals[1, :, start:end]
+
+_worker = {}
+
+def _init_worker(spec, signals_spec, settings):
+    shm, values = attach_market_values(spec)
+    signals_shm = shared_memory.SharedMemory(name=signals_spec['name'])
+    signals = np.ndarray(signals_spec['shape'], dtype=bool, buffer=signals_shm.buf)
+    _worker.update(shm=shm, signals_shm=signals_shm,
+                   context={**settings, 'symbols': spec['symbols'], 'dates': spec['dates'], 'interval': spec['interval'],
+                            'benchmark_data': spec['benchmark_data'], 'values': values, 'signals': signals})
+
+def _run_fold_in_worker(fold):
+    return _run_fold(fold, _worker['context'])
+
+def run_walk_forward(market, grid, train_ticks, test_ticks, anchored=False, objective='sharpe_ratio', max_workers=None,
+                     engine="auto", initial_cash=config.INITIAL_CASH):
+    """
+    Walk-forward optimization of `grid` (see sweep.expand_grid) on `market`, maximizing the
+    Analysis metric `objective` on each train window. The folds run in parallel on a process
+    pool that shares the market array and the precomputed signals.
+
+    Returns (folds, equity, analysis): a DataFrame with each fold's windows, chosen
+    parameters and test metrics; the out-of-sample equity curve by date, with each test
+    run starting from `initial_cash` and scaled to continue where the previous one ended
+    (positions are closed, without costs, at the fold boundaries); and the Analysis of
+    that curve against the benchmark.
+    """
+    combinations = expand_grid(grid)
+    if not combinations:
+        raise ValueError("The parameter grid is empty")
+    folds = walk_forward_folds(market.num_ticks, train_ticks, test_ticks, anchored)
+    if not folds:
+        raise ValueError(f"{market.num_ticks} ticks leave no test window after {train_ticks} train ticks")
+    signals, signal_indices = precompute_signals(market, combinations, engine)
+    settings = {'combinations': combinations, 'signal_indices': signal_indices, 'objective': objective,
+                'engine': engine, 'initial_cash': initial_cash}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(folds))
+    if max_workers == 1:
+        context = {**settings, 'symbols': market.symbols, 'dates': market.dates, 'interval': market.interval,
+                   'benchmark_data': market.benchmark_data, 'values': market.values, 'signals': signals}
+        results = [_run_fold(fold, context) for fold in folds]
+    else:
+        signals_shm = shared_memory.SharedMemory(create=True, size=max(signals.nbytes, 1))
+        try:
+            np.ndarray(signals.shape, dtype=bool, buffer=signals_shm.buf)[...] = signals
+            signals_spec = {'name': signals_shm.name, 'shape': signals.shape}
+            with SharedMarketData(market) as shared:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                         initargs=(shared.spec, signals_spec, settings)) as executor:
+                    results = list(executor.map(_run_fold_in_worker, folds))
+        finally:
+            signals_shm.close()
+            signals_shm.unlink()
+
+    rows = []
+    equity = []
+    for row, history in results:
+        rows.append({'fold': len(rows), **row})
+        scale = equity[-1] / history[0] if equity else 1.0
+        equity.extend(value * scale for value in history)
+    # Every parameter of the grid gets a column, whichever strategies won
+    param_columns = list(dict.fromkeys(name for params in combinations for name in params))
+    columns = ['fold', 'train_start', 'train_end', 'test_start', 'test_end'] + param_columns + \
+              [f'train_{objective}'] + [f'test_{name}' for name in TEST_METRICS]
+    dates = market.dates[folds[0][2]:folds[-1][3]]
+    equity = pd.Series(equity, index=dates, name='portfolio_value')
+
+    benchmark_history = None
+    if market.benchmark_data is not None:
+        benchmark_history = market.benchmark_data.reindex(dates, method='ffill').dropna().tolist() or None
+    analysis = Analysis(equity.to_numpy(), benchmark_history=benchmark_history)
+    return pd.DataFrame(rows, columns=columns), equity, analysis
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward optimization: optimize on rolling train windows, "
+                                                 "evaluate out of sample on the test window after each.")
+    add_grid_arguments(parser)
+    parser.add_argument('--train', type=int, required=True, help="Ticks per train window")
+    parser.add_argument('--test', type=int, required=True, help="Ticks per test window")
+    parser.add_argument('--anchored', action='store_true', help="Train on all ticks since the start instead of a rolling window")
+    parser.add_argument('--objective', default='sharpe_ratio',
+                        choices=['total_return', 'cagr', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown', 'calmar_ratio'],
+                        help="Analysis metric maximized on the train windows")
+    parser.add_argument('--output', help="Write the folds table to this CSV file")
+    parser.add_argument('--equity-output', help="Write the stitched out-of-sample equity curve to this CSV file")
+    args = parser.parse_args(argv)
+
+    market, grid = market_and_grid(args)
+    folds, equity, analysis = run_walk_forward(market, grid, args.train, args.test, anchored=args.anchored,
+                                               objective=args.objective, max_workers=args.workers,
+                                               engine=args.engine, initial_cash=args.cash)
+    if args.output:
+        folds.to_csv(args.output, index=False)
+        print(f"Folds saved to {args.output}")
+    if args.equity_output:
+        equity.to_csv(args.equity_output)
+        print(f"Equity curve saved to {args.equity_output}")
+    with pd.option_context('display.max_rows', 100, 'display.width', 200):
+        print(folds.to_string(index=False))
+    analysis.print_report()
+
+if __name__ == '__main__':
+    main()